@@ -0,0 +1,431 @@
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+import tyro
+
+# share_ips and its modules import each other as top-level modules, as when it is run
+# from vibepilot/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibepilot"))
+
+BENCHMARKS = [
+    "launch_template",
+    "preemption_scan",
+    "preemption_timeline",
+    "replay_json",
+    "replay_html",
+    "replay_walk",
+    "dashboard",
+    "dashboard_diff",
+]
+
+
+@dataclasses.dataclass(kw_only=True)
+class BenchmarkRequest:
+    """Time the launcher, preemption scan and share_ips hot paths offline, against stubbed
+    AWS responses, and compare the timings with a saved baseline.
+
+    Run and save a baseline:  python benchmark_hot_paths.py --output baseline.json
+    Compare a new run with it: python benchmark_hot_paths.py --compare baseline.json
+    Compare two saved runs:    python benchmark_hot_paths.py --compare a.json --against b.json"""
+
+    benchmarks: list[str] = dataclasses.field(default_factory=lambda: list(BENCHMARKS))
+    """Benchmarks to run."""
+
+    repeat: int = 5
+    """Timed runs per benchmark, after one warm-up run."""
+
+    instance_types: int = 40
+    """Instance types of the launch template benchmark."""
+
+    user_data_kb: int = 512
+    """Size of the launch template benchmark's user data, in KiB. Over EC2's limit it is
+    staged to a temporary directory, as with --user-data-stage."""
+
+    fleets: int = 20
+    """Fleets of the preemption scan and timeline benchmarks."""
+
+    events_per_fleet: int = 2000
+    """History records of every fleet; every other one launches an instance."""
+
+    replay_entries: int = 100_000
+    """Registry entries of the replay benchmarks."""
+
+    dashboard_instances: int = 5000
+    """Running instances (and as many spot requests) of the dashboard benchmarks."""
+
+    output: Optional[str] = None
+    """If supplied, write the results as JSON to this path."""
+
+    compare: Optional[str] = None
+    """Baseline JSON to compare the results with."""
+
+    against: Optional[str] = None
+    """Saved results to compare with --compare, instead of running the benchmarks."""
+
+    tolerance: float = 0.1
+    """Fractional slowdown of a median over the baseline reported as a regression; the
+    exit code is 1 if there is any."""
+
+    seed: int = 0
+
+
+def time_runs(run: Callable[[], object], repeat: int) -> dict:
+    """Time `repeat` calls of `run` after one warm-up call."""
+    run()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min_s": min(durations),
+        "median_s": statistics.median(durations),
+        "mean_s": statistics.fmean(durations),
+        "max_s": max(durations),
+    }
+
+
+def launch_template_benchmark(args: BenchmarkRequest, workdir: str) -> Callable:
+    from launch_aws_spot_fleet import AwsSpotInstanceRequest, build_spot_fleet_config
+
+    template_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "default_spot_fleet.json"
+    )
+    with open(template_path, "r") as f:
+        launch_template = json.load(f)
+    request = AwsSpotInstanceRequest(
+        launch_template=template_path,
+        user_data="user_data.sh",
+        instance_name="benchmark",
+        fleet_type="maintain",
+        instance_types=[f"g{i}.xlarge" for i in range(args.instance_types)],
+        terminate_fleet_on_finish_controller="http://controller:7451",
+        track_latency=True,
+        watch_interruptions=True,
+        user_data_stage=os.path.join(workdir, "stage"),
+    )
+    rng = random.Random(args.seed)
+    # Random lines compress about as badly as real scripts with embedded data
+    lines, size = ["#!/bin/bash"], 0
+    while size < args.user_data_kb * 1024:
+        lines.append(f"echo {rng.getrandbits(128):032x} >> /tmp/benchmark")
+        size += len(lines[-1]) + 1
+    user_data = "\n".join(lines) + "\n"
+
+    def run():
+        build_spot_fleet_config(request, launch_template, user_data, job_uuid="benchmark")
+
+    return run
+
+
+LAUNCH_DESCRIPTION = json.dumps(
+    {"instanceType": "g5.xlarge", "availabilityZone": "us-east-1a", "image": "ami-0"}
+)
+
+
+class SyntheticFleetEc2:
+    """Stand-in for the EC2 calls of a preemption scan, with paged synthetic histories."""
+
+    def __init__(self, fleets: int, events_per_fleet: int, seed: int = 0):
+        rng = random.Random(seed)
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        self.histories = {}
+        self.instances = {}
+        self.spot_requests = {}
+        for f in range(fleets):
+            fleet_id = f"sfr-{f:08x}-0000-0000-0000-000000000000"
+            records = []
+            for e in range(events_per_fleet):
+                timestamp = start + datetime.timedelta(seconds=e)
+                if e % 2:
+                    records.append({"EventType": "fleetRequestChange", "Timestamp": timestamp,
+                                    "EventInformation": {"EventSubType": "active"}})
+                    continue
+                instance_id = f"i-{f:06x}{e:011x}"
+                records.append({"EventType": "instanceChange", "Timestamp": timestamp,
+                                "EventInformation": {"EventSubType": "launched",
+                                                     "InstanceId": instance_id,
+                                                     "EventDescription": LAUNCH_DESCRIPTION}})
+                code = rng.choice(["instance-terminated-by-price", "instance-terminated-by-user",
+                                   "fulfilled"])
+                self.instances[instance_id] = {
+                    "InstanceId": instance_id,
+                    "InstanceType": "g5.xlarge",
+                    "State": {"Name": "running" if code == "fulfilled" else "terminated"},
+                    "Placement": {"AvailabilityZone": "us-east-1a"},
+                    "LaunchTime": timestamp,
+                }
+                self.spot_requests[instance_id] = {
+                    "InstanceId": instance_id,
+                    "SpotInstanceRequestId": f"sir-{instance_id[2:]}",
+                    "Status": {"Code": code, "Message": code},
+                }
+            self.histories[fleet_id] = records
+
+    def describe_spot_fleet_request_history(self, SpotFleetRequestId, MaxResults=1000,
+                                            NextToken=None, **kwargs):
+        records = self.histories[SpotFleetRequestId]
+        offset = int(NextToken or 0)
+        response = {"HistoryRecords": records[offset:offset + MaxResults]}
+        if offset + MaxResults < len(records):
+            response["NextToken"] = str(offset + MaxResults)
+        return response
+
+    def describe_spot_fleet_requests(self, SpotFleetRequestIds):
+        return {"SpotFleetRequestConfigs": [
+            {"SpotFleetRequestId": fleet_id, "SpotFleetRequestState": "cancelled"}
+            for fleet_id in SpotFleetRequestIds if fleet_id in self.histories
+        ]}
+
+    def get_paginator(self, operation: str):
+        ec2 = self
+
+        class Paginator:
+            def paginate(self, Filters):
+                instance_ids = Filters[0]["Values"]
+                if operation == "describe_instances":
+                    yield {"Reservations": [{"Instances": [
+                        ec2.instances[i] for i in instance_ids if i in ec2.instances
+                    ]}]}
+                else:
+                    yield {"SpotInstanceRequests": [
+                        ec2.spot_requests[i] for i in instance_ids if i in ec2.spot_requests
+                    ]}
+
+        return Paginator()
+
+
+def preemption_scan_benchmark(args: BenchmarkRequest, workdir: str) -> Callable:
+    from check_preemption import scan_fleets
+
+    ec2 = SyntheticFleetEc2(args.fleets, args.events_per_fleet, args.seed)
+
+    def run():
+        results = scan_fleets(list(ec2.histories), ec2_client=ec2)
+        assert not any("error" in result for result in results.values())
+
+    return run
+
+
+def preemption_timeline_benchmark(args: BenchmarkRequest, workdir: str) -> Callable:
+    from check_preemption import scan_fleets
+    from fleet_history_cache import FleetHistoryCache
+    from preemption_analytics import load_timeline
+
+    path = os.path.join(workdir, "fleet_history.db")
+    ec2 = SyntheticFleetEc2(args.fleets, args.events_per_fleet, args.seed)
+    history_cache = FleetHistoryCache(path)
+    scan_fleets(list(ec2.histories), ec2_client=ec2, history_cache=history_cache)
+    history_cache.close()
+
+    def run():
+        # A new connection every run, so that the timeline is built from a cold load
+        history_cache = FleetHistoryCache(path)
+        load_timeline(history_cache)
+        history_cache.close()
+
+    return run
+
+
+def share_ips_app(args: BenchmarkRequest, workdir: str):
+    """Import share_ips on a registry of synthetic entries and a synthetic inventory."""
+    db = os.path.join(workdir, "share_ips.db")
+    os.environ["SHARE_IPS_DB"] = db
+    import share_ips
+
+    if not share_ips.registry.days():
+        rng = random.Random(args.seed)
+        start = int(datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+        # About 2000 entries a day, so pages cross day boundaries
+        entries = [
+            (f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}", start + 43 * i)
+            for i in range(args.replay_entries)
+        ]
+        for i in range(0, len(entries), 100_000):
+            share_ips.registry.register_many(entries[i:i + 100_000])
+        logging.info(f"Registered {len(entries)} synthetic entries in {db}")
+
+    instances = {
+        f"i-{i:017x}": {
+            "Tags": f"Name=benchmark-{i},Owner=bench",
+            "KeyName": "benchmark",
+            "PublicIpAddress": f"3.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            "Region": "us-east-1",
+        }
+        for i in range(args.dashboard_instances)
+    }
+    spot_requests = [
+        {f"sir-{i:08x}": f"Name=benchmark-{i}", "KeyName": "benchmark", "Region": "us-east-1"}
+        for i in range(args.dashboard_instances)
+    ]
+    share_ips.inventory.fetch_instances = lambda region_name=None: dict(instances)
+    share_ips.inventory.fetch_spot_requests = lambda region_name=None: list(spot_requests)
+    share_ips.inventory.ttl = float("inf")
+    share_ips.inventory.refresh()
+    return share_ips
+
+
+def replay_benchmark(args: BenchmarkRequest, workdir: str, fmt: str) -> Callable:
+    client = share_ips_app(args, workdir).app.test_client()
+
+    def run():
+        response = client.get(f"/replay?format={fmt}&limit=10000")
+        assert response.status_code == 200 and len(response.data) > 0
+
+    return run
+
+
+def replay_walk_benchmark(args: BenchmarkRequest, workdir: str) -> Callable:
+    """Page through every entry, as a client exporting the whole registry does."""
+    client = share_ips_app(args, workdir).app.test_client()
+
+    def run():
+        cursor, entries = None, 0
+        while True:
+            url = "/replay?format=json&limit=10000"
+            response = client.get(url + (f"&cursor={cursor}" if cursor else "")).get_json()
+            entries += len(response["entries"])
+            cursor = response["next_cursor"]
+            if not cursor:
+                break
+        assert entries == args.replay_entries, entries
+
+    return run
+
+
+def dashboard_benchmark(args: BenchmarkRequest, workdir: str) -> Callable:
+    client = share_ips_app(args, workdir).app.test_client()
+
+    def run():
+        assert client.get("/dashboard").status_code == 200
+
+    return run
+
+
+def dashboard_diff_benchmark(args: BenchmarkRequest, workdir: str) -> Callable:
+    """Diff two inventories in which a tenth of the instances changed, as the live
+    dashboard does on every refresh."""
+    from inventory_feed import diff_rows, inventory_rows
+
+    share_ips = share_ips_app(args, workdir)
+    current = inventory_rows(share_ips.inventory.snapshot())
+    for n, key in enumerate(list(current)):
+        if n % 10 == 0:
+            current[key] = dict(current[key], Tags="changed")
+    current[("instance", "i-new")] = {"Tags": "", "KeyName": "", "PublicIpAddress": "", "Region": ""}
+
+    def run():
+        diff_rows(inventory_rows(share_ips.inventory.snapshot()), current)
+
+    return run
+
+
+def run_benchmarks(args: BenchmarkRequest) -> dict:
+    builders = {
+        "launch_template": launch_template_benchmark,
+        "preemption_scan": preemption_scan_benchmark,
+        "preemption_timeline": preemption_timeline_benchmark,
+        "replay_json": lambda a, w: replay_benchmark(a, w, "json"),
+        "replay_html": lambda a, w: replay_benchmark(a, w, "html"),
+        "replay_walk": replay_walk_benchmark,
+        "dashboard": dashboard_benchmark,
+        "dashboard_diff": dashboard_diff_benchmark,
+    }
+    params = {
+        "instance_types": args.instance_types,
+        "user_data_kb": args.user_data_kb,
+        "fleets": args.fleets,
+        "events_per_fleet": args.events_per_fleet,
+        "replay_entries": args.replay_entries,
+        "dashboard_instances": args.dashboard_instances,
+    }
+    results = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.benchmarks:
+            if name not in builders:
+                raise ValueError(f"Unknown benchmark {name}, expected one of {BENCHMARKS}")
+            run = builders[name](args, workdir)
+            results["benchmarks"][name] = time_runs(run, args.repeat)
+            logging.info(
+                f"{name}: median {results['benchmarks'][name]['median_s'] * 1000:.1f} ms"
+            )
+    return results
+
+
+def compare_results(baseline: dict, results: dict, tolerance: float) -> list:
+    """Return one row per benchmark in both results, with the ratio of the medians and
+    whether it is a regression beyond `tolerance`."""
+    if baseline.get("params") != results.get("params"):
+        logging.warning(
+            f"Benchmark parameters differ: {baseline.get('params')} vs {results.get('params')}"
+        )
+    rows = []
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        rows.append(
+            {
+                "benchmark": name,
+                "baseline_s": base["median_s"],
+                "median_s": result["median_s"],
+                "ratio": ratio,
+                "regression": ratio > 1 + tolerance,
+            }
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    args = tyro.cli(BenchmarkRequest)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    if args.against:
+        assert args.compare, "--against needs a --compare baseline"
+        with open(args.against, "r") as f:
+            results = json.load(f)
+    else:
+        results = run_benchmarks(args)
+        for name, result in results["benchmarks"].items():
+            print(
+                f"{name:>16}: median {result['median_s'] * 1000:9.2f} ms, "
+                f"min {result['min_s'] * 1000:9.2f} ms, max {result['max_s'] * 1000:9.2f} ms"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, results, args.tolerance)
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(
+                f"{row['benchmark']:>16}: {row['baseline_s'] * 1000:9.2f} ms -> "
+                f"{row['median_s'] * 1000:9.2f} ms ({row['ratio']:.2f}x){flag}"
+            )
+        if any(row["regression"] for row in rows):
+            exit(1)
@@ -1,159 +1,513 @@
-import boto3
-import pprint
+import botocore.exceptions
+import concurrent.futures
+import dataclasses
 import logging
-from typing import Dict, List, Optional, Tuple, Union
+import os
+import sys
+import tyro
+# For aws_clients, as in launch_aws_spot_fleet
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibepilot"))
+from fleet_history_cache import FleetHistoryCache, TERMINAL_FLEET_STATES
+import aws_clients
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timezone
 
-def check_fleet_preemption(spot_fleet_request_id: str) -> Dict[str, List[Dict]]:
+# Preemption status codes that indicate Amazon terminated the instance
+PREEMPTION_CODES = [
+    'instance-terminated-by-price',
+    'instance-terminated-capacity-not-available',
+    'instance-terminated-capacity-oversubscribed',
+    'instance-terminated-by-service'
+]
+# Status codes that indicate the user (or the job itself) terminated the instance
+USER_TERMINATION_CODES = [
+    'instance-terminated-by-user',
+    'request-canceled-and-instance-terminated'
+]
+# State reason codes reported by describe_instances for the same two cases, used when
+# the spot instance request has already been purged.
+PREEMPTION_STATE_REASONS = ['Server.SpotInstanceTermination']
+USER_TERMINATION_STATE_REASONS = [
+    'Client.UserInitiatedShutdown',
+    'Client.InstanceInitiatedShutdown'
+]
+
+DEFAULT_HISTORY_START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Maximum number of IDs EC2 accepts in a single describe call filter
+DESCRIBE_BATCH_SIZE = 100
+
+DEFAULT_FLEET_IDS = [
+    "sfr-fc41a748-97e3-4521-890a-75497ded3a97",
+    "sfr-be0c8cda-df44-465d-a79f-625f84824ded",
+    "sfr-918882c9-0e46-402e-bd5e-78f4e74fd0b5",
+    "sfr-1f6b1cfa-19d6-4761-b06e-d16ce92e1863",
+    "sfr-e94cdd1b-a172-4d2b-8204-0598fe827e88",
+    "sfr-42a0eb08-2fba-4b74-a170-dfcf65800db0",
+    "sfr-cf9b3b1c-4761-41fa-8128-dd3864e72471",
+    "sfr-897b7808-a073-4836-9615-c99bc4b6a89a",
+    "sfr-09c73d7e-4cb6-4e3d-8dde-6e6d713c4fbe",
+    "sfr-5d7702c4-9ce5-4ad4-bc6f-539d0c9cead8",
+    "sfr-a9988cf8-9556-4d71-958a-7229587a6e89",
+    "sfr-18ca76f3-9d2b-4da2-942d-2b459a6d26ea",
+    "sfr-3c3e590b-2ac3-4ae8-928c-c211bdb2f057",
+    "sfr-afa4d685-c260-4d89-bfc3-6be4faef1b84",
+    "sfr-fd4818eb-6f40-498d-90a8-906a67e0f0b1",
+    "sfr-8a6fe189-57de-49e2-861d-39fb94e5f2c7",
+    "sfr-733c88d0-cef7-4533-afdd-8a3fd01e2cfd",
+    "sfr-bf9342d7-eba4-4f99-b8c2-9606db34d855",
+    "sfr-6ef8768e-eee6-4b23-81fa-da5b2e583ce7",
+    "sfr-38083a75-4a3e-4a35-97b0-431ed2c80e67",
+    "sfr-862c43f4-b388-4495-b5aa-5211f90d4575",
+    "sfr-f97e3bd4-335b-4dbe-abd2-eb07e6bc3735",
+    "sfr-73d62f92-c829-4574-88ea-942f99f97d3b",
+    "sfr-8b3093bd-21e3-4186-bc5b-2f74bc8a980a",
+    "sfr-1ad04d81-70b5-4748-958b-fdbbb8e7ed48",
+    "sfr-18305655-bc55-4d35-8305-2923d2c47004",
+    "sfr-2471c50b-23df-453c-b1ea-246338c95a5f",
+    "sfr-bf721a6f-1ce7-4269-b256-70ec5c25edda",
+    "sfr-220a2c8f-4847-471e-9140-0bac886f3dc8",
+    "sfr-b1b0965c-2089-4aef-afa2-68796e8fb81d",
+]
+
+
+@dataclasses.dataclass(kw_only=True)
+class PreemptionScanRequest:
+    """Scan spot fleets for preempted instances."""
+
+    fleet_ids: list[str] = dataclasses.field(
+        default_factory=lambda: list(DEFAULT_FLEET_IDS)
+    )
+    """Spot fleet request IDs to scan."""
+
+    max_workers: int = 16
+    """Maximum number of EC2 calls in flight at the same time."""
+
+    history_cache: Optional[str] = None
+    """Path to a SQLite history cache. If supplied, only events newer than the cached ones
+    are fetched and fleets that have finished are not scanned again."""
+
+    regions: Optional[list[str]] = None
+    """Regions the fleets may be in. Fleets are looked up in every region concurrently
+    and scanned in the region they were found in. Defaults to the AWS default region."""
+
+
+def _batches(items: List[str], size: int = DESCRIBE_BATCH_SIZE) -> Iterator[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def fetch_fleet_history(
+    ec2_client,
+    spot_fleet_request_id: str,
+    start_time: datetime = DEFAULT_HISTORY_START,
+) -> List[Dict]:
     """
-    Check if instances in a Spot Fleet have been terminated by Amazon (preempted).
-    
+    Fetch every history record of a Spot Fleet after start_time, following NextToken.
+
     Args:
-        spot_fleet_request_id: The ID of the Spot Fleet request (e.g., 'sfr-12345678-1234-5678-1234-567890abcdef')
-        
+        ec2_client: A boto3 EC2 client (or a stub with the same interface)
+        spot_fleet_request_id: The ID of the Spot Fleet request
+        start_time: Only records after this time are returned
+
     Returns:
-        A dictionary with lists of preempted and non-preempted instances with their details
+        The history records, oldest first
+    """
+    records = []
+    kwargs = {
+        "SpotFleetRequestId": spot_fleet_request_id,
+        "StartTime": start_time,
+        "MaxResults": 1000,
+    }
+    while True:
+        response = ec2_client.describe_spot_fleet_request_history(**kwargs)
+        records.extend(response.get('HistoryRecords', []))
+        next_token = response.get('NextToken')
+        if not next_token:
+            return records
+        kwargs["NextToken"] = next_token
+
+
+def history_instance_ids(history_records: List[Dict]) -> List[str]:
+    """Return the unique instance IDs mentioned in instanceChange records, in order."""
+    instance_ids = {}
+    for record in history_records:
+        if record.get('EventType') != 'instanceChange':
+            continue
+        instance_id = record.get('EventInformation', {}).get('InstanceId')
+        if instance_id:
+            instance_ids[instance_id] = None
+    return list(instance_ids)
+
+
+def describe_fleet_states(ec2_client, spot_fleet_request_ids: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Look up the state of many Spot Fleet requests, DESCRIBE_BATCH_SIZE IDs per call.
+
+    Returns:
+        A dictionary keyed by fleet ID with the SpotFleetRequestState, or None for fleets
+        EC2 no longer knows about
+    """
+    states = {}
+    for batch in _batches(list(dict.fromkeys(spot_fleet_request_ids))):
+        try:
+            configs = ec2_client.describe_spot_fleet_requests(
+                SpotFleetRequestIds=batch
+            ).get('SpotFleetRequestConfigs', [])
+        except botocore.exceptions.ClientError as e:
+            if 'NotFound' not in e.response.get('Error', {}).get('Code', ''):
+                raise
+            # One unknown ID fails the whole batch, so fall back to one call per fleet
+            configs = []
+            for fleet_id in batch:
+                try:
+                    configs.extend(ec2_client.describe_spot_fleet_requests(
+                        SpotFleetRequestIds=[fleet_id]
+                    ).get('SpotFleetRequestConfigs', []))
+                except botocore.exceptions.ClientError as e:
+                    if 'NotFound' not in e.response.get('Error', {}).get('Code', ''):
+                        raise
+        for fleet_id in batch:
+            states[fleet_id] = None
+        for config in configs:
+            states[config['SpotFleetRequestId']] = config.get('SpotFleetRequestState')
+    return states
+
+
+def locate_fleets(
+    spot_fleet_request_ids: List[str],
+    regions: List[str],
+    ec2_clients: Optional[Dict[str, object]] = None,
+) -> Tuple[Dict[str, str], Dict[str, Optional[str]]]:
+    """
+    Find the region of every Spot Fleet request by looking it up in all regions concurrently.
+
+    Args:
+        spot_fleet_request_ids: The IDs of the Spot Fleet requests to locate
+        regions: The regions to look in
+        ec2_clients: EC2 clients (or stubs) keyed by region. Shared clients are used if None.
+
+    Returns:
+        A dictionary keyed by fleet ID with its region, and one with its SpotFleetRequestState.
+        Fleets no region knows about are assigned the first region and the state None.
+    """
+    ec2_clients = ec2_clients or {region: aws_clients.ec2_client(region) for region in regions}
+    fleet_regions = {fleet_id: regions[0] for fleet_id in spot_fleet_request_ids}
+    states = {fleet_id: None for fleet_id in spot_fleet_request_ids}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = {
+            region: executor.submit(
+                describe_fleet_states, ec2_clients[region], spot_fleet_request_ids
+            )
+            for region in regions
+        }
+        for region in regions:
+            for fleet_id, state in futures[region].result().items():
+                if state is not None and states[fleet_id] is None:
+                    fleet_regions[fleet_id] = region
+                    states[fleet_id] = state
+    return fleet_regions, states
+
+
+def describe_instances_batched(
+    ec2_client,
+    instance_ids: List[str],
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Describe instances and their spot instance requests, DESCRIBE_BATCH_SIZE IDs per call.
+
+    Instance IDs are passed as filters rather than InstanceIds so that instances EC2 has
+    already forgotten are silently skipped instead of failing the whole batch.
+
+    Args:
+        ec2_client: A boto3 EC2 client (or a stub with the same interface)
+        instance_ids: The instance IDs to describe
+        executor: If given, batches are described concurrently on this executor
+
+    Returns:
+        Two dictionaries keyed by instance ID: the instance descriptions and the spot
+        instance request descriptions
+    """
+
+    def describe_batch(batch: List[str]) -> Tuple[List[Dict], List[Dict]]:
+        filters = [{"Name": "instance-id", "Values": batch}]
+        instances = []
+        paginator = ec2_client.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=filters):
+            for reservation in page.get('Reservations', []):
+                instances.extend(reservation.get('Instances', []))
+        spot_requests = []
+        paginator = ec2_client.get_paginator('describe_spot_instance_requests')
+        for page in paginator.paginate(Filters=filters):
+            spot_requests.extend(page.get('SpotInstanceRequests', []))
+        return instances, spot_requests
+
+    batches = list(_batches(list(dict.fromkeys(instance_ids))))
+    if executor is None:
+        described = map(describe_batch, batches)
+    else:
+        described = executor.map(describe_batch, batches)
+
+    instances_by_id = {}
+    spot_requests_by_id = {}
+    for instances, spot_requests in described:
+        for instance in instances:
+            instances_by_id[instance['InstanceId']] = instance
+        for spot_request in spot_requests:
+            if spot_request.get('InstanceId'):
+                spot_requests_by_id[spot_request['InstanceId']] = spot_request
+    return instances_by_id, spot_requests_by_id
+
+
+def classify_instance(
+    status_code: Optional[str],
+    state_name: Optional[str] = None,
+    state_reason_code: Optional[str] = None,
+) -> str:
+    """
+    Classify an instance from its spot request status and instance state.
+
+    Returns:
+        One of "preempted", "non_preempted", "active" or "unknown"
+    """
+    if status_code in PREEMPTION_CODES or state_reason_code in PREEMPTION_STATE_REASONS:
+        return "preempted"
+    if (
+        status_code in USER_TERMINATION_CODES
+        or state_reason_code in USER_TERMINATION_STATE_REASONS
+    ):
+        # User-initiated termination is not considered preemption
+        return "non_preempted"
+    if state_name in ('pending', 'running') or (status_code == 'fulfilled' and state_name is None):
+        return "active"
+    return "unknown"
+
+
+def classify_fleet(
+    history_records: List[Dict],
+    instances_by_id: Dict[str, Dict],
+    spot_requests_by_id: Dict[str, Dict],
+    known_instances: Optional[Dict[str, Dict]] = None,
+) -> Dict[str, List[Dict]]:
+    """
+    Sort the instances of one fleet into preempted, non-preempted, active and unknown.
+
+    Instances in known_instances (instance infos with a "category", e.g. from a history
+    cache) are used as they are instead of being looked up in instances_by_id.
+
+    Returns:
+        A dictionary with lists of instances per category and the fleet history
     """
-    ec2_client = boto3.client('ec2')
-    
-    # Initialize results dictionary
     results = {
         "preempted_instances": [],
         "non_preempted_instances": [],
-        "active_instances": []
+        "active_instances": [],
+        "unknown_instances": [],
     }
-    
-    try:
-        # Get spot instance requests associated with this fleet
-        response = ec2_client.describe_spot_fleet_request_history(
-            SpotFleetRequestId=spot_fleet_request_id,
-            StartTime=datetime(2020, 1, 1, tzinfo=timezone.utc), # Example: fixed start date
+    known_instances = known_instances or {}
+    for instance_id in history_instance_ids(history_records):
+        if instance_id in known_instances:
+            instance_info = dict(known_instances[instance_id])
+            category = instance_info.pop('category')
+            results[f"{category}_instances"].append(instance_info)
+            continue
+        instance = instances_by_id.get(instance_id, {})
+        spot_request = spot_requests_by_id.get(instance_id, {})
+        status = spot_request.get('Status', {})
+        instance_info = {
+            'instance_id': instance_id,
+            'status_code': status.get('Code'),
+            'status_message': status.get('Message', ''),
+            'request_id': spot_request.get('SpotInstanceRequestId'),
+            'state': instance.get('State', {}).get('Name'),
+            'state_reason_code': instance.get('StateReason', {}).get('Code'),
+            'instance_type': instance.get('InstanceType'),
+            'availability_zone': instance.get('Placement', {}).get('AvailabilityZone'),
+            'launch_time': instance.get('LaunchTime'),
+        }
+        category = classify_instance(
+            instance_info['status_code'],
+            instance_info['state'],
+            instance_info['state_reason_code'],
         )
-        
-        # Preemption status codes that indicate Amazon terminated the instance
-        preemption_codes = [
-            'instance-terminated-by-price',
-            'instance-terminated-capacity-not-available',
-            'instance-terminated-capacity-oversubscribed',
-            'instance-terminated-by-service'
-        ]
-        # print(response)
-        # pprint.pprint([(i, x.get('EventSubType'), x['EventType']) for i, x  in enumerate(response['HistoryRecords'])])
-        instance_chages = [x for x in response['HistoryRecords'] if x['EventType'] in ['instanceChange']]#, 'spotInstanceRequestChange']]
-        instance_ids = [x['EventInformation']['InstanceId'] for x in instance_chages]
-        print(instance_ids)
-        
-        # Print events associated with each instance
-        for i, instance_id in enumerate(instance_ids):
-            specific_response = ec2_client.describe_instance_status(
-            InstanceIds=[instance_id],
+        results[f"{category}_instances"].append(instance_info)
+    results["fleet_history"] = history_records
+    return results
+
+
+def scan_fleets(
+    spot_fleet_request_ids: List[str],
+    ec2_client=None,
+    max_workers: int = 16,
+    start_time: datetime = DEFAULT_HISTORY_START,
+    history_cache: Optional[FleetHistoryCache] = None,
+    regions: Optional[List[str]] = None,
+) -> Dict[str, Dict]:
+    """
+    Scan many Spot Fleets for preempted instances concurrently.
+
+    History is paged through once per fleet, then the instances of all fleets are
+    described together in batches of DESCRIBE_BATCH_SIZE IDs. With several regions, the
+    fleets are first located with locate_fleets and every region is queried concurrently.
+
+    With a history cache, fleets already marked complete are answered from the cache
+    without any EC2 call, only events after each fleet's high-water mark are fetched,
+    instances already known to be terminated are not described again, and fleets found
+    in a terminal state are marked complete.
+
+    Args:
+        spot_fleet_request_ids: The IDs of the Spot Fleet requests to scan
+        ec2_client: A boto3 EC2 client (or a stub with the same interface), or a dictionary
+            of them keyed by region. The shared client of each of `regions` is used if None.
+        max_workers: Maximum number of EC2 calls in flight at the same time
+        start_time: Only history records after this time are considered
+        history_cache: Optional cache to read from and update
+        regions: Regions the fleets may be in. Defaults to the client's region.
+
+    Returns:
+        A dictionary keyed by fleet ID with the result of classify_fleet for every fleet.
+        Fleets that could not be scanned map to {"error": <message>}.
+    """
+    fleet_ids = list(dict.fromkeys(spot_fleet_request_ids))
+    results = {}
+    if history_cache is not None:
+        for fleet_id in fleet_ids:
+            if history_cache.is_complete(fleet_id):
+                results[fleet_id] = history_cache.load_result(fleet_id)
+        to_scan = [f for f in fleet_ids if f not in results]
+    else:
+        to_scan = fleet_ids
+    if not to_scan:
+        return {fleet_id: results[fleet_id] for fleet_id in fleet_ids}
+
+    if isinstance(ec2_client, dict):
+        ec2_clients = ec2_client
+    elif ec2_client is not None:
+        ec2_clients = {None: ec2_client}
+    else:
+        ec2_clients = {region: aws_clients.ec2_client(region) for region in regions or [None]}
+    states = {}
+    if len(ec2_clients) > 1:
+        fleet_regions, states = locate_fleets(to_scan, list(ec2_clients), ec2_clients)
+    else:
+        fleet_regions = {fleet_id: next(iter(ec2_clients)) for fleet_id in to_scan}
+        if history_cache is not None:
+            # Looked up before the history so that a terminal fleet's final events are fetched
+            states = describe_fleet_states(ec2_clients[fleet_regions[to_scan[0]]], to_scan)
+    if history_cache is not None:
+        start_times = {
+            fleet_id: history_cache.high_water_mark(fleet_id) or start_time
+            for fleet_id in to_scan
+        }
+    else:
+        start_times = {fleet_id: start_time for fleet_id in to_scan}
+
+    histories = {}
+    known_instances = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                fetch_fleet_history,
+                ec2_clients[fleet_regions[fleet_id]],
+                fleet_id,
+                start_times[fleet_id],
+            ): fleet_id
+            for fleet_id in to_scan
+        }
+        for future in concurrent.futures.as_completed(futures):
+            fleet_id = futures[future]
+            try:
+                histories[fleet_id] = future.result()
+            except Exception as e:
+                logging.error(f"Error fetching history of fleet {fleet_id}: {e}")
+                results[fleet_id] = {"error": str(e)}
+                continue
+            if history_cache is not None:
+                history_cache.add_records(fleet_id, histories[fleet_id], states.get(fleet_id))
+                histories[fleet_id] = history_cache.history(fleet_id)
+                known_instances[fleet_id] = {
+                    instance_id: info
+                    for instance_id, info in history_cache.instances(fleet_id).items()
+                    if info['category'] in ('preempted', 'non_preempted')
+                }
+
+        instance_ids_by_region = {}
+        for fleet_id, history in histories.items():
+            instance_ids_by_region.setdefault(fleet_regions[fleet_id], []).extend(
+                instance_id
+                for instance_id in history_instance_ids(history)
+                if instance_id not in known_instances.get(fleet_id, {})
+            )
+        instances_by_id, spot_requests_by_id = {}, {}
+        # Regions wait on their batches in their own threads, so they run concurrently
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(instance_ids_by_region))
+        ) as region_executor:
+            described = region_executor.map(
+                lambda item: describe_instances_batched(
+                    ec2_clients[item[0]], item[1], executor=executor
+                ),
+                instance_ids_by_region.items(),
             )
+            for region_instances, region_spot_requests in described:
+                instances_by_id.update(region_instances)
+                spot_requests_by_id.update(region_spot_requests)
 
-            print(specific_response)
-
-        # print(instance_chages)
-        # Process each spot instance request
-        for request in response.get('SpotInstanceRequests', []):
-            instance_id = request.get('InstanceId')
-            status_code = request.get('Status', {}).get('Code')
-            status_message = request.get('Status', {}).get('Message', '')
-            
-            instance_info = {
-                'instance_id': instance_id,
-                'status_code': status_code,
-                'status_message': status_message,
-                'request_id': request.get('SpotInstanceRequestId')
-            }
-
-            print(instance_info)
-            
-            # Check if instance is terminated and why
-            if status_code in preemption_codes:
-                results["preempted_instances"].append(instance_info)
-            elif status_code == 'instance-terminated-by-user' or status_code == 'request-canceled-and-instance-terminated':
-                # User-initiated termination is not considered preemption
-                results["non_preempted_instances"].append(instance_info)
-            elif status_code == 'fulfilled' and instance_id:
-                # Check if the instance is still running
-                results["active_instances"].append(instance_info)
-        # Get additional fleet history for more context
-        # Use a reasonable start time, e.g., 30 days ago, or adjust as needed
-        start_time = datetime(2020, 1, 1, tzinfo=timezone.utc) # Example: fixed start date
-        # Or dynamically calculate, e.g., 30 days ago:
-        # from datetime import timedelta
-        # start_time = datetime.now(timezone.utc) - timedelta(days=30)
-
-        history_response = ec2_client.describe_spot_fleet_request_history(
-            SpotFleetRequestId=spot_fleet_request_id,
-            StartTime=start_time
+    for fleet_id, history in histories.items():
+        results[fleet_id] = classify_fleet(
+            history, instances_by_id, spot_requests_by_id, known_instances.get(fleet_id)
         )
+        if history_cache is not None:
+            history_cache.save_instances(fleet_id, results[fleet_id])
+            state = states.get(fleet_id)
+            # Fleets EC2 no longer knows about will not produce any new events either
+            if state is None or state in TERMINAL_FLEET_STATES:
+                history_cache.mark_complete(fleet_id, state or 'expired')
+    return {fleet_id: results[fleet_id] for fleet_id in fleet_ids}
+
+
+def check_fleet_preemption(spot_fleet_request_id: str, ec2_client=None) -> Dict[str, List[Dict]]:
+    """
+    Check if instances in a Spot Fleet have been terminated by Amazon (preempted).
+
+    Args:
+        spot_fleet_request_id: The ID of the Spot Fleet request (e.g., 'sfr-12345678-1234-5678-1234-567890abcdef')
+        ec2_client: A boto3 EC2 client (or a stub with the same interface). The shared one is used if None.
+
+    Returns:
+        A dictionary with lists of preempted and non-preempted instances with their details
+    """
+    result = scan_fleets([spot_fleet_request_id], ec2_client=ec2_client, max_workers=1)
+    result = result[spot_fleet_request_id]
+    if "error" in result:
+        logging.error(f"Error checking fleet preemption: {result['error']}")
+        raise RuntimeError(result["error"])
+    return result
 
-        # Add fleet history events to the result for reference
-        # Add fleet history events to the result for reference
-        results["fleet_history"] = history_response.get('HistoryRecords', [])
-        
-        return results
-        
-    except Exception as e:
-        logging.error(f"Error checking fleet preemption: {e}")
-        raise
 
 # Example usage
 if __name__ == "__main__":
-    # Replace with your actual Spot Fleet Request ID
-    # fleet_id = "sfr-bf9342d7-eba4-4f99-b8c2-9606db34d855"
-    # fleet_id = "sfr-6ef8768e-eee6-4b23-81fa-da5b2e583ce7"
-    # fleet_id = "sfr-6ef8768e-eee6-4b23-81fa-da5b2e583ce7"
-    # fleet_id = "sfr-73d62f92-c829-4574-88ea-942f99f97d3b"
-    # fleet_id = "sfr-18305655-bc55-4d35-8305-2923d2c47004"
-    # fleet_id = "sfr-220a2c8f-4847-471e-9140-0bac886f3dc8"
-
-
-    # fleet_id = "sfr-918882c9-0e46-402e-bd5e-78f4e74fd0b5"
-    fleet_ids = [
-        "sfr-fc41a748-97e3-4521-890a-75497ded3a97",
-"sfr-be0c8cda-df44-465d-a79f-625f84824ded",
-"sfr-918882c9-0e46-402e-bd5e-78f4e74fd0b5",
-"sfr-1f6b1cfa-19d6-4761-b06e-d16ce92e1863",
-"sfr-e94cdd1b-a172-4d2b-8204-0598fe827e88",
-"sfr-42a0eb08-2fba-4b74-a170-dfcf65800db0",
-"sfr-cf9b3b1c-4761-41fa-8128-dd3864e72471",
-"sfr-897b7808-a073-4836-9615-c99bc4b6a89a",
-"sfr-09c73d7e-4cb6-4e3d-8dde-6e6d713c4fbe",
-"sfr-5d7702c4-9ce5-4ad4-bc6f-539d0c9cead8",
-"sfr-a9988cf8-9556-4d71-958a-7229587a6e89",
-"sfr-18ca76f3-9d2b-4da2-942d-2b459a6d26ea",
-"sfr-3c3e590b-2ac3-4ae8-928c-c211bdb2f057",
-"sfr-afa4d685-c260-4d89-bfc3-6be4faef1b84",
-"sfr-fd4818eb-6f40-498d-90a8-906a67e0f0b1",
-"sfr-8a6fe189-57de-49e2-861d-39fb94e5f2c7",
-"sfr-733c88d0-cef7-4533-afdd-8a3fd01e2cfd",
-"sfr-bf9342d7-eba4-4f99-b8c2-9606db34d855",
-"sfr-6ef8768e-eee6-4b23-81fa-da5b2e583ce7",
-"sfr-38083a75-4a3e-4a35-97b0-431ed2c80e67",
-"sfr-862c43f4-b388-4495-b5aa-5211f90d4575",
-"sfr-f97e3bd4-335b-4dbe-abd2-eb07e6bc3735",
-"sfr-73d62f92-c829-4574-88ea-942f99f97d3b",
-"sfr-8b3093bd-21e3-4186-bc5b-2f74bc8a980a",
-"sfr-1ad04d81-70b5-4748-958b-fdbbb8e7ed48",
-"sfr-18305655-bc55-4d35-8305-2923d2c47004",
-"sfr-2471c50b-23df-453c-b1ea-246338c95a5f",
-"sfr-bf721a6f-1ce7-4269-b256-70ec5c25edda",
-"sfr-220a2c8f-4847-471e-9140-0bac886f3dc8",
-"sfr-b1b0965c-2089-4aef-afa2-68796e8fb81d",
-    ]
-    for fleet_id in fleet_ids:
-        try:
-            result = check_fleet_preemption(fleet_id)
-            
-            # Print summary
-            # print(f"Fleet ID: {fleet_id}")
-            # print(f"Preempted instances: {len(result['preempted_instances'])}")
-            # for instance in result['preempted_instances']:
-            #     print(f"  - {instance['instance_id']}: {instance['status_message']}")
-                
-            # print(f"\nNon-preempted terminated instances: {len(result['non_preempted_instances'])}")
-            # print(f"Active instances: {len(result['active_instances'])}")
-            
-        except Exception as e:
-            print(f"Error: {e}")
\ No newline at end of file
+    args = tyro.cli(PreemptionScanRequest)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    history_cache = FleetHistoryCache(args.history_cache) if args.history_cache else None
+    results = scan_fleets(
+        args.fleet_ids,
+        max_workers=args.max_workers,
+        history_cache=history_cache,
+        regions=args.regions,
+    )
+    for fleet_id, result in results.items():
+        print(f"Fleet ID: {fleet_id}")
+        if "error" in result:
+            print(f"  Error: {result['error']}")
+            continue
+        print(f"  Preempted instances: {len(result['preempted_instances'])}")
+        for instance in result['preempted_instances']:
+            print(f"    - {instance['instance_id']}: {instance['status_message']}")
+        print(f"  Non-preempted terminated instances: {len(result['non_preempted_instances'])}")
+        print(f"  Active instances: {len(result['active_instances'])}")
+        print(f"  Unknown instances: {len(result['unknown_instances'])}")
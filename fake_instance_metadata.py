@@ -0,0 +1,105 @@
+import dataclasses
+import datetime
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+import tyro
+from flask import Flask, abort, jsonify, request
+
+
+@dataclasses.dataclass(kw_only=True)
+class FakeMetadataServer:
+    """Serve a fake EC2 instance metadata service (IMDSv2) to test the user data hooks.
+
+    Run a preprocessed user data script against it with
+    VIBEPILOT_IMDS=http://localhost:<port> bash user_data.sh"""
+
+    port: int = 8169
+    """Port to listen on."""
+
+    instance_id: str = "i-0123456789abcdef0"
+    instance_type: str = "g5.xlarge"
+    availability_zone: str = "us-east-1a"
+
+    interrupt_after: Optional[float] = None
+    """Seconds after startup at which to issue a spot interruption notice. Notices can
+    also be issued at any time with POST /interrupt."""
+
+    action: str = "terminate"
+    """Interruption action: terminate, stop or hibernate."""
+
+
+class FakeInstanceMetadata:
+    """Instance metadata with a spot interruption notice that can be issued on demand."""
+
+    def __init__(self, instance_id: str, instance_type: str, availability_zone: str):
+        self.metadata = {
+            "instance-id": instance_id,
+            "instance-type": instance_type,
+            "placement/availability-zone": availability_zone,
+        }
+        self.instance_action = None
+        self.tokens = set()
+        self._lock = threading.Lock()
+
+    def interrupt(self, action: str = "terminate", warning_seconds: float = 120.0) -> dict:
+        """Issue a spot interruption notice, as IMDS does two minutes before the action."""
+        when = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=warning_seconds
+        )
+        with self._lock:
+            self.instance_action = {
+                "action": action,
+                "time": when.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            return self.instance_action
+
+    def app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.route("/latest/api/token", methods=["PUT"])
+        def token():
+            value = f"token-{len(self.tokens)}"
+            with self._lock:
+                self.tokens.add(value)
+            return value
+
+        @app.route("/latest/meta-data/<path:key>")
+        def meta_data(key):
+            if request.headers.get("X-aws-ec2-metadata-token") not in self.tokens:
+                abort(401)
+            if key == "spot/instance-action":
+                with self._lock:
+                    if self.instance_action is None:
+                        abort(404)
+                    return json.dumps(self.instance_action)
+            if key not in self.metadata:
+                abort(404)
+            return self.metadata[key]
+
+        @app.route("/interrupt", methods=["POST"])
+        def interrupt():
+            return jsonify(self.interrupt(request.args.get("action", "terminate")))
+
+        return app
+
+
+if __name__ == "__main__":
+    args = tyro.cli(FakeMetadataServer)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    metadata = FakeInstanceMetadata(args.instance_id, args.instance_type, args.availability_zone)
+    if args.interrupt_after is not None:
+
+        def interrupt_later():
+            time.sleep(args.interrupt_after)
+            logging.info(f"Issuing spot interruption notice: {metadata.interrupt(args.action)}")
+
+        threading.Thread(target=interrupt_later, daemon=True).start()
+    metadata.app().run(host="127.0.0.1", port=args.port, threaded=True)
@@ -0,0 +1,212 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Fleet states after which a fleet's history and instances no longer change
+TERMINAL_FLEET_STATES = ['cancelled', 'failed']
+
+
+def _timestamp_key(timestamp) -> str:
+    """Normalise a history record timestamp to a sortable UTC ISO string."""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.astimezone(timezone.utc).isoformat()
+    return str(timestamp)
+
+
+def _fleet_filter(fleet_ids: Optional[List[str]]) -> str:
+    # One JSON array parameter rather than one per fleet, as SQLite limits their number
+    return "" if fleet_ids is None else "WHERE fleet_id IN (SELECT value FROM json_each(?))"
+
+
+def _fleet_params(fleet_ids: Optional[List[str]]) -> tuple:
+    return () if fleet_ids is None else (json.dumps(fleet_ids),)
+
+
+class FleetHistoryCache:
+    """
+    Persistent SQLite store of spot fleet history records and instance classifications.
+
+    Records are keyed by fleet ID and event timestamp. Every fleet has a high-water mark,
+    the timestamp of its newest stored record, so that later scans only request newer
+    events. Fleets in a terminal state are marked complete and are not scanned again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+CREATE TABLE IF NOT EXISTS fleets (
+    fleet_id TEXT PRIMARY KEY,
+    state TEXT,
+    high_water_mark TEXT,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS history (
+    fleet_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (fleet_id, timestamp, record)
+);
+CREATE TABLE IF NOT EXISTS instances (
+    instance_id TEXT PRIMARY KEY,
+    fleet_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instances_fleet_id ON instances (fleet_id);
+"""
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def high_water_mark(self, fleet_id: str) -> Optional[datetime]:
+        """Return the timestamp of the newest stored record of a fleet, if any."""
+        row = self.conn.execute(
+            "SELECT high_water_mark FROM fleets WHERE fleet_id = ?", (fleet_id,)
+        ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return datetime.fromisoformat(row[0])
+
+    def is_complete(self, fleet_id: str) -> bool:
+        row = self.conn.execute(
+            "SELECT complete FROM fleets WHERE fleet_id = ?", (fleet_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def fleet_ids(self, complete: Optional[bool] = None) -> List[str]:
+        """Return the cached fleet IDs, optionally only the complete or incomplete ones."""
+        if complete is None:
+            rows = self.conn.execute("SELECT fleet_id FROM fleets ORDER BY fleet_id")
+        else:
+            rows = self.conn.execute(
+                "SELECT fleet_id FROM fleets WHERE complete = ? ORDER BY fleet_id",
+                (int(complete),),
+            )
+        return [row[0] for row in rows]
+
+    def add_records(self, fleet_id: str, records: List[Dict], state: Optional[str] = None):
+        """
+        Store new history records of a fleet and advance its high-water mark.
+
+        Records that are already stored are ignored, so overlapping fetches are harmless.
+        """
+        rows = [
+            (fleet_id, _timestamp_key(r.get('Timestamp')), json.dumps(r, sort_keys=True, default=_timestamp_key))
+            for r in records
+        ]
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO fleets (fleet_id) VALUES (?)", (fleet_id,)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO history (fleet_id, timestamp, record) VALUES (?, ?, ?)",
+                rows,
+            )
+            self.conn.execute(
+                """
+UPDATE fleets SET
+    high_water_mark = (SELECT MAX(timestamp) FROM history WHERE fleet_id = ?),
+    state = COALESCE(?, state)
+WHERE fleet_id = ?
+""",
+                (fleet_id, state, fleet_id),
+            )
+
+    def history(self, fleet_id: str) -> List[Dict]:
+        """Return the stored history records of a fleet, oldest first."""
+        rows = self.conn.execute(
+            "SELECT record FROM history WHERE fleet_id = ? ORDER BY timestamp",
+            (fleet_id,),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def history_lines(self, fleet_ids: Optional[List[str]] = None) -> List[tuple]:
+        """
+        Return the stored history records of the given (default: all) fleets as JSON lines.
+
+        SQLite joins the records of every fleet into one string while it walks the history
+        key, so that many records are read without creating a Python object for each.
+
+        Returns:
+            (fleet_id, number of records, records joined by newlines, oldest first) tuples,
+            one per fleet
+        """
+        return self.conn.execute(
+            f"""
+SELECT fleet_id, COUNT(*), group_concat(record, char(10))
+FROM history {_fleet_filter(fleet_ids)}
+GROUP BY fleet_id
+""",
+            _fleet_params(fleet_ids),
+        ).fetchall()
+
+    def instance_lines(self, fleet_ids: Optional[List[str]] = None) -> List[tuple]:
+        """
+        Return the stored instances of the given (default: all) fleets as JSON lines.
+
+        Returns:
+            (fleet_id, number of instances, categories joined by newlines, instance infos
+            joined by newlines) tuples, one per fleet
+        """
+        return self.conn.execute(
+            f"""
+SELECT fleet_id, COUNT(*), group_concat(category, char(10)), group_concat(info, char(10))
+FROM instances {_fleet_filter(fleet_ids)}
+GROUP BY fleet_id
+""",
+            _fleet_params(fleet_ids),
+        ).fetchall()
+
+    def save_instances(self, fleet_id: str, result: Dict[str, List[Dict]]):
+        """Store the classified instances of a fleet, as returned by classify_fleet."""
+        rows = [
+            (info['instance_id'], fleet_id, key[:-len("_instances")], json.dumps(info, default=_timestamp_key))
+            for key, infos in result.items()
+            if key.endswith("_instances")
+            for info in infos
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO instances (instance_id, fleet_id, category, info) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def instances(self, fleet_id: str) -> Dict[str, Dict]:
+        """Return the stored instance infos of a fleet, keyed by instance ID."""
+        rows = self.conn.execute(
+            "SELECT instance_id, category, info FROM instances WHERE fleet_id = ?",
+            (fleet_id,),
+        )
+        return {row[0]: {**json.loads(row[2]), 'category': row[1]} for row in rows}
+
+    def mark_complete(self, fleet_id: str, state: str):
+        """Mark a fleet as complete so that it is skipped by later scans."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO fleets (fleet_id) VALUES (?)", (fleet_id,)
+            )
+            self.conn.execute(
+                "UPDATE fleets SET state = ?, complete = 1 WHERE fleet_id = ?",
+                (state, fleet_id),
+            )
+
+    def load_result(self, fleet_id: str) -> Dict[str, List[Dict]]:
+        """Rebuild the classify_fleet result of a fleet from the cache, without EC2 calls."""
+        result = {
+            "preempted_instances": [],
+            "non_preempted_instances": [],
+            "active_instances": [],
+            "unknown_instances": [],
+        }
+        for info in self.instances(fleet_id).values():
+            category = info.pop('category')
+            result[f"{category}_instances"].append(info)
+        result["fleet_history"] = self.history(fleet_id)
+        return result
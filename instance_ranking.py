@@ -0,0 +1,294 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import botocore.exceptions
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "aws-tools", "instance_ranking.json"
+)
+# Allocation strategy under which the fleet honours launch specification priorities
+PRIORITIZED_ALLOCATION_STRATEGY = "capacityOptimizedPrioritized"
+
+
+def parse_subnet_ids(subnet_id: str) -> list[str]:
+    """Split a launch specification's comma-separated SubnetId string."""
+    return [s.strip() for s in subnet_id.split(",") if s.strip()]
+
+
+class TtlCache:
+    """Small JSON file cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, path: Optional[str], ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable ranking cache {path}: {e}")
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.time() - entry["time"] > self.ttl:
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = {"time": time.time(), "value": value}
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+
+
+class InstanceTypeRanker:
+    """Rank instance types by spot placement score and spot price across subnets.
+
+    Spot placement scores (1-10, higher means more likely to be fulfilled) are the primary
+    key and the mean current spot price the secondary key. API responses are cached in a
+    TtlCache, and the EC2 client is injected, so ranking can be exercised with recorded
+    responses.
+    """
+
+    def __init__(
+        self,
+        ec2_client,
+        cache: Optional[TtlCache] = None,
+        region_name: Optional[str] = None,
+        product_description: str = "Linux/UNIX",
+    ):
+        self.ec2_client = ec2_client
+        self.cache = cache or TtlCache(None, ttl=0)
+        self.region_name = region_name or getattr(
+            getattr(ec2_client, "meta", None), "region_name", None
+        )
+        self.product_description = product_description
+        self._fetch_lock = threading.Lock()
+
+    def _cached(self, key: str, fetch):
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        # Concurrent launches wait for one fetch instead of all calling EC2
+        with self._fetch_lock:
+            value = self.cache.get(key)
+            if value is None:
+                value = fetch()
+                self.cache.set(key, value)
+        return value
+
+    def subnet_zones(self, subnet_ids: list[str]) -> dict:
+        """Return {subnet_id: {"az": zone name, "az_id": zone ID}}."""
+        def fetch():
+            response = self.ec2_client.describe_subnets(SubnetIds=subnet_ids)
+            return {
+                s["SubnetId"]: {"az": s["AvailabilityZone"], "az_id": s.get("AvailabilityZoneId")}
+                for s in response.get("Subnets", [])
+            }
+        return self._cached(f"subnets:{','.join(sorted(subnet_ids))}", fetch)
+
+    def spot_prices(self, instance_types: list[str]) -> dict:
+        """Return {"<instance type>|<zone name>": current spot price}."""
+        def fetch():
+            prices = {}
+            paginator = self.ec2_client.get_paginator("describe_spot_price_history")
+            now = datetime.now(timezone.utc)
+            for page in paginator.paginate(
+                InstanceTypes=instance_types,
+                ProductDescriptions=[self.product_description],
+                StartTime=now,
+                EndTime=now,
+            ):
+                for record in page.get("SpotPriceHistory", []):
+                    key = f"{record['InstanceType']}|{record['AvailabilityZone']}"
+                    prices.setdefault(key, float(record["SpotPrice"]))
+            return prices
+        return self._cached(
+            f"prices:{self.region_name}:{','.join(sorted(instance_types))}", fetch
+        )
+
+    def placement_scores(self, instance_type: str, target_capacity: int) -> dict:
+        """Return {zone ID: spot placement score} for one instance type in this region.
+
+        Returns an empty dictionary if scores are unavailable (e.g. missing permissions)."""
+        def fetch():
+            try:
+                kwargs = {
+                    "InstanceTypes": [instance_type],
+                    "TargetCapacity": target_capacity,
+                    "SingleAvailabilityZone": True,
+                }
+                if self.region_name:
+                    kwargs["RegionNames"] = [self.region_name]
+                paginator = self.ec2_client.get_paginator("get_spot_placement_scores")
+                scores = {}
+                for page in paginator.paginate(**kwargs):
+                    for score in page.get("SpotPlacementScores", []):
+                        if score.get("AvailabilityZoneId"):
+                            scores[score["AvailabilityZoneId"]] = score["Score"]
+                return scores
+            except botocore.exceptions.ClientError as e:
+                logging.warning(f"Spot placement scores unavailable for {instance_type}: {e}")
+                return {}
+        return self._cached(
+            f"scores:{self.region_name}:{instance_type}:{target_capacity}", fetch
+        )
+
+    def region_scores(
+        self, instance_types: list[str], region_names: list[str], target_capacity: int
+    ) -> dict:
+        """Return {region: spot placement score} of launching any of the instance types.
+
+        Returns an empty dictionary if scores are unavailable (e.g. missing permissions)."""
+        def fetch():
+            try:
+                paginator = self.ec2_client.get_paginator("get_spot_placement_scores")
+                scores = {}
+                for page in paginator.paginate(
+                    InstanceTypes=instance_types,
+                    TargetCapacity=target_capacity,
+                    SingleAvailabilityZone=False,
+                    RegionNames=region_names,
+                ):
+                    for score in page.get("SpotPlacementScores", []):
+                        scores[score["Region"]] = score["Score"]
+                return scores
+            except botocore.exceptions.ClientError as e:
+                logging.warning(f"Spot placement scores unavailable for {region_names}: {e}")
+                return {}
+        return self._cached(
+            f"region_scores:{','.join(sorted(region_names))}:"
+            f"{','.join(sorted(instance_types))}:{target_capacity}",
+            fetch,
+        )
+
+    def best_region(
+        self, instance_types: list[str], region_names: list[str], target_capacity: int = 1
+    ) -> str:
+        """Return the region with the highest spot placement score; ties keep the given order."""
+        scores = self.region_scores(instance_types, region_names, target_capacity)
+        best = max(region_names, key=lambda region: scores.get(region, 0))
+        logging.info(f"Spot placement scores by region: {scores}, launching in {best}")
+        return best
+
+    def rank(
+        self, instance_types: list[str], subnet_ids: list[str], target_capacity: int = 1
+    ) -> list[dict]:
+        """Rank instance types, best first.
+
+        Returns:
+            list[dict]: One entry per instance type with its best placement score, mean
+                spot price and its subnets ordered by placement score then price."""
+        zones = self.subnet_zones(subnet_ids)
+        prices = self.spot_prices(instance_types)
+        ranking = []
+        for order, instance_type in enumerate(instance_types):
+            scores = self.placement_scores(instance_type, target_capacity)
+            subnets = []
+            for subnet_id in subnet_ids:
+                zone = zones.get(subnet_id, {})
+                subnets.append(
+                    {
+                        "subnet_id": subnet_id,
+                        "score": scores.get(zone.get("az_id"), 0),
+                        "price": prices.get(f"{instance_type}|{zone.get('az')}"),
+                    }
+                )
+            subnets.sort(
+                key=lambda s: (-s["score"], s["price"] if s["price"] is not None else float("inf"))
+            )
+            known_prices = [s["price"] for s in subnets if s["price"] is not None]
+            ranking.append(
+                {
+                    "instance_type": instance_type,
+                    "score": max((s["score"] for s in subnets), default=0),
+                    "price": sum(known_prices) / len(known_prices) if known_prices else None,
+                    "subnets": subnets,
+                    "order": order,
+                }
+            )
+        # Ties keep the order the user gave
+        ranking.sort(
+            key=lambda r: (
+                -r["score"],
+                r["price"] if r["price"] is not None else float("inf"),
+                r["order"],
+            )
+        )
+        return ranking
+
+    def apply(
+        self,
+        spot_fleet_config: dict,
+        min_score: int = 0,
+        prioritize: bool = False,
+    ) -> dict:
+        """Reorder and narrow the launch specifications of a fleet config.
+
+        Args:
+            spot_fleet_config (dict): Config with one launch specification per instance type,
+                as built by build_spot_fleet_config. It is not modified.
+            min_score (int): Subnets scoring below this are dropped from a specification,
+                unless that would leave it with none.
+            prioritize (bool): Also set the Priority of the config's LaunchTemplateConfigs
+                overrides from their instance type's rank and switch the fleet to the
+                capacityOptimizedPrioritized allocation strategy. Launch specifications
+                have no Priority, and the strategy only applies to launch template
+                overrides, so configs without them are only reordered.
+
+        Returns:
+            dict: A new config."""
+        spot_fleet_config = copy.deepcopy(spot_fleet_config)
+        specs = spot_fleet_config["LaunchSpecifications"]
+        subnet_ids = parse_subnet_ids(specs[0].get("SubnetId", ""))
+        if not subnet_ids:
+            logging.warning("Launch template has no subnets, not ranking instance types.")
+            return spot_fleet_config
+        specs_by_type = {spec["InstanceType"]: spec for spec in specs}
+        ranking = self.rank(
+            list(specs_by_type), subnet_ids, spot_fleet_config.get("TargetCapacity", 1)
+        )
+
+        ranked_specs = []
+        for rank, entry in enumerate(ranking):
+            spec = specs_by_type[entry["instance_type"]]
+            subnets = [s for s in entry["subnets"] if s["score"] >= min_score] or entry["subnets"]
+            spec["SubnetId"] = ", ".join(s["subnet_id"] for s in subnets)
+            ranked_specs.append(spec)
+            logging.info(
+                f"Ranked {entry['instance_type']} #{rank + 1}: score {entry['score']}, "
+                f"mean spot price {entry['price']}"
+            )
+        spot_fleet_config["LaunchSpecifications"] = ranked_specs
+        if prioritize:
+            overrides = [
+                override
+                for template_config in spot_fleet_config.get("LaunchTemplateConfigs", [])
+                for override in template_config.get("Overrides", [])
+            ]
+            if overrides:
+                ranks = {entry["instance_type"]: rank for rank, entry in enumerate(ranking)}
+                for override in overrides:
+                    rank = ranks.get(override.get("InstanceType"), len(ranks))
+                    override["Priority"] = float(rank)
+                spot_fleet_config["AllocationStrategy"] = PRIORITIZED_ALLOCATION_STRATEGY
+            else:
+                logging.warning(
+                    "Priorities need LaunchTemplateConfigs overrides, only reordering the "
+                    "launch specifications."
+                )
+        return spot_fleet_config
@@ -1,17 +1,40 @@
 import json
-from typing import Optional
+from typing import Callable, Optional
 import tyro
 import dataclasses
-import base64
 import copy
 import tempfile
 import os
 import logging
+import time
 import requests
+import sys
 
 
 import uuid
-import boto3
+import botocore.exceptions
+
+# The AWS clients are shared with the controller and share_ips, whose modules import
+# each other as top-level modules from vibepilot/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibepilot"))
+
+from instance_ranking import DEFAULT_CACHE_PATH, InstanceTypeRanker, TtlCache
+import aws_clients
+from user_data_staging import blob_store_for, encode_user_data
+from user_data_hooks import (
+    INSTANCE_METADATA_PROLOGUE,
+    REPORT_PHASE_FUNCTION,
+    data_cache,
+    interruption_watcher,
+    pool_worker,
+    process_group_body,
+    shard_body,
+    split_shebang,
+    trace_body,
+)
+
+# AMI launched when neither --ami-id nor the template's region mapping names one
+DEFAULT_AMI_ID = "ami-06b5b6fef1daf63ed"
 
 
 @dataclasses.dataclass(kw_only=True)
@@ -34,7 +57,14 @@ class AwsSpotInstanceRequest:
         default_factory=lambda: ["p5.48xlarge", "p5en.48xlarge"]
     )
 
-    ami_id: str = "ami-06b5b6fef1daf63ed"
+    ami_id: Optional[str] = None
+    """AMI to launch. Defaults to the region's ImageId in the launch template's Regions
+    mapping, else to DEFAULT_AMI_ID."""
+
+    region: Optional[str] = None
+    """Region to launch in, one of the launch template's Regions if it has them, or "auto"
+    for the region with the best spot placement score. Defaults to the template's first
+    region, else to the AWS default region."""
 
     key_name: str = "Eltayeb-AWS"
 
@@ -44,6 +74,104 @@ class AwsSpotInstanceRequest:
     """IP/dns address of controller. If supplied request the controller to 
     terminate the fleet when the job is finished."""
 
+    rank_instance_types: bool = False
+    """Reorder instance types and subnets by spot placement score and spot price before
+    launching."""
+    ranking_min_score: int = 0
+    """When ranking, drop subnets whose spot placement score is below this."""
+    ranking_prioritize: bool = False
+    """When ranking, also set the priorities of the launch template's LaunchTemplateConfigs
+    overrides and use the capacityOptimizedPrioritized allocation strategy. Launch
+    specifications have no priority, so they are only reordered."""
+    ranking_cache_ttl: float = 900.0
+    """Seconds to cache spot prices and placement scores for."""
+
+    track_latency: bool = False
+    """Report when the job is submitted, starts its user data and finishes to the
+    controller, so it can serve launch latency statistics. Adds instance metadata and
+    controller calls to the user data. Needs terminate_fleet_on_finish_controller."""
+    wait_for_running: bool = False
+    """After submitting, wait for the fleet to be fulfilled and its instance to be running,
+    and report both times to the controller."""
+    wait_timeout: float = 3600.0
+    """Maximum seconds to wait for the instance to be running."""
+
+    trace_user_data: bool = False
+    """Timestamp every command and "# vibepilot-stage: <name>" marker of the user data and
+    send the trace to the controller when the job ends. Summarise traces with
+    summarize_boot_traces.py."""
+    trace_dir: Optional[str] = None
+    """Directory on shared storage (e.g. /data/boot_traces on EFS) to also save traces to."""
+
+    watch_interruptions: bool = False
+    """Run a watcher next to the user data that polls for spot interruption notices and
+    reports them to the controller as soon as they arrive."""
+    interruption_poll_interval: float = 5.0
+    """Seconds between polls for spot interruption notices."""
+    interruption_signal: Optional[str] = None
+    """Signal (e.g. USR1) to send to the user data's process group on an interruption notice."""
+    interruption_hook: Optional[str] = None
+    """Command to run on an interruption notice, e.g. a checkpoint script."""
+
+    array_size: Optional[int] = None
+    """Launch an array job: one maintain fleet with this many instances, each of which
+    claims a unique shard index from the controller and exports it to the user data as
+    $VIBEPILOT_SHARD_INDEX. Shards of preempted instances are handed out again, and the
+    fleet is terminated once every shard is done."""
+
+    pool: Optional[str] = None
+    """Submit the user data to this warm pool of the controller instead of launching a
+    fleet for it. If the pool does not exist yet, it is launched first."""
+    pool_size: int = 1
+    """Number of instances of a newly launched pool."""
+    pool_min_size: int = 0
+    """The controller autoscales a pool with its queue, down to this many instances."""
+    pool_max_size: Optional[int] = None
+    """The controller autoscales a pool with its queue, up to this many instances.
+    Defaults to pool_size."""
+    pool_setup: Optional[str] = None
+    """Path to a shell script that sets up each instance of a newly launched pool (e.g.
+    installs dependencies) before it starts running jobs."""
+    pool_idle_timeout: Optional[float] = 600.0
+    """Seconds a pool instance waits for a job before it leaves the pool and shuts down.
+    If None, idle instances stay until the pool is cancelled."""
+
+    data_cache: bool = False
+    """Format and mount the instance-store NVMe drives at data_cache_dir and use them as a
+    read-through cache of job data on shared storage (e.g. EFS). Cache hit, miss and
+    transfer stats are printed when the job ends."""
+    data_cache_dir: str = "/mnt/vibepilot_cache"
+    """Where to mount the instance store and keep the cache."""
+    data_cache_inputs: list[str] = dataclasses.field(default_factory=list)
+    """Absolute paths of files or directories on shared storage to prefetch into the cache
+    before the user data runs. The user data finds them at $VIBEPILOT_DATA_CACHE/view<path>,
+    or with $(vibepilot_cached <path>)."""
+    data_cache_parallelism: int = 16
+    """Files prefetched at the same time."""
+    data_cache_efs: Optional[str] = None
+    """EFS file system ID to mount at data_cache_efs_mount before prefetching."""
+    data_cache_efs_mount: str = "/data"
+    """Where to mount data_cache_efs."""
+    checkpoint_dir: Optional[str] = None
+    """Directory on shared storage to restore into $VIBEPILOT_CHECKPOINT_DIR, on the instance
+    store, before the user data runs. Checkpoints saved there are written back in the
+    background and when the user data finishes. Needs data_cache."""
+    checkpoint_interval: float = 60.0
+    """Seconds between background checkpoint write-backs."""
+
+    compress_user_data: bool = True
+    """Gzip the user data. cloud-init decompresses it before running it."""
+    user_data_stage: Optional[str] = None
+    """Where to stage user data that is still over EC2's 16 KB limit: a directory (e.g. on
+    EFS) or s3://bucket/prefix. Instances then get a small bootstrap that fetches the
+    script, checks its SHA-256 and runs it. Staged scripts are reused by hash."""
+    user_data_stage_url: Optional[str] = None
+    """URL instances fetch blobs staged in a directory from. Defaults to file://<dir>."""
+    user_data_stage_efs: Optional[str] = None
+    """EFS file system ID the bootstrap mounts before fetching from a staging directory."""
+    s3_endpoint_url: Optional[str] = None
+    """Endpoint of an S3-compatible store to stage user data in, instead of AWS S3."""
+
     def __post_init__(self):
         if not self.launch_template.endswith(".json"):
             raise ValueError("Launch template path must be a JSON file.")
@@ -64,6 +192,34 @@ class AwsSpotInstanceRequest:
                 "This does not make sense and fleet will terminate on shutdown anyway."
             )
 
+        if self.array_size is not None:
+            assert self.array_size > 0, "array_size must be positive."
+            assert (
+                self.terminate_fleet_on_finish_controller
+            ), "Array jobs need a controller to hand out shards."
+            if self.fleet_type != "maintain":
+                # Only maintain fleets replace preempted instances, whose shards would
+                # otherwise never finish
+                logging.warning("Array jobs run on maintain fleets, switching fleet type.")
+                self.fleet_type = "maintain"
+
+        if self.pool is not None:
+            assert self.pool_size > 0, "pool_size must be positive."
+            assert (
+                self.terminate_fleet_on_finish_controller
+            ), "Warm pools are held by a controller."
+            assert self.array_size is None, "Array jobs cannot be submitted to a pool."
+            if self.fleet_type != "maintain":
+                logging.warning("Warm pools run on maintain fleets, switching fleet type.")
+                self.fleet_type = "maintain"
+
+        if self.data_cache_inputs or self.checkpoint_dir:
+            assert self.data_cache, "data_cache_inputs and checkpoint_dir need data_cache."
+        assert all(
+            os.path.isabs(path) for path in self.data_cache_inputs
+        ), "data_cache_inputs must be absolute paths on the instance."
+        assert self.data_cache_parallelism > 0, "data_cache_parallelism must be positive."
+
         if not self.shutdown_on_finish:
             logging.warning(
                 "Shutdown on finish is set to False. This means the instance will not shut down "
@@ -76,6 +232,23 @@ def preprocess_user_data(
     terminate_fleet_on_finish_controller: Optional[str],
     shutdown_on_finish: bool,
     job_uuid: str,
+    track_latency: bool = False,
+    trace_user_data: bool = False,
+    trace_dir: Optional[str] = None,
+    watch_interruptions: bool = False,
+    interruption_poll_interval: float = 5.0,
+    interruption_signal: Optional[str] = None,
+    interruption_hook: Optional[str] = None,
+    array_size: Optional[int] = None,
+    pool: Optional[str] = None,
+    pool_idle_timeout: Optional[float] = None,
+    data_cache_dir: Optional[str] = None,
+    data_cache_inputs: Optional[list] = None,
+    data_cache_parallelism: int = 16,
+    data_cache_efs: Optional[str] = None,
+    data_cache_efs_mount: str = "/data",
+    checkpoint_dir: Optional[str] = None,
+    checkpoint_interval: float = 60.0,
 ) -> str:
     """Preprocess the user data script to add termination commands.
 
@@ -85,9 +258,96 @@ def preprocess_user_data(
             a command to request fleet termination will be added to the end script.
         shutdown_on_finish (bool): If True, a command to shut down the instance will be added to
             the end of the script.
+        job_uuid (str): The UUID the job is registered under with the controller.
+        track_latency (bool): If True and a controller is provided, report to the controller when
+            the user script starts and when it finishes.
+        trace_user_data (bool): If True, timestamp every command and every
+            "# vibepilot-stage: <name>" marker of the user script, and send the trace to the
+            controller (if provided) and/or copy it to trace_dir when the script finishes.
+        trace_dir (str): Directory on shared storage (e.g. EFS) to save traces to.
+        watch_interruptions (bool): If True, run a watcher next to the user script that polls
+            for spot interruption notices, reports them to the controller (if provided) and
+            runs interruption_hook and/or sends interruption_signal to the script's process
+            group.
+        interruption_poll_interval (float): Seconds between polls for interruption notices.
+        interruption_signal (str): Signal to send on an interruption notice, e.g. USR1.
+        interruption_hook (str): Command to run on an interruption notice.
+        array_size (int): If provided, the job is an array job with this many shards. Every
+            instance claims a shard from the controller before running the script, which
+            sees it as $VIBEPILOT_SHARD_INDEX (and the count as $VIBEPILOT_SHARD_COUNT), and
+            reports it done afterwards. Requires a controller.
+        pool (str): If provided, the script sets up an instance of this warm pool, which
+            then runs the pool's queued jobs one after another. The controller cancels the
+            fleet when its last instance leaves, so no termination request is added.
+        pool_idle_timeout (float): Seconds a pool instance waits for a job before it leaves
+            the pool. If None, idle instances stay until the pool is cancelled.
+        data_cache_dir (str): If provided, mount the instance-store NVMe drives here as a
+            read-through cache of shared storage, and print its stats when the script ends.
+        data_cache_inputs (list): Files or directories on shared storage to prefetch into
+            the cache before the script runs.
+        data_cache_parallelism (int): Files prefetched at the same time.
+        data_cache_efs (str): EFS file system to mount at data_cache_efs_mount first.
+        data_cache_efs_mount (str): Where to mount data_cache_efs.
+        checkpoint_dir (str): Directory on shared storage restored into the script's
+            $VIBEPILOT_CHECKPOINT_DIR, which is written back to it every
+            checkpoint_interval seconds and when the script finishes.
+        checkpoint_interval (float): Seconds between checkpoint write-backs.
 
     Assumes user data is a bash script."""
-    if terminate_fleet_on_finish_controller:
+    shebang, body = split_shebang(user_data)
+    prologue, epilogue = [], []
+    controller = terminate_fleet_on_finish_controller
+    track_latency = track_latency and bool(controller)
+    if track_latency or trace_user_data or watch_interruptions or array_size or pool:
+        prologue.append(INSTANCE_METADATA_PROLOGUE)
+    if data_cache_dir:
+        # The cache is flushed before anything reports the job finished
+        cache_prologue, cache_epilogue = data_cache(
+            data_cache_dir,
+            data_cache_inputs or [],
+            data_cache_parallelism,
+            checkpoint_dir,
+            checkpoint_interval,
+            data_cache_efs,
+            data_cache_efs_mount,
+        )
+        prologue += cache_prologue
+        epilogue += cache_epilogue
+    if controller and (track_latency or watch_interruptions):
+        prologue.append(REPORT_PHASE_FUNCTION.format(controller=controller, job_uuid=job_uuid))
+    if track_latency:
+        prologue.append("vibepilot_report_phase user_data_started")
+    if watch_interruptions:
+        watcher_prologue, watcher_epilogue = interruption_watcher(
+            interruption_poll_interval,
+            interruption_signal,
+            interruption_hook,
+            report=bool(controller),
+        )
+        prologue += watcher_prologue
+        epilogue += watcher_epilogue
+    if track_latency:
+        epilogue.append("vibepilot_report_phase job_finished")
+    if trace_user_data:
+        trace_prologue, body, trace_epilogue = trace_body(
+            body, job_uuid, terminate_fleet_on_finish_controller, trace_dir
+        )
+        prologue += trace_prologue
+        epilogue += trace_epilogue
+    if array_size:
+        shard_prologue, body, shard_epilogue = shard_body(
+            body, job_uuid, controller, array_size
+        )
+        prologue += shard_prologue
+        epilogue += shard_epilogue
+    if watch_interruptions and interruption_signal:
+        body = process_group_body(body, interruption_signal)
+    if pool:
+        epilogue = pool_worker(controller, pool, pool_idle_timeout) + epilogue
+
+    user_data = "\n".join([line for line in [shebang] if line] + prologue + [body] + epilogue)
+
+    if terminate_fleet_on_finish_controller and not pool:
         terminate_command = (
             f"wget {terminate_fleet_on_finish_controller}/terminate_fleet/{job_uuid}"
         )
@@ -114,6 +374,7 @@ def preprocess_user_data(
 
 def check_termination_controller_status(
     terminate_fleet_on_finish_controller: Optional[str] = None,
+    session: Optional[requests.Session] = None,
 ) -> bool:
     """Check the status of the termination controller."""
     if terminate_fleet_on_finish_controller is None:
@@ -124,7 +385,7 @@ def check_termination_controller_status(
         f"Checking termination controller status at {terminate_fleet_on_finish_controller}"
     )
     try:
-        response = requests.get(terminate_fleet_on_finish_controller + "/status")
+        response = (session or requests).get(terminate_fleet_on_finish_controller + "/status")
         if response.status_code == 200:
             return True
         else:
@@ -134,52 +395,115 @@ def check_termination_controller_status(
         return False
 
 
-if __name__ == "__main__":
-    args = tyro.cli(AwsSpotInstanceRequest)
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-    )
 
+def target_capacity(args: AwsSpotInstanceRequest, launch_template: dict) -> int:
+    if args.array_size:
+        return args.array_size
+    if args.pool:
+        return args.pool_size
+    return launch_template.get("TargetCapacity", 1)
 
-    with open(args.user_data, "r") as f:
-        user_data = f.read()
 
-    with open(args.launch_template, "r") as f:
-        launch_template = json.load(f)
-
-    job_uuid = str(uuid.uuid4())
+def select_region(
+    args: AwsSpotInstanceRequest,
+    launch_template: dict,
+    ranker: Optional[InstanceTypeRanker] = None,
+) -> Optional[str]:
+    """Return the region to launch a request in, or None for the AWS default region.
 
-    if check_termination_controller_status(
-        args.terminate_fleet_on_finish_controller
-    ):
-        logging.info(
-            f"Termination controller at {args.terminate_fleet_on_finish_controller} is reachable."
+    Args:
+        args (AwsSpotInstanceRequest): The launch request.
+        launch_template (dict): The parsed launch template, with an optional "Regions"
+            mapping of region to its SubnetIds, ImageId and SecurityGroupIds.
+        ranker (InstanceTypeRanker): Ranker to score the regions with when args.region is
+            "auto". One on the first region's shared EC2 client is created if None."""
+    regions = list(launch_template.get("Regions", {}))
+    if args.region == "auto":
+        if not regions:
+            raise ValueError('region "auto" needs a launch template with Regions.')
+        ranker = ranker or InstanceTypeRanker(
+            aws_clients.ec2_client(regions[0]),
+            TtlCache(DEFAULT_CACHE_PATH, args.ranking_cache_ttl),
         )
-    else:
-        logging.error(
-            f"Termination controller at {args.terminate_fleet_on_finish_controller} is not reachable. "
-            "Exiting without launching the fleet."
+        return ranker.best_region(
+            args.instance_types, regions, target_capacity(args, launch_template)
+        )
+    if args.region and regions and args.region not in regions:
+        raise ValueError(
+            f"Region {args.region} is not in the launch template's Regions {regions}."
         )
-        exit(1)
+    return args.region or (regions[0] if regions else None)
 
+
+def build_spot_fleet_config(
+    args: AwsSpotInstanceRequest,
+    launch_template: dict,
+    user_data: str,
+    job_uuid: str,
+    region: Optional[str] = None,
+) -> dict:
+    """Build the SpotFleetRequestConfig for a single job.
+
+    Args:
+        args (AwsSpotInstanceRequest): The launch request.
+        launch_template (dict): The parsed launch template. It is not modified.
+        user_data (str): The raw user data script.
+        job_uuid (str): The UUID the job is registered under with the controller.
+        region (str): Region whose subnets, AMI and security groups from the template's
+            Regions mapping are used. Defaults to the template's first region.
+
+    Returns:
+        dict: A new launch template with user data, instance types and tags filled in."""
+    launch_template = copy.deepcopy(launch_template)
+    regions = launch_template.pop("Regions", None) or {}
+    image_id = None
+    if regions:
+        region_config = regions[region or next(iter(regions))]
+        spec = launch_template["LaunchSpecifications"][0]
+        spec["SubnetId"] = ", ".join(region_config["SubnetIds"])
+        if region_config.get("SecurityGroupIds"):
+            spec["SecurityGroups"] = [
+                {"GroupId": group_id} for group_id in region_config["SecurityGroupIds"]
+            ]
+        image_id = region_config.get("ImageId")
     user_data = preprocess_user_data(
         user_data,
         args.terminate_fleet_on_finish_controller,
         args.shutdown_on_finish,
         job_uuid=job_uuid,
+        track_latency=args.track_latency,
+        trace_user_data=args.trace_user_data,
+        trace_dir=args.trace_dir,
+        watch_interruptions=args.watch_interruptions,
+        interruption_poll_interval=args.interruption_poll_interval,
+        interruption_signal=args.interruption_signal,
+        interruption_hook=args.interruption_hook,
+        array_size=args.array_size,
+        pool=args.pool,
+        pool_idle_timeout=args.pool_idle_timeout,
+        data_cache_dir=args.data_cache_dir if args.data_cache else None,
+        data_cache_inputs=args.data_cache_inputs,
+        data_cache_parallelism=args.data_cache_parallelism,
+        data_cache_efs=args.data_cache_efs,
+        data_cache_efs_mount=args.data_cache_efs_mount,
+        checkpoint_dir=args.checkpoint_dir,
+        checkpoint_interval=args.checkpoint_interval,
     )
-    user_data_b64 = base64.b64encode(user_data.encode("utf-8"))
-
-    # Remove padding from base64 string
-    while user_data_b64.endswith(b"="):
-        user_data_b64 = user_data_b64[:-1]
-
-    launch_template["LaunchSpecifications"][0]["UserData"] = user_data_b64.decode(
-        "utf-8"
+    blob_store = None
+    if args.user_data_stage:
+        blob_store = blob_store_for(
+            args.user_data_stage,
+            args.user_data_stage_url,
+            args.user_data_stage_efs,
+            args.s3_endpoint_url,
+        )
+    launch_template["LaunchSpecifications"][0]["UserData"] = encode_user_data(
+        user_data, compress=args.compress_user_data, blob_store=blob_store
     )
     launch_template["LaunchSpecifications"][0]["InstanceType"] = args.instance_types[0]
-    launch_template["LaunchSpecifications"][0]["ImageId"] = args.ami_id
+    launch_template["LaunchSpecifications"][0]["ImageId"] = (
+        args.ami_id or image_id or DEFAULT_AMI_ID
+    )
     launch_template["LaunchSpecifications"][0]["KeyName"] = args.key_name
 
     launch_template["LaunchSpecifications"][0]["TagSpecifications"][0]["Tags"].append(
@@ -196,34 +520,380 @@ if __name__ == "__main__":
         launch_template["LaunchSpecifications"].append(new_launch_spec)
 
     launch_template["Type"] = args.fleet_type
+    launch_template["TargetCapacity"] = target_capacity(args, launch_template)
+    return launch_template
+
+
+def request_spot_fleet(ec2_client, spot_fleet_config: dict) -> str:
+    """Submit a spot fleet request.
+
+    Throttled requests are retried by the shared clients' adaptive retry mode (see
+    aws_clients), which also paces every thread that shares a client.
+
+    Args:
+        ec2_client: A boto3 EC2 client (or a stub with the same interface).
+        spot_fleet_config (dict): The SpotFleetRequestConfig to submit.
+
+    Returns:
+        str: The spot fleet request ID."""
+    response = ec2_client.request_spot_fleet(SpotFleetRequestConfig=spot_fleet_config)
+    return response["SpotFleetRequestId"]
+
+
+def report_job_event(
+    controller: str,
+    job_uuid: str,
+    phase: str,
+    timestamp: Optional[float] = None,
+    instance_type: Optional[str] = None,
+    availability_zone: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> None:
+    """Record the time a job reached a phase with the controller. Errors are logged only."""
+    params = {"ts": timestamp if timestamp is not None else time.time()}
+    if instance_type:
+        params["instance_type"] = instance_type
+    if availability_zone:
+        params["availability_zone"] = availability_zone
+    try:
+        response = (session or requests).get(
+            f"{controller}/job_event/{job_uuid}/{phase}", params=params
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error reporting phase {phase} of job {job_uuid}: {e}")
+
+
+def submit_pool_job(
+    controller: str,
+    pool: str,
+    script: str,
+    job_uuid: str,
+    session: Optional[requests.Session] = None,
+) -> Optional[dict]:
+    """Queue a script as a job of a warm pool.
+
+    Returns:
+        Optional[dict]: The controller's response, or None if it has no such pool."""
+    response = (session or requests).post(
+        f"{controller}/pools/{pool}/jobs",
+        params={"uuid": job_uuid},
+        data=script.encode("utf-8"),
+        headers={"Content-Type": "text/plain"},
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def register_pool(
+    controller: str,
+    pool: str,
+    fleet_id: str,
+    job_uuid: str,
+    target_capacity: int,
+    idle_timeout: Optional[float],
+    min_capacity: int = 0,
+    max_capacity: Optional[int] = None,
+    session: Optional[requests.Session] = None,
+    region: Optional[str] = None,
+) -> bool:
+    """Register a newly launched warm pool. Returns False if the pool already exists."""
+    response = (session or requests).post(
+        f"{controller}/pools/{pool}",
+        json={
+            "fleet_id": fleet_id,
+            "job_uuid": job_uuid,
+            "target_capacity": target_capacity,
+            "idle_timeout": idle_timeout,
+            "min_capacity": min_capacity,
+            "max_capacity": max_capacity,
+            "region": region,
+        },
+    )
+    if response.status_code == 409:
+        return False
+    response.raise_for_status()
+    return True
+
+
+def wait_for_fleet_instance(
+    ec2_client,
+    fleet_id: str,
+    timeout: float = 3600.0,
+    initial_delay: float = 2.0,
+    max_delay: float = 30.0,
+) -> dict:
+    """Poll a fleet, with exponential backoff, until its first instance is running.
+
+    Returns:
+        dict: instance_id, instance_type, availability_zone and the times (epoch seconds)
+            the fleet was seen fulfilled and the instance running. Phases not reached
+            before the timeout are None."""
+    deadline = time.time() + timeout
+    delay = initial_delay
+    result = {
+        "instance_id": None,
+        "instance_type": None,
+        "availability_zone": None,
+        "fulfilled": None,
+        "running": None,
+    }
+    while time.time() < deadline:
+        if result["instance_id"] is None:
+            response = ec2_client.describe_spot_fleet_instances(SpotFleetRequestId=fleet_id)
+            instances = response.get("ActiveInstances", [])
+            if instances:
+                result["fulfilled"] = time.time()
+                result["instance_id"] = instances[0]["InstanceId"]
+                result["instance_type"] = instances[0].get("InstanceType")
+                logging.info(f"Fleet {fleet_id} fulfilled with {result['instance_id']}")
+                delay = initial_delay
+                continue
+        else:
+            try:
+                response = ec2_client.describe_instances(InstanceIds=[result["instance_id"]])
+            except botocore.exceptions.ClientError as e:
+                # A new instance can be unknown to DescribeInstances for a while
+                if e.response.get("Error", {}).get("Code") != "InvalidInstanceID.NotFound":
+                    raise
+                logging.info(f"Instance {result['instance_id']} is not visible yet")
+                response = {}
+            for reservation in response.get("Reservations", []):
+                for instance in reservation.get("Instances", []):
+                    result["availability_zone"] = instance.get("Placement", {}).get(
+                        "AvailabilityZone"
+                    )
+                    if instance.get("State", {}).get("Name") == "running":
+                        result["running"] = time.time()
+            if result["running"] is not None:
+                logging.info(f"Instance {result['instance_id']} is running")
+                return result
+        time.sleep(min(delay, max(0.0, deadline - time.time())))
+        delay = min(max_delay, delay * 2)
+    logging.warning(f"Timed out waiting for fleet {fleet_id} to be running")
+    return result
+
+
+def prepare_spot_fleet_config(
+    args: AwsSpotInstanceRequest,
+    launch_template: dict,
+    user_data: str,
+    job_uuid: str,
+    ranking_cache: Optional[TtlCache] = None,
+):
+    """Pick the region of a request and build its spot fleet config, ranking its instance
+    types if asked to.
+
+    Args:
+        args (AwsSpotInstanceRequest): The launch request.
+        launch_template (dict): The parsed launch template. It is not modified.
+        user_data (str): The raw user data script.
+        job_uuid (str): The UUID the instances report to the controller under.
+        ranking_cache (TtlCache): Cache of spot prices and placement scores to rank with.
+            Regions are only ranked with a cache, and one at DEFAULT_CACHE_PATH is read to
+            rank instance types if None.
+
+    Returns:
+        (dict, EC2 client): The spot fleet config and the EC2 client of its region."""
+    region_ranker = None
+    if ranking_cache is not None and args.region == "auto" and launch_template.get("Regions"):
+        region_ranker = InstanceTypeRanker(
+            aws_clients.ec2_client(next(iter(launch_template["Regions"]))), ranking_cache
+        )
+    region = select_region(args, launch_template, ranker=region_ranker)
+    spot_fleet_config = build_spot_fleet_config(
+        args, launch_template, user_data, job_uuid=job_uuid, region=region
+    )
+    ec2_client = aws_clients.ec2_client(region)
+    if args.rank_instance_types:
+        ranker = InstanceTypeRanker(
+            ec2_client, ranking_cache or TtlCache(DEFAULT_CACHE_PATH, args.ranking_cache_ttl)
+        )
+        spot_fleet_config = ranker.apply(
+            spot_fleet_config,
+            min_score=args.ranking_min_score,
+            prioritize=args.ranking_prioritize,
+        )
+    return spot_fleet_config, ec2_client
+
+
+def launch(
+    args: AwsSpotInstanceRequest,
+    launch_template: dict,
+    user_data: str,
+    session: Optional[requests.Session] = None,
+    out: Callable[[str], None] = print,
+    controller_reachable: Callable[[Optional[str]], bool] = check_termination_controller_status,
+    ranking_cache: Optional[TtlCache] = None,
+) -> int:
+    """Launch a request, or queue it on its warm pool, as the command line does.
+
+    Args:
+        args (AwsSpotInstanceRequest): The launch request.
+        launch_template (dict): The parsed launch template. It is not modified.
+        user_data (str): The raw user data script.
+        session (requests.Session): Session used to talk to the controller.
+        out (Callable[[str], None]): Prints the command line's output.
+        controller_reachable (Callable[[str], bool]): Checks the controller is up.
+        ranking_cache (TtlCache): Cache of spot prices and placement scores to rank with.
+            One at DEFAULT_CACHE_PATH is read if None.
+
+    Returns:
+        int: The exit code of the command line."""
+    session = session or requests.Session()
+    job_uuid = str(uuid.uuid4())
+
+    if controller_reachable(args.terminate_fleet_on_finish_controller):
+        logging.info(
+            f"Termination controller at {args.terminate_fleet_on_finish_controller} is reachable."
+        )
+    else:
+        logging.error(
+            f"Termination controller at {args.terminate_fleet_on_finish_controller} is not reachable. "
+            "Exiting without launching the fleet."
+        )
+        return 1
+
+    if args.pool:
+        controller = args.terminate_fleet_on_finish_controller
+        job = submit_pool_job(controller, args.pool, user_data, job_uuid, session=session)
+        if job is None:
+            logging.info(
+                f"Pool {args.pool} does not exist, launching it with {args.pool_size} instances"
+            )
+            setup_script = "#!/bin/bash\n"
+            if args.pool_setup:
+                with open(args.pool_setup, "r") as f:
+                    setup_script = f.read()
+            pool_uuid = str(uuid.uuid4())
+            launch_template, ec2_client = prepare_spot_fleet_config(
+                args, launch_template, setup_script, pool_uuid, ranking_cache
+            )
+            fleet_id = request_spot_fleet(ec2_client, launch_template)
+            out(
+                f"Pool {args.pool} launched as spot fleet {fleet_id} "
+                f"in {ec2_client.meta.region_name}"
+            )
+            try:
+                registered = register_pool(
+                    controller,
+                    args.pool,
+                    fleet_id,
+                    pool_uuid,
+                    args.pool_size,
+                    args.pool_idle_timeout,
+                    args.pool_min_size,
+                    args.pool_max_size,
+                    session=session,
+                    region=ec2_client.meta.region_name,
+                )
+            except requests.exceptions.RequestException as e:
+                # Nothing would ever stop a pool the controller does not know about
+                logging.error(
+                    f"Error registering pool {args.pool}, cancelling fleet {fleet_id}: {e}"
+                )
+                ec2_client.cancel_spot_fleet_requests(
+                    SpotFleetRequestIds=[fleet_id], TerminateInstances=True
+                )
+                return 1
+            if not registered:
+                logging.warning(
+                    f"Pool {args.pool} was launched concurrently, cancelling fleet {fleet_id}"
+                )
+                ec2_client.cancel_spot_fleet_requests(
+                    SpotFleetRequestIds=[fleet_id], TerminateInstances=True
+                )
+            job = submit_pool_job(controller, args.pool, user_data, job_uuid, session=session)
+            if job is None:
+                logging.error(f"Pool {args.pool} is gone, job {job_uuid} was not queued")
+                return 1
+        out(f"Job {job_uuid} queued on pool {args.pool} at position {job['position']}")
+        out(f"Track it at: {controller}/pool_jobs/{job_uuid}")
+        return 0
+
+    launch_template, ec2_client = prepare_spot_fleet_config(
+        args, launch_template, user_data, job_uuid, ranking_cache
+    )
+    region = ec2_client.meta.region_name
 
     tmpdir = tempfile.mkdtemp()
     final_launch_template_path = os.path.join(tmpdir, "launch_template.json")
     with open(os.path.join(tmpdir, "launch_template.json"), "w") as f:
         json.dump(launch_template, f, indent=4)
-    print(f"Final launch template: {final_launch_template_path}")
-
-    ec2_client = boto3.client("ec2")
+    out(f"Final launch template: {final_launch_template_path}")
 
-    response = ec2_client.request_spot_fleet(SpotFleetRequestConfig=launch_template)
-    print("Spot fleet request submitted successfully.")
-    fleet_id = response["SpotFleetRequestId"]
-    print(f"Spot fleet request ID: {fleet_id}")
+    submitted_at = time.time()
+    fleet_id = request_spot_fleet(ec2_client, launch_template)
+    out("Spot fleet request submitted successfully.")
+    out(f"Spot fleet request ID: {fleet_id}")
+    out(f"Region: {region}")
 
     if args.terminate_fleet_on_finish_controller:
-        print(
+        out(
             f"Terminate fleet on finish controller: {args.terminate_fleet_on_finish_controller}"
         )
         addresss = f"{args.terminate_fleet_on_finish_controller}/register_job/{job_uuid}/{fleet_id}"
-        # Ensure 'requests' is imported at the top of the file: import requests
+        addresss += f"?region={region}"
+        if args.array_size:
+            addresss += f"&shards={args.array_size}"
         try:
-            print(f"Sending GET request to: {addresss}")
-            response = requests.get(addresss)
+            out(f"Sending GET request to: {addresss}")
+            response = session.get(addresss)
             response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            print(f"Controller response status: {response.status_code}")
-            print(f"Controller response body: {response.text}")
+            out(f"Controller response status: {response.status_code}")
+            out(f"Controller response body: {response.text}")
         except requests.exceptions.RequestException as e:
-            print(f"Error sending request to controller: {e}")
+            out(f"Error sending request to controller: {e}")
+
+        out(f"Job UUID: {job_uuid}")
+        out(f"Register job address: {addresss}")
+
+        if args.track_latency:
+            report_job_event(
+                args.terminate_fleet_on_finish_controller,
+                job_uuid,
+                "submitted",
+                submitted_at,
+                session=session,
+            )
+
+    if args.wait_for_running:
+        out(f"Waiting for fleet {fleet_id} to be running...")
+        instance = wait_for_fleet_instance(
+            ec2_client, fleet_id, timeout=args.wait_timeout
+        )
+        for phase in ["fulfilled", "running"]:
+            if instance[phase] is None:
+                continue
+            out(f"{phase.capitalize()} after {instance[phase] - submitted_at:.1f}s")
+            if args.terminate_fleet_on_finish_controller and args.track_latency:
+                report_job_event(
+                    args.terminate_fleet_on_finish_controller,
+                    job_uuid,
+                    phase,
+                    instance[phase],
+                    instance_type=instance["instance_type"],
+                    availability_zone=instance["availability_zone"],
+                    session=session,
+                )
+        out(f"Instance ID: {instance['instance_id']}")
+    return 0
+
+
+if __name__ == "__main__":
+    args = tyro.cli(AwsSpotInstanceRequest)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+
+    with open(args.user_data, "r") as f:
+        user_data = f.read()
+
+    with open(args.launch_template, "r") as f:
+        launch_template = json.load(f)
 
-        print(f"Job UUID: {job_uuid}")
-        print(f"Register job address: {addresss}")
+    exit(launch(args, launch_template, user_data))
@@ -0,0 +1,299 @@
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+import requests
+import tyro
+import yaml
+
+# For aws_clients, as in launch_aws_spot_fleet
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibepilot"))
+
+from instance_ranking import DEFAULT_CACHE_PATH, InstanceTypeRanker, TtlCache
+from launch_aws_spot_fleet import (
+    AwsSpotInstanceRequest,
+    build_spot_fleet_config,
+    check_termination_controller_status,
+    request_spot_fleet,
+    select_region,
+)
+import aws_clients
+
+
+@dataclasses.dataclass(kw_only=True)
+class AwsSpotBatchRequest:
+    """Launch many spot fleets at once from a manifest."""
+
+    manifest: str
+    """Path to the manifest. Either a JSONL file with one AwsSpotInstanceRequest per line,
+    or a YAML file with a list of requests or a mapping with "defaults" and "jobs" keys."""
+
+    results: str = "batch_results.jsonl"
+    """Path of the JSONL file to write one result per job to."""
+
+    max_workers: int = 16
+    """Maximum number of spot fleet requests in flight at the same time."""
+
+    def __post_init__(self):
+        if not self.manifest.endswith((".jsonl", ".yaml", ".yml")):
+            raise ValueError("Manifest path must be a JSONL or YAML file.")
+        assert self.max_workers > 0, "max_workers must be positive."
+
+
+def load_manifest(manifest_path: str) -> list[AwsSpotInstanceRequest]:
+    """Load the job requests in a manifest.
+
+    Args:
+        manifest_path (str): Path to a JSONL or YAML manifest.
+
+    Returns:
+        list[AwsSpotInstanceRequest]: One request per job, in manifest order."""
+    with open(manifest_path, "r") as f:
+        if manifest_path.endswith(".jsonl"):
+            defaults = {}
+            jobs = [json.loads(line) for line in f if line.strip()]
+        else:
+            manifest = yaml.safe_load(f) or []
+            if isinstance(manifest, dict):
+                defaults = manifest.get("defaults", {})
+                jobs = manifest.get("jobs", [])
+            else:
+                defaults = {}
+                jobs = manifest
+    return [AwsSpotInstanceRequest(**{**defaults, **job}) for job in jobs]
+
+
+def register_jobs_with_controller(
+    controller: str, jobs: list[dict], session: Optional[requests.Session] = None
+) -> None:
+    """Register many (job UUID, fleet ID) pairs with the controller in one request.
+
+    Each job's submission time is sent along, so the controller can track launch latency,
+    and so are the number of shards of array jobs and the region of every fleet."""
+    session = session or requests.Session()
+    response = session.post(
+        f"{controller}/register_jobs",
+        json={
+            "jobs": [
+                {
+                    "uuid": j["job_uuid"],
+                    "fleet_id": j["fleet_id"],
+                    "submitted_at": j.get("submitted_at"),
+                    "shards": j.get("shards"),
+                    "region": j.get("region"),
+                }
+                for j in jobs
+            ]
+        },
+    )
+    response.raise_for_status()
+
+
+def launch_batch(
+    job_requests: list[AwsSpotInstanceRequest],
+    ec2_client=None,
+    max_workers: int = 16,
+    session: Optional[requests.Session] = None,
+) -> list[dict]:
+    """Launch one spot fleet per request through a bounded worker pool.
+
+    The jobs are split into one contiguous chunk per worker. A worker requests the fleets of
+    its chunk and then registers them with their controller in one request, so the fleets are
+    known to the controller long before their instances boot and call it. If that request
+    fails, every fleet of the chunk is cancelled, so no instance runs unknown to the
+    controller. Template and user data files are read once per path and every controller is
+    checked once. Jobs are launched in the region select_region picks for them, through the
+    shared EC2 client of that region. Jobs that name a pool or ask to wait for their instance
+    fail without launching.
+
+    Args:
+        job_requests (list[AwsSpotInstanceRequest]): The jobs to launch.
+        ec2_client: An EC2 client (or a stub with the same interface) used for every region
+            instead of the shared clients.
+        max_workers (int): Maximum number of spot fleet requests in flight.
+        session (requests.Session): Session used to talk to the controllers.
+
+    Returns:
+        list[dict]: One result per job, in input order, with the job UUID, the fleet ID and
+            the region and the error if the job failed."""
+    session = session or requests.Session()
+    results = [
+        {
+            "index": i,
+            "instance_name": job.instance_name,
+            "job_uuid": str(uuid.uuid4()),
+            "fleet_id": None,
+            "submitted_at": None,
+            "shards": job.array_size,
+            "region": None,
+            "error": None,
+        }
+        for i, job in enumerate(job_requests)
+    ]
+
+    controllers = {j.terminate_fleet_on_finish_controller for j in job_requests}
+    reachable = {c: check_termination_controller_status(c) for c in controllers}
+
+    files = {}
+    files_lock = threading.Lock()
+    # One ranking cache for the whole batch, so jobs with the same instance types share lookups
+    ranking_ttl = max((j.ranking_cache_ttl for j in job_requests), default=0)
+    ranking_cache = TtlCache(DEFAULT_CACHE_PATH, ranking_ttl)
+    rankers = {}
+
+    def region_client(region: Optional[str]):
+        return ec2_client or aws_clients.ec2_client(region)
+
+    def ranker_for(region: Optional[str]) -> InstanceTypeRanker:
+        with files_lock:
+            if region not in rankers:
+                rankers[region] = InstanceTypeRanker(
+                    region_client(region), ranking_cache, region_name=region
+                )
+            return rankers[region]
+
+    def read_file(path: str, parse_json: bool):
+        with files_lock:
+            if path not in files:
+                with open(path, "r") as f:
+                    files[path] = json.load(f) if parse_json else f.read()
+            return files[path]
+
+    def launch(job: AwsSpotInstanceRequest, result: dict) -> str:
+        if job.pool:
+            # A batch launches one fleet per job, which is not how pools run their jobs
+            raise ValueError(
+                f"Job {result['index']} names pool {job.pool}, but batches cannot queue pool "
+                "jobs. Submit it with launch_aws_spot_fleet.py --pool instead."
+            )
+        if job.wait_for_running:
+            raise ValueError(
+                f"Job {result['index']} sets wait_for_running, which batches do not support. "
+                "Submit it with launch_aws_spot_fleet.py instead."
+            )
+        if not reachable[job.terminate_fleet_on_finish_controller]:
+            raise RuntimeError(
+                f"Termination controller at {job.terminate_fleet_on_finish_controller} "
+                "is not reachable."
+            )
+        launch_template = read_file(job.launch_template, parse_json=True)
+        regions = list(launch_template.get("Regions", {}))
+        region = select_region(
+            job, launch_template, ranker_for(regions[0]) if regions else None
+        )
+        spot_fleet_config = build_spot_fleet_config(
+            job,
+            launch_template,
+            read_file(job.user_data, parse_json=False),
+            job_uuid=result["job_uuid"],
+            region=region,
+        )
+        result["region"] = region or region_client(region).meta.region_name
+        if job.rank_instance_types:
+            spot_fleet_config = ranker_for(region).apply(
+                spot_fleet_config,
+                min_score=job.ranking_min_score,
+                prioritize=job.ranking_prioritize,
+            )
+        result["submitted_at"] = time.time()
+        fleet_id = request_spot_fleet(region_client(region), spot_fleet_config)
+        logging.info(f"Job {result['index']} launched as fleet {fleet_id} in {result['region']}")
+        return fleet_id
+
+    def register(controller: str, launched: list[tuple[dict, str]]) -> None:
+        try:
+            register_jobs_with_controller(
+                controller,
+                [{**result, "fleet_id": fleet_id} for result, fleet_id in launched],
+                session=session,
+            )
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error registering {len(launched)} jobs with {controller}: {e}")
+            fleets_by_region = {}
+            for result, fleet_id in launched:
+                fleets_by_region.setdefault(result["region"], []).append(fleet_id)
+            for region, fleet_ids in fleets_by_region.items():
+                region_client(region).cancel_spot_fleet_requests(
+                    SpotFleetRequestIds=fleet_ids, TerminateInstances=True
+                )
+            for result, fleet_id in launched:
+                result["error"] = (
+                    f"Fleet {fleet_id} was cancelled because it could not be registered "
+                    f"with the controller: {e}"
+                )
+            return
+        for result, fleet_id in launched:
+            result["fleet_id"] = fleet_id
+
+    def launch_chunk(chunk: list[tuple[AwsSpotInstanceRequest, dict]]) -> None:
+        launched = {}
+        for job, result in chunk:
+            try:
+                fleet_id = launch(job, result)
+            except Exception as e:
+                logging.error(f"Job {result['index']} failed to launch: {e}")
+                result["error"] = str(e)
+                continue
+            launched.setdefault(job.terminate_fleet_on_finish_controller, []).append(
+                (result, fleet_id)
+            )
+        for controller, controller_launched in launched.items():
+            if controller:
+                try:
+                    register(controller, controller_launched)
+                except Exception as e:
+                    # The fleets could not be cancelled either, so they are left to the user
+                    fleet_ids = [fleet_id for _, fleet_id in controller_launched]
+                    logging.error(f"Error cancelling unregistered fleets {fleet_ids}: {e}")
+                    for result, fleet_id in controller_launched:
+                        result["error"] = (
+                            f"Fleet {fleet_id} could not be registered or cancelled: {e}"
+                        )
+            else:
+                for result, fleet_id in controller_launched:
+                    result["fleet_id"] = fleet_id
+
+    jobs = list(zip(job_requests, results))
+    chunk_size = max(1, math.ceil(len(jobs) / max_workers))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in concurrent.futures.as_completed(
+            [executor.submit(launch_chunk, chunk) for chunk in chunks]
+        ):
+            future.result()
+
+    return results
+
+
+if __name__ == "__main__":
+    args = tyro.cli(AwsSpotBatchRequest)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    job_requests = load_manifest(args.manifest)
+    logging.info(f"Loaded {len(job_requests)} jobs from {args.manifest}")
+
+    results = launch_batch(
+        job_requests,
+        max_workers=args.max_workers,
+    )
+
+    with open(args.results, "w") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    failed = sum(1 for result in results if result["error"])
+    print(f"Launched {len(results) - failed}/{len(results)} jobs.")
+    print(f"Results written to: {args.results}")
+    if failed:
+        exit(1)
@@ -0,0 +1,80 @@
+"""Submit a job to a running launcher_daemon.py.
+
+Takes the same arguments as launch_aws_spot_fleet.py and prints the same output, but
+only imports the standard library, so it starts in milliseconds. The daemon's address is
+VIBEPILOT_LAUNCHER: a Unix socket path (default ~/.cache/aws-tools/launcher.sock) or an
+http://host:port URL. Over HTTP the daemon's token is sent along, read from
+VIBEPILOT_LAUNCHER_TOKEN or else from ~/.cache/aws-tools/launcher.token. Without a daemon
+listening, launch_aws_spot_fleet.py is run instead.
+"""
+import http.client
+import json
+import os
+import socket
+import sys
+import urllib.parse
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "aws-tools", "launcher.sock")
+DEFAULT_TOKEN_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "aws-tools", "launcher.token"
+)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connection(address: str) -> http.client.HTTPConnection:
+    if address.startswith("http://"):
+        url = urllib.parse.urlsplit(address)
+        return http.client.HTTPConnection(url.hostname, url.port or 80)
+    return UnixHTTPConnection(address)
+
+
+def token() -> str:
+    """Return the token of a daemon listening over HTTP."""
+    if os.environ.get("VIBEPILOT_LAUNCHER_TOKEN"):
+        return os.environ["VIBEPILOT_LAUNCHER_TOKEN"]
+    with open(DEFAULT_TOKEN_FILE, "r") as f:
+        return f.read().strip()
+
+
+def submit(argv: list, cwd: str, address: str) -> dict:
+    """Send a submission to the daemon and return its exit_code, stdout and stderr."""
+    headers = {"Content-Type": "application/json"}
+    if address.startswith("http://"):
+        headers["Authorization"] = f"Bearer {token()}"
+    conn = connection(address)
+    try:
+        conn.request(
+            "POST",
+            "/launch",
+            body=json.dumps({"argv": argv, "cwd": cwd}),
+            headers=headers,
+        )
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Launcher daemon answered {response.status}: {body[:200]!r}")
+        return json.loads(body)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    address = os.environ.get("VIBEPILOT_LAUNCHER", DEFAULT_SOCKET)
+    try:
+        result = submit(sys.argv[1:], os.getcwd(), address)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        print(f"No launcher daemon at {address} ({e}), launching directly.", file=sys.stderr)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "launch_aws_spot_fleet.py")
+        os.execv(sys.executable, [sys.executable, script] + sys.argv[1:])
+    sys.stdout.write(result["stdout"])
+    sys.stderr.write(result["stderr"])
+    sys.exit(result["exit_code"])
@@ -0,0 +1,321 @@
+import contextlib
+import copy
+import dataclasses
+import hmac
+import json
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import requests
+import tyro
+from flask import Flask, abort, jsonify, request
+from requests.adapters import HTTPAdapter
+
+# For aws_clients, as in launch_aws_spot_fleet
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibepilot"))
+
+from instance_ranking import DEFAULT_CACHE_PATH, TtlCache
+from launch_aws_spot_fleet import (
+    AwsSpotInstanceRequest,
+    check_termination_controller_status,
+    launch,
+)
+import aws_clients
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "aws-tools", "launcher.sock")
+DEFAULT_TOKEN_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "aws-tools", "launcher.token"
+)
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+
+@dataclasses.dataclass(kw_only=True)
+class LauncherDaemon:
+    """Serve launch_aws_spot_fleet.py submissions from a resident process.
+
+    Submit to it with launch_client.py, which takes the same arguments as
+    launch_aws_spot_fleet.py and prints the same output."""
+
+    socket: str = DEFAULT_SOCKET
+    """Unix socket to listen on."""
+
+    port: Optional[int] = None
+    """If supplied, listen over HTTP on localhost at this port instead of the socket. Any
+    local user can connect to the port, and submissions launch with the daemon's AWS
+    credentials, so they must carry the token written to token_file."""
+
+    token_file: str = DEFAULT_TOKEN_FILE
+    """With --port, file a new random token is written to at startup, readable only by the
+    user running the daemon. launch_client.py sends it from there, or from
+    VIBEPILOT_LAUNCHER_TOKEN."""
+
+    controller_status_ttl: float = 30.0
+    """Seconds a controller found reachable is not probed again."""
+
+    pool_connections: int = 32
+    """Connections kept open to every controller."""
+
+    warm_regions: list[str] = dataclasses.field(default_factory=list)
+    """Regions whose EC2 clients are created at startup, besides the default one."""
+
+
+class _ThreadLogCapture(logging.Handler):
+    """Collect the log lines of the threads that are capturing, e.g. one per submission."""
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    @contextlib.contextmanager
+    def capture(self):
+        lines = []
+        self._local.lines = lines
+        try:
+            yield lines
+        finally:
+            self._local.lines = None
+
+    def emit(self, record):
+        lines = getattr(self._local, "lines", None)
+        if lines is not None:
+            lines.append(self.format(record))
+
+
+# Parses arguments exactly as launch_aws_spot_fleet.py does, without launching anything
+PARSE_ONLY = (
+    "import sys, tyro\n"
+    "from launch_aws_spot_fleet import AwsSpotInstanceRequest\n"
+    "tyro.cli(AwsSpotInstanceRequest, args=sys.argv[1:], prog='launch_aws_spot_fleet.py')"
+)
+
+
+def parse_output(argv: list) -> tuple[str, str]:
+    """Return the stdout and stderr of launch_aws_spot_fleet.py parsing `argv`, e.g. its
+    help or usage errors.
+
+    tyro prints them to the process-wide sys.stdout and sys.stderr, so they are produced
+    by a child process rather than captured from the daemon's threads. Only failed parses
+    and --help get here."""
+    result = subprocess.run(
+        [sys.executable, "-c", PARSE_ONLY, *argv],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    return result.stdout, result.stderr
+
+
+class Launcher:
+    """Run submissions with warm AWS clients, a cache of parsed launch templates, pooled
+    controller connections and cached controller status probes."""
+
+    # Arguments that are paths on the submitting machine, resolved against its cwd
+    PATH_FIELDS = ("launch_template", "user_data", "pool_setup", "user_data_stage")
+
+    def __init__(self, controller_status_ttl: float = 30.0, pool_connections: int = 32):
+        self.controller_status_ttl = controller_status_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.log_capture = _ThreadLogCapture()
+        self._lock = threading.Lock()
+        self._parse_lock = threading.Lock()
+        self._templates = {}
+        self._controllers = {}
+        self._ranking_caches = {}
+        self.stats = {
+            "submissions": 0,
+            "failures": 0,
+            "template_hits": 0,
+            "template_misses": 0,
+            "controller_probes": 0,
+            "total_s": 0.0,
+        }
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def template(self, path: str) -> dict:
+        """Return a launch template, parsed again only when the file changes."""
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._templates.get(path)
+        if cached is not None and cached[0] == key:
+            self._count("template_hits")
+            return cached[1]
+        self._count("template_misses")
+        with open(path, "r") as f:
+            template = json.load(f)
+        with self._lock:
+            self._templates[path] = (key, template)
+        return template
+
+    def controller_reachable(self, controller: Optional[str]) -> bool:
+        """Probe a controller's /status, unless it answered within controller_status_ttl."""
+        if controller is None:
+            return check_termination_controller_status(None)
+        with self._lock:
+            checked_at = self._controllers.get(controller)
+        if checked_at is not None and time.monotonic() - checked_at < self.controller_status_ttl:
+            return True
+        self._count("controller_probes")
+        reachable = check_termination_controller_status(controller, session=self.session)
+        with self._lock:
+            if reachable:
+                self._controllers[controller] = time.monotonic()
+            else:
+                self._controllers.pop(controller, None)
+        return reachable
+
+    def ranking_cache(self, ttl: float) -> TtlCache:
+        with self._lock:
+            if ttl not in self._ranking_caches:
+                self._ranking_caches[ttl] = TtlCache(DEFAULT_CACHE_PATH, ttl)
+            return self._ranking_caches[ttl]
+
+    def parse(self, argv: list, cwd: str):
+        """Parse command line arguments as launch_aws_spot_fleet.py does.
+
+        Returns:
+            (AwsSpotInstanceRequest or None, exit code, stdout, stderr): The request, or
+                None with the exit code and output of a failed parse or of --help."""
+        # tyro keeps its caches in module globals, so parses are serialised
+        with self._parse_lock:
+            try:
+                args = tyro.cli(
+                    AwsSpotInstanceRequest,
+                    args=argv,
+                    prog="launch_aws_spot_fleet.py",
+                    console_outputs=False,
+                )
+            except SystemExit as e:
+                stdout, stderr = parse_output(argv)
+                return None, e.code or 0, stdout, stderr
+            except (AssertionError, ValueError) as e:
+                return None, 1, "", f"{type(e).__name__}: {e}\n"
+        for name in self.PATH_FIELDS:
+            value = getattr(args, name)
+            if value and not value.startswith("s3://") and not os.path.isabs(value):
+                setattr(args, name, os.path.join(cwd, value))
+        return args, None, "", ""
+
+    def submit(self, argv: list, cwd: str) -> dict:
+        """Run one submission and return its exit code, output and log lines."""
+        started_at = time.perf_counter()
+        self._count("submissions")
+        with self.log_capture.capture() as log_lines:
+            args, exit_code, stdout, stderr = self.parse(argv, cwd)
+            out = [stdout] if stdout else []
+            if args is not None:
+                try:
+                    with open(args.user_data, "r") as f:
+                        user_data = f.read()
+                    # Templates are shared between submissions, so each gets its own copy
+                    launch_template = copy.deepcopy(self.template(args.launch_template))
+                    exit_code = launch(
+                        args,
+                        launch_template,
+                        user_data,
+                        session=self.session,
+                        out=lambda line: out.append(f"{line}\n"),
+                        controller_reachable=self.controller_reachable,
+                        ranking_cache=self.ranking_cache(args.ranking_cache_ttl),
+                    )
+                except Exception:
+                    logging.error(f"Submission failed:\n{traceback.format_exc()}")
+                    exit_code = 1
+        err = [stderr] if stderr else []
+        err.extend(f"{line}\n" for line in log_lines)
+        if exit_code:
+            self._count("failures")
+        self._count("total_s", time.perf_counter() - started_at)
+        return {"exit_code": exit_code, "stdout": "".join(out), "stderr": "".join(err)}
+
+    def status(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["templates"] = len(self._templates)
+        stats["mean_s"] = stats["total_s"] / stats["submissions"] if stats["submissions"] else 0.0
+        return stats
+
+
+def write_token(path: str) -> str:
+    """Write a new random token to a file only its owner can read, and return it."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # An existing file keeps its mode, so it is narrowed before the token is written
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def create_app(launcher: Launcher, token: Optional[str] = None) -> Flask:
+    """Build the daemon's app. If a token is given, every request must send it as
+    "Authorization: Bearer <token>"."""
+    app = Flask(__name__)
+
+    if token is not None:
+
+        @app.before_request
+        def check_token():
+            expected = f"Bearer {token}"
+            if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+                abort(401, "Missing or wrong launcher token")
+
+    @app.route("/launch", methods=["POST"])
+    def submit():
+        """Run a submission. Expects {"argv": [arguments of launch_aws_spot_fleet.py],
+        "cwd": directory relative paths are resolved against} and returns its exit_code,
+        stdout and stderr."""
+        payload = request.get_json(silent=True) or {}
+        argv = payload.get("argv")
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            abort(400, "Expected a JSON body with an 'argv' list of strings")
+        return jsonify(launcher.submit(argv, payload.get("cwd") or os.getcwd()))
+
+    @app.route("/status")
+    def status():
+        return jsonify({"status": "healthy", **launcher.status()})
+
+    return app
+
+
+if __name__ == "__main__":
+    args = tyro.cli(LauncherDaemon)
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    launcher = Launcher(args.controller_status_ttl, args.pool_connections)
+    logging.getLogger().addHandler(launcher.log_capture)
+    # Resolve credentials and load the EC2 service model now rather than on the first job
+    for region in [None] + args.warm_regions:
+        aws_clients.ec2_client(region)
+    logging.info("EC2 clients are warm")
+
+    if args.port is not None:
+        app = create_app(launcher, token=write_token(args.token_file))
+        logging.info(f"Listening on port {args.port}, token written to {args.token_file}")
+        app.run(host="127.0.0.1", port=args.port, threaded=True)
+    else:
+        app = create_app(launcher)
+        os.makedirs(os.path.dirname(args.socket) or ".", exist_ok=True)
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        # Only the user running the daemon may submit through the socket
+        os.umask(0o077)
+        logging.info(f"Listening on {args.socket}")
+        app.run(host=f"unix://{args.socket}", threaded=True)
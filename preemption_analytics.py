@@ -0,0 +1,335 @@
+import dataclasses
+import io
+import json
+import logging
+import os
+from typing import Dict, List, Literal, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json
+import tyro
+
+from fleet_history_cache import FleetHistoryCache
+
+INSTANCE_COLUMNS = [
+    "instance_id",
+    "fleet_id",
+    "category",
+    "instance_type",
+    "availability_zone",
+]
+
+
+@dataclasses.dataclass(kw_only=True)
+class PreemptionReportRequest:
+    """Compute preemption statistics over a fleet history cache."""
+
+    history_cache: str
+    """Path to the SQLite history cache written by check_preemption.py."""
+
+    output_dir: str = "preemption_report"
+    """Directory to write one file per statistic to."""
+
+    format: Literal["parquet", "csv"] = "parquet"
+    """Output file format."""
+
+
+# Fields of a history record that events_frame reads
+EVENT_INFORMATION = pa.struct(
+    [
+        ("EventSubType", pa.string()),
+        ("InstanceId", pa.string()),
+        ("EventDescription", pa.string()),
+    ]
+)
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+
+def _history_record(timestamp_type: pa.DataType) -> pa.StructType:
+    return pa.struct(
+        [
+            ("Timestamp", timestamp_type),
+            ("EventType", pa.string()),
+            ("EventInformation", EVENT_INFORMATION),
+        ]
+    )
+
+
+def _read_json_lines(lines: List[str], schema: pa.Schema) -> pa.Table:
+    """Parse JSON lines into a table of the fields in schema, ignoring any other field."""
+    if not lines:
+        return schema.empty_table()
+    return pyarrow.json.read_json(
+        io.BytesIO("\n".join(lines).encode()),
+        parse_options=pyarrow.json.ParseOptions(
+            explicit_schema=schema, unexpected_field_behavior="ignore"
+        ),
+    ).combine_chunks()
+
+
+def _events(fleet_ids: List[str], counts: List[int], records) -> pd.DataFrame:
+    """Build the events frame of history records stored fleet after fleet."""
+    information = pc.struct_field(records, "EventInformation")
+    sub_types = pc.struct_field(information, "EventSubType")
+    timestamps = pc.struct_field(records, "Timestamp")
+    if not pa.types.is_timestamp(timestamps.type):
+        timestamps = timestamps.cast(TIMESTAMP)
+    # Launch descriptions repeat across instances, so every distinct one is parsed once
+    codes, descriptions = pd.factorize(
+        pc.if_else(
+            pc.equal(sub_types, "launched"),
+            pc.struct_field(information, "EventDescription"),
+            None,
+        ).to_pandas()
+    )
+    instance_types, zones = [], []
+    for description in descriptions:
+        try:
+            parsed = json.loads(description)
+            instance_types.append(parsed.get("instanceType"))
+            zones.append(parsed.get("availabilityZone"))
+        except (ValueError, AttributeError):
+            instance_types.append(None)
+            zones.append(None)
+    # Records without a launch description have the code -1, which picks the trailing None
+    return pd.DataFrame(
+        {
+            "fleet_id": pd.Categorical.from_codes(
+                np.repeat(np.arange(len(fleet_ids)), counts), categories=fleet_ids
+            ),
+            "timestamp": timestamps.to_pandas(),
+            "event_type": pc.struct_field(records, "EventType").dictionary_encode().to_pandas(),
+            "event_sub_type": sub_types.dictionary_encode().to_pandas(),
+            "instance_id": pc.struct_field(information, "InstanceId")
+            .dictionary_encode()
+            .to_pandas(),
+            "instance_type": pd.Series(np.array(instance_types + [None])[codes], dtype=object),
+            "availability_zone": pd.Series(np.array(zones + [None])[codes], dtype=object),
+        }
+    )
+
+
+def events_frame(histories: Dict[str, List[Dict]]) -> pd.DataFrame:
+    """
+    Flatten the history records of many fleets into one columnar frame.
+
+    The records are converted to Arrow in one call and every column is derived from that
+    without a Python loop over the records.
+
+    Args:
+        histories: History records keyed by fleet ID
+
+    Returns:
+        A frame with one row per record and the columns fleet_id, timestamp (UTC),
+        event_type, event_sub_type, instance_id, instance_type and availability_zone.
+        The last two are only filled in for instance launch events.
+    """
+    records = [record for records in histories.values() for record in records]
+    # Timestamps are datetimes as returned by EC2, or ISO strings as stored by the cache
+    timestamp_type = (
+        pa.string() if records and isinstance(records[0].get("Timestamp"), str) else TIMESTAMP
+    )
+    return _events(
+        list(histories),
+        [len(records) for records in histories.values()],
+        pa.array(records, type=_history_record(timestamp_type)),
+    )
+
+
+def cached_events_frame(
+    history_cache: FleetHistoryCache, fleet_ids: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    events_frame of the given (default: all) fleets in a history cache.
+
+    The stored records are parsed by Arrow straight from the JSON lines the cache returns,
+    rather than loaded one by one.
+    """
+    lines = history_cache.history_lines(fleet_ids)
+    table = _read_json_lines(
+        [line[2] for line in lines], pa.schema(list(_history_record(pa.string())))
+    )
+    return _events(
+        [line[0] for line in lines],
+        [line[1] for line in lines],
+        table.to_struct_array(),
+    )
+
+
+def instances_frame(results: Dict[str, Dict[str, List[Dict]]]) -> pd.DataFrame:
+    """
+    Flatten classified instances of many fleets into one frame.
+
+    Args:
+        results: classify_fleet results keyed by fleet ID, as returned by scan_fleets or
+            FleetHistoryCache.load_result. Fleets that failed to scan are skipped.
+    """
+    rows = [
+        (
+            info["instance_id"],
+            fleet_id,
+            key[: -len("_instances")],
+            info.get("instance_type"),
+            info.get("availability_zone"),
+        )
+        for fleet_id, result in results.items()
+        if "error" not in result
+        for key, infos in result.items()
+        if key.endswith("_instances")
+        for info in infos
+    ]
+    frame = pd.DataFrame(rows, columns=INSTANCE_COLUMNS)
+    frame["category"] = frame["category"].astype("category")
+    return frame
+
+
+def instance_timeline(events: pd.DataFrame, instances: pd.DataFrame) -> pd.DataFrame:
+    """
+    Join launch, termination and fleet submission times onto the classified instances.
+
+    Instance type and availability zone missing from the instance descriptions are filled
+    in from the launch events.
+
+    Returns:
+        The instances frame with the extra columns submitted_at, launched_at, terminated_at,
+        lifetime_s (launch to termination) and fulfillment_s (submission to launch)
+    """
+    submitted = events.groupby("fleet_id", observed=True)["timestamp"].min().rename("submitted_at")
+    instance_events = events[events["event_type"] == "instanceChange"]
+    launches = instance_events[instance_events["event_sub_type"] == "launched"]
+    launched = launches.groupby("instance_id", observed=True).agg(
+        launched_at=("timestamp", "min"),
+        launch_instance_type=("instance_type", "first"),
+        launch_availability_zone=("availability_zone", "first"),
+    )
+    terminated = (
+        instance_events[instance_events["event_sub_type"] == "terminated"]
+        .groupby("instance_id", observed=True)["timestamp"]
+        .max()
+        .rename("terminated_at")
+    )
+
+    timeline = (
+        instances.join(launched, on="instance_id")
+        .join(terminated, on="instance_id")
+        .join(submitted, on="fleet_id")
+    )
+    timeline["instance_type"] = timeline["instance_type"].fillna(timeline.pop("launch_instance_type"))
+    timeline["availability_zone"] = timeline["availability_zone"].fillna(
+        timeline.pop("launch_availability_zone")
+    )
+    timeline["instance_type"] = timeline["instance_type"].astype("category")
+    timeline["availability_zone"] = timeline["availability_zone"].astype("category")
+    timeline["lifetime_s"] = (timeline["terminated_at"] - timeline["launched_at"]).dt.total_seconds()
+    timeline["fulfillment_s"] = (timeline["launched_at"] - timeline["submitted_at"]).dt.total_seconds()
+    return timeline
+
+
+def _rate_by(timeline: pd.DataFrame, key: str) -> pd.DataFrame:
+    grouped = timeline.assign(preempted=timeline["category"] == "preempted").groupby(key, dropna=False, observed=True)
+    stats = grouped.agg(instances=("instance_id", "size"), preempted=("preempted", "sum"))
+    stats["preemption_rate"] = stats["preempted"] / stats["instances"]
+    return stats.reset_index()
+
+
+def preemption_report(timeline: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Compute preemption statistics over an instance timeline.
+
+    Returns:
+        Frames keyed by statistic name:
+            by_instance_type, by_availability_zone, by_hour: preemption rate (preempted
+                instances over all instances) per group. Hours are the UTC hour of the
+                instance's termination.
+            time_to_preemption: mean and median lifetime of preempted instances per instance
+                type and availability zone, to size checkpoint intervals.
+            fulfillment_latency: mean, median and p95 time from fleet submission to instance
+                launch per instance type, to order instance_types.
+    """
+    hours = timeline["terminated_at"].dt.hour
+    report = {
+        "by_instance_type": _rate_by(timeline, "instance_type"),
+        "by_availability_zone": _rate_by(timeline, "availability_zone"),
+        "by_hour": _rate_by(timeline.assign(hour=hours), "hour"),
+    }
+
+    preempted = timeline[(timeline["category"] == "preempted") & timeline["lifetime_s"].notna()]
+    report["time_to_preemption"] = (
+        preempted.groupby(["instance_type", "availability_zone"], dropna=False, observed=True)["lifetime_s"]
+        .agg(["count", "mean", "median"])
+        .reset_index()
+    )
+
+    launched = timeline[timeline["fulfillment_s"].notna()]
+    report["fulfillment_latency"] = (
+        launched.groupby("instance_type", dropna=False, observed=True)["fulfillment_s"]
+        .agg(["count", "mean", "median", lambda s: np.percentile(s, 95)])
+        .rename(columns={"<lambda_0>": "p95"})
+        .reset_index()
+    )
+    return report
+
+
+def cached_instances_frame(
+    history_cache: FleetHistoryCache, fleet_ids: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """instances_frame of the given (default: all) fleets in a history cache."""
+    lines = history_cache.instance_lines(fleet_ids)
+    frame = _read_json_lines(
+        [line[3] for line in lines],
+        pa.schema(
+            [
+                (column, pa.string())
+                for column in INSTANCE_COLUMNS
+                if column not in ("fleet_id", "category")
+            ]
+        ),
+    ).to_pandas()
+    frame.insert(
+        1, "fleet_id", np.repeat([line[0] for line in lines], [line[1] for line in lines])
+    )
+    categories = "\n".join(line[2] for line in lines).split("\n") if lines else []
+    frame.insert(2, "category", pd.Categorical(categories))
+    return frame
+
+
+def load_timeline(history_cache: FleetHistoryCache, fleet_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """Build the instance timeline of the given (default: all) fleets in a history cache."""
+    return instance_timeline(
+        cached_events_frame(history_cache, fleet_ids),
+        cached_instances_frame(history_cache, fleet_ids),
+    )
+
+
+def export_report(
+    report: Dict[str, pd.DataFrame], output_dir: str, format: str = "parquet"
+) -> List[str]:
+    """Write every frame of a report to output_dir/<name>.<format> and return the paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, frame in report.items():
+        path = os.path.join(output_dir, f"{name}.{format}")
+        if format == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    args = tyro.cli(PreemptionReportRequest)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    timeline = load_timeline(FleetHistoryCache(args.history_cache))
+    logging.info(f"Loaded {len(timeline)} instances from {args.history_cache}")
+    report = preemption_report(timeline)
+    for path in export_report(report, args.output_dir, args.format):
+        print(f"Wrote {path}")
+    print(report["by_instance_type"].to_string(index=False))
@@ -0,0 +1,168 @@
+import dataclasses
+import glob
+import logging
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+import requests
+import tyro
+
+# Traced commands that belong to the tracing hooks rather than the user's script
+HOOK_COMMAND_PREFIXES = ("vibepilot_", "trap - DEBUG")
+UNSTAGED = "(before first stage)"
+
+
+@dataclasses.dataclass(kw_only=True)
+class BootTraceSummaryRequest:
+    """Summarise where boot time goes across jobs launched with --trace-user-data."""
+
+    controller: Optional[str] = None
+    """URL of the termination controller the traces were sent to."""
+
+    trace_dir: Optional[str] = None
+    """Directory the traces were saved to, with one <job uuid>.tsv file per job."""
+
+    since: float = 0.0
+    """Only summarise traces the controller received after this epoch timestamp."""
+
+    top: int = 20
+    """Number of slowest commands to list."""
+
+    by_instance_type: bool = False
+    """Break the stage summary down by instance type."""
+
+    def __post_init__(self):
+        if not self.controller and not self.trace_dir:
+            raise ValueError("Either controller or trace_dir must be provided.")
+
+
+def parse_trace(trace: str) -> List[tuple]:
+    """Parse a trace into [(timestamp, kind, label)], skipping malformed lines."""
+    entries = []
+    for line in trace.splitlines():
+        parts = line.split("\t", 2)
+        if len(parts) != 3:
+            continue
+        try:
+            entries.append((float(parts[0]), parts[1], parts[2]))
+        except ValueError:
+            continue
+    return entries
+
+
+def trace_frame(traces: List[Dict]) -> pd.DataFrame:
+    """
+    Turn traces into one row per traced command.
+
+    Args:
+        traces: Dicts with the keys uuid, instance_type and trace
+
+    Returns:
+        A frame with the columns uuid, instance_type, stage, command and duration_s. A
+        command lasts until the next trace line; commands run before the first stage
+        marker are attributed to the stage "(before first stage)".
+    """
+    rows = []
+    for t in traces:
+        entries = parse_trace(t["trace"])
+        stage = UNSTAGED
+        for (timestamp, kind, label), (next_timestamp, _, _) in zip(entries, entries[1:]):
+            if kind == "stage":
+                stage = label
+            elif kind == "cmd":
+                rows.append(
+                    (t["uuid"], t.get("instance_type"), stage, label, next_timestamp - timestamp)
+                )
+    return pd.DataFrame(
+        rows, columns=["uuid", "instance_type", "stage", "command", "duration_s"]
+    )
+
+
+def boot_durations(traces: List[Dict]) -> pd.Series:
+    """Return the total user data duration of every complete trace, indexed by job UUID."""
+    durations = {}
+    for t in traces:
+        entries = parse_trace(t["trace"])
+        begin = [ts for ts, kind, _ in entries if kind == "begin"]
+        end = [ts for ts, kind, _ in entries if kind == "end"]
+        if begin and end:
+            durations[t["uuid"]] = end[-1] - begin[0]
+    return pd.Series(durations, name="duration_s", dtype=float)
+
+
+def summarize(frame: pd.DataFrame, group_by: List[str], top: int = 20) -> Dict[str, pd.DataFrame]:
+    """
+    Summarise per-command durations.
+
+    Returns:
+        A dictionary with a "stages" frame (per stage and group: number of jobs, mean, p50,
+        p95 and max time spent in the stage, and its share of the total time) and a
+        "commands" frame with the `top` commands by total time.
+    """
+    # Command labels are "L<line number>: <command>"
+    commands = frame["command"].str.split(": ", n=1).str[-1]
+    frame = frame[~commands.str.startswith(HOOK_COMMAND_PREFIXES)]
+    per_job = frame.groupby(group_by + ["stage", "uuid"], sort=False, dropna=False)["duration_s"].sum()
+    stages = per_job.groupby(level=group_by + ["stage"], sort=False, dropna=False).agg(
+        ["count", "mean", "median", lambda d: d.quantile(0.95), "max", "sum"]
+    )
+    stages.columns = ["jobs", "mean_s", "p50_s", "p95_s", "max_s", "total_s"]
+    stages["share"] = stages["total_s"] / stages["total_s"].sum()
+    stages = stages.drop(columns="total_s").reset_index()
+
+    commands = frame.groupby(["stage", "command"], sort=False)["duration_s"].agg(
+        ["count", "mean", "max", "sum"]
+    )
+    commands.columns = ["runs", "mean_s", "max_s", "total_s"]
+    commands = commands.sort_values("total_s", ascending=False).head(top).reset_index()
+    return {"stages": stages, "commands": commands}
+
+
+def load_traces(
+    controller: Optional[str] = None,
+    trace_dir: Optional[str] = None,
+    since: float = 0.0,
+) -> List[Dict]:
+    """Load traces from the controller and/or a trace directory, deduplicated by job UUID."""
+    traces = {}
+    if trace_dir:
+        for path in sorted(glob.glob(os.path.join(trace_dir, "*.tsv"))):
+            with open(path, "r") as f:
+                job_uuid = os.path.splitext(os.path.basename(path))[0]
+                traces[job_uuid] = {"uuid": job_uuid, "instance_type": None, "trace": f.read()}
+    if controller:
+        response = requests.get(f"{controller}/boot_traces", params={"since": since})
+        response.raise_for_status()
+        for t in response.json()["traces"]:
+            traces[t["uuid"]] = t
+    return list(traces.values())
+
+
+if __name__ == "__main__":
+    args = tyro.cli(BootTraceSummaryRequest)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    traces = load_traces(args.controller, args.trace_dir, args.since)
+    logging.info(f"Loaded {len(traces)} boot traces")
+    if not traces:
+        exit(0)
+
+    durations = boot_durations(traces)
+    if len(durations):
+        print(
+            f"User data duration over {len(durations)} jobs: mean {durations.mean():.1f}s, "
+            f"p50 {durations.median():.1f}s, p95 {durations.quantile(0.95):.1f}s, "
+            f"max {durations.max():.1f}s"
+        )
+    summary = summarize(
+        trace_frame(traces), ["instance_type"] if args.by_instance_type else [], args.top
+    )
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print("\nTime per stage:")
+        print(summary["stages"].to_string(index=False, float_format="{:.2f}".format))
+        print(f"\nTop {args.top} commands by total time:")
+        print(summary["commands"].to_string(index=False, float_format="{:.2f}".format))
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The launcher scripts live at the top level, and the controller's modules import each other
+# from the vibepilot directory
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "vibepilot"))
+
+# The controller and share_ips open their databases when they are imported
+TMP_DIR = tempfile.mkdtemp(prefix="vibepilot_tests_")
+os.environ.setdefault("TERMINATION_CONTROLLER_DB", os.path.join(TMP_DIR, "controller.db"))
+os.environ.setdefault("SHARE_IPS_DB", os.path.join(TMP_DIR, "share_ips.db"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+
+@pytest.fixture
+def ec2():
+    """An EC2 client whose calls are answered, and validated, by a Stubber."""
+    client = boto3.client("ec2", region_name="us-east-1")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,51 @@
+import botocore.exceptions
+import pytest
+from botocore.stub import ANY, Stubber
+
+import aws_clients
+import ec2_inventory
+import launch_aws_spot_fleet
+import launch_aws_spot_fleet_batch
+from launch_aws_spot_fleet import request_spot_fleet
+
+
+def test_clients_are_shared_by_region_and_module():
+    # The launcher and the controller's modules share one aws_clients, and so its clients
+    assert launch_aws_spot_fleet.aws_clients is aws_clients
+    assert launch_aws_spot_fleet_batch.aws_clients is aws_clients
+    assert ec2_inventory.aws_clients is aws_clients
+
+    client = aws_clients.ec2_client("eu-west-1")
+    assert aws_clients.ec2_client("eu-west-1") is client
+    assert aws_clients.ec2_client("eu-west-2") is not client
+    assert client.meta.config.retries == {
+        "mode": "adaptive",
+        "total_max_attempts": aws_clients.MAX_ATTEMPTS,
+    }
+
+
+def test_calls_are_counted_per_operation():
+    client = aws_clients.ec2_client("eu-central-1")
+    aws_clients.call_stats.reset()
+    with Stubber(client) as stubber:
+        stubber.add_response("describe_regions", {"Regions": []})
+        stubber.add_client_error("describe_regions", service_error_code="UnauthorizedOperation")
+        client.describe_regions()
+        with pytest.raises(botocore.exceptions.ClientError):
+            client.describe_regions()
+
+    stats = aws_clients.call_stats.snapshot()["ec2.DescribeRegions"]
+    assert (stats["calls"], stats["errors"]) == (2, 1)
+    assert sum(stats["buckets"]) == 2
+
+
+def test_spot_fleet_request_errors_are_raised(ec2):
+    client, stubber = ec2
+    # Throttling is retried by botocore; the launcher does not retry on top of it
+    stubber.add_client_error(
+        "request_spot_fleet",
+        service_error_code="RequestLimitExceeded",
+        expected_params={"SpotFleetRequestConfig": ANY},
+    )
+    with pytest.raises(botocore.exceptions.ClientError):
+        request_spot_fleet(client, {"IamFleetRole": "role", "TargetCapacity": 1})
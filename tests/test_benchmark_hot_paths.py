@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmark_hot_paths import BENCHMARKS, compare_results
+from conftest import ROOT
+
+# Small enough to run every benchmark in a few seconds
+SMOKE_PARAMS = [
+    "--repeat", "1",
+    "--instance-types", "2",
+    "--user-data-kb", "32",
+    "--fleets", "2",
+    "--events-per-fleet", "20",
+    "--replay-entries", "100",
+    "--dashboard-instances", "10",
+]
+
+
+def benchmark(*args) -> subprocess.CompletedProcess:
+    # In a process of its own, as the share_ips benchmarks import it on a synthetic registry
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "benchmark_hot_paths.py"), *args],
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+
+def test_every_benchmark_runs_and_compares(tmp_path):
+    output = str(tmp_path / "results.json")
+    run = benchmark(*SMOKE_PARAMS, "--output", output)
+    assert run.returncode == 0, run.stderr
+
+    with open(output, "r") as f:
+        results = json.load(f)
+    assert list(results["benchmarks"]) == BENCHMARKS
+    assert all(r["runs"] == 1 and r["median_s"] > 0 for r in results["benchmarks"].values())
+
+    slower = dict(results, benchmarks={
+        name: dict(r, median_s=r["median_s"] * 2) for name, r in results["benchmarks"].items()
+    })
+    with open(tmp_path / "slower.json", "w") as f:
+        json.dump(slower, f)
+    assert benchmark("--compare", output, "--against", output).returncode == 0
+    compared = benchmark("--compare", output, "--against", str(tmp_path / "slower.json"))
+    assert compared.returncode == 1
+    assert compared.stdout.count("REGRESSION") == len(BENCHMARKS)
+
+
+def test_only_slowdowns_beyond_the_tolerance_are_regressions():
+    baseline = {"params": {}, "benchmarks": {"a": {"median_s": 1.0}, "b": {"median_s": 1.0}}}
+    results = {
+        "params": {},
+        "benchmarks": {"a": {"median_s": 1.05}, "b": {"median_s": 1.2}, "new": {"median_s": 1.0}},
+    }
+
+    rows = compare_results(baseline, results, tolerance=0.1)
+
+    assert [(r["benchmark"], r["regression"]) for r in rows] == [("a", False), ("b", True)]
@@ -0,0 +1,68 @@
+import subprocess
+
+import pytest
+
+from launch_aws_spot_fleet import preprocess_user_data
+from summarize_boot_traces import boot_durations, load_traces, parse_trace, summarize, trace_frame
+from user_data_hooks import BOOT_TRACE_FILE
+
+USER_DATA = """#!/bin/bash
+echo setting up
+# vibepilot-stage: install
+sleep 0.2
+  # vibepilot-stage: run experiment
+sleep 0.1
+echo done
+"""
+
+
+def run_traced(tmp_path, job_uuid: str) -> str:
+    user_data = preprocess_user_data(
+        USER_DATA,
+        None,
+        False,
+        job_uuid,
+        trace_user_data=True,
+        trace_dir=str(tmp_path / "traces"),
+    )
+    script = tmp_path / "user_data.sh"
+    script.write_text(user_data.replace(BOOT_TRACE_FILE, str(tmp_path / "trace.tsv")))
+    # Nothing listens on port 9, so the metadata lookups fail at once
+    subprocess.run(
+        ["bash", str(script)],
+        env={"PATH": "/usr/bin:/bin", "VIBEPILOT_IMDS": "http://127.0.0.1:9"},
+        check=True,
+        capture_output=True,
+        timeout=60,
+    )
+    return str(tmp_path / "traces")
+
+
+def test_traced_user_data_is_summarised_by_stage(tmp_path):
+    trace_dir = run_traced(tmp_path, "job-1")
+    traces = load_traces(trace_dir=trace_dir)
+    assert [t["uuid"] for t in traces] == ["job-1"]
+
+    kinds = [kind for _, kind, _ in parse_trace(traces[0]["trace"])]
+    assert kinds[0] == "begin" and kinds[-1] == "end"
+    assert boot_durations(traces)["job-1"] >= 0.3
+
+    frame = trace_frame(traces)
+    assert list(frame["stage"].unique()) == ["(before first stage)", "install", "run experiment"]
+    assert frame.loc[frame["command"].str.endswith("sleep 0.2"), "stage"].tolist() == ["install"]
+
+    summary = summarize(frame, [])
+    stages = summary["stages"].set_index("stage")
+    assert stages.loc["install", "mean_s"] >= 0.2
+    assert stages.loc["run experiment", "mean_s"] >= 0.1
+    assert stages["share"].sum() == pytest.approx(1.0)
+    # The stage markers and the trap of the tracing hooks are not the user's commands
+    commands = summary["commands"]["command"]
+    assert not commands.str.contains("vibepilot_|trap - DEBUG").any()
+    assert commands.iloc[0].endswith("sleep 0.2")
+
+
+def test_malformed_trace_lines_are_skipped():
+    trace = "1.0\tbegin\tuser_data\ngarbage\nx\tcmd\tL1: ls\n2.5\tend\tuser_data\n"
+    assert parse_trace(trace) == [(1.0, "begin", "user_data"), (2.5, "end", "user_data")]
+    assert boot_durations([{"uuid": "a", "trace": trace}]).to_dict() == {"a": 1.5}
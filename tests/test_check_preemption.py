@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+
+from check_preemption import describe_fleet_states, describe_instances_batched, scan_fleets
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def instance_change(instance_id: str) -> dict:
+    return {
+        "EventType": "instanceChange",
+        "EventInformation": {"InstanceId": instance_id, "EventSubType": "launched"},
+        "Timestamp": START,
+    }
+
+
+def instance_filter(instance_ids: list) -> dict:
+    return {"Filters": [{"Name": "instance-id", "Values": instance_ids}]}
+
+
+def test_scan_pages_history_and_classifies_instances(ec2):
+    client, stubber = ec2
+    history = {"SpotFleetRequestId": "sfr-1", "StartTime": START, "MaxResults": 1000}
+    stubber.add_response(
+        "describe_spot_fleet_request_history",
+        {"HistoryRecords": [instance_change("i-1")], "NextToken": "next"},
+        history,
+    )
+    stubber.add_response(
+        "describe_spot_fleet_request_history",
+        {"HistoryRecords": [instance_change("i-2"), instance_change("i-3")]},
+        {**history, "NextToken": "next"},
+    )
+    stubber.add_response(
+        "describe_instances",
+        {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {"InstanceId": "i-2", "State": {"Name": "terminated"},
+                         "StateReason": {"Code": "Client.UserInitiatedShutdown"}},
+                        {"InstanceId": "i-3", "State": {"Name": "running"}},
+                    ]
+                }
+            ]
+        },
+        instance_filter(["i-1", "i-2", "i-3"]),
+    )
+    stubber.add_response(
+        "describe_spot_instance_requests",
+        {
+            "SpotInstanceRequests": [
+                {"InstanceId": "i-1", "SpotInstanceRequestId": "sir-1",
+                 "Status": {"Code": "instance-terminated-by-price", "Message": "outbid"}},
+            ]
+        },
+        instance_filter(["i-1", "i-2", "i-3"]),
+    )
+
+    result = scan_fleets(["sfr-1"], ec2_client=client, max_workers=1, start_time=START)["sfr-1"]
+
+    assert [i["instance_id"] for i in result["preempted_instances"]] == ["i-1"]
+    assert [i["instance_id"] for i in result["non_preempted_instances"]] == ["i-2"]
+    assert [i["instance_id"] for i in result["active_instances"]] == ["i-3"]
+    assert len(result["fleet_history"]) == 3
+
+
+def test_instances_are_described_in_batches(ec2):
+    client, stubber = ec2
+    instance_ids = [f"i-{n}" for n in range(150)]
+    for batch in [instance_ids[:100], instance_ids[100:]]:
+        stubber.add_response(
+            "describe_instances",
+            {"Reservations": [{"Instances": [{"InstanceId": i} for i in batch]}]},
+            instance_filter(batch),
+        )
+        stubber.add_response(
+            "describe_spot_instance_requests", {"SpotInstanceRequests": []}, instance_filter(batch)
+        )
+
+    instances, spot_requests = describe_instances_batched(client, instance_ids)
+
+    assert list(instances) == instance_ids
+    assert spot_requests == {}
+
+
+def test_unknown_fleets_fall_back_to_one_lookup_per_fleet(ec2):
+    client, stubber = ec2
+    stubber.add_client_error(
+        "describe_spot_fleet_requests",
+        service_error_code="InvalidSpotFleetRequestId.NotFound",
+        expected_params={"SpotFleetRequestIds": ["sfr-1", "sfr-2"]},
+    )
+    stubber.add_response(
+        "describe_spot_fleet_requests",
+        {
+            "SpotFleetRequestConfigs": [
+                {"SpotFleetRequestId": "sfr-1", "SpotFleetRequestState": "active",
+                 "CreateTime": START,
+                 "SpotFleetRequestConfig": {"IamFleetRole": "role", "TargetCapacity": 1}}
+            ]
+        },
+        {"SpotFleetRequestIds": ["sfr-1"]},
+    )
+    stubber.add_client_error(
+        "describe_spot_fleet_requests",
+        service_error_code="InvalidSpotFleetRequestId.NotFound",
+        expected_params={"SpotFleetRequestIds": ["sfr-2"]},
+    )
+
+    assert describe_fleet_states(client, ["sfr-1", "sfr-2"]) == {"sfr-1": "active", "sfr-2": None}
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+
+from conftest import ROOT
+from launch_aws_spot_fleet import preprocess_user_data
+
+PAYLOAD = os.path.join(ROOT, "vibepilot", "experiment", "experiment_payload.sh")
+
+
+def run_stage(tmp_path, user_data: str, **kwargs) -> str:
+    """Run user data with the data cache stage, temporary directories standing in for EFS
+    and the instance store, and a shutdown command that only says it was run."""
+    script = preprocess_user_data(
+        user_data,
+        None,
+        False,
+        "job-1",
+        data_cache_dir=str(tmp_path / "nvme"),
+        checkpoint_interval=0.5,
+        **kwargs,
+    )
+    (tmp_path / "user_data.sh").write_text(script)
+    (tmp_path / "bin").mkdir(exist_ok=True)
+    (tmp_path / "bin" / "shutdown").write_text("#!/bin/bash\necho shutdown $*\n")
+    os.chmod(tmp_path / "bin" / "shutdown", 0o755)
+    # Output goes to a file, as the killed checkpoint writer's last sleep may outlive the
+    # script for up to checkpoint_interval with the script's stdout open
+    with open(tmp_path / "output.log", "w+") as output:
+        subprocess.run(
+            ["bash", str(tmp_path / "user_data.sh")],
+            # An empty device list keeps the cache in a plain directory
+            env={
+                "PATH": f"{tmp_path / 'bin'}:/usr/bin:/bin",
+                "VIBEPILOT_NVME_DEVICES": "",
+                "EFS": str(tmp_path / "efs"),
+            },
+            stdout=output,
+            check=True,
+            timeout=60,
+        )
+        output.seek(0)
+        return output.read()
+
+
+def cache_stats(tmp_path) -> dict:
+    with open(tmp_path / "nvme" / "stats.json", "r") as f:
+        return json.load(f)
+
+
+def test_inputs_are_read_through_the_cache(tmp_path):
+    inputs = tmp_path / "efs" / "inputs"
+    inputs.mkdir(parents=True)
+    (inputs / "a.txt").write_text("a" * 1000)
+    (inputs / "b.txt").write_text("b" * 10)
+    user_data = '#!/bin/bash\nwc -c < "$(vibepilot_cached "$EFS/inputs/a.txt")"\n'
+
+    output = run_stage(tmp_path, user_data, data_cache_inputs=[str(inputs)])
+
+    assert "1000\n" in output
+    assert (tmp_path / "nvme" / "view" / str(inputs / "b.txt").lstrip("/")).read_text() == "b" * 10
+    stats = cache_stats(tmp_path)
+    assert (stats["misses"], stats["fetched_bytes"], stats["fetch_errors"]) == (2, 1010, 0)
+
+    # The cache outlives the script, so a second run only reads metadata
+    run_stage(tmp_path, user_data, data_cache_inputs=[str(inputs)])
+    stats = cache_stats(tmp_path)
+    assert (stats["misses"], stats["hit_bytes"]) == (0, 1010)
+
+
+def test_experiment_payload_keeps_its_counter_in_the_checkpoint_dir(tmp_path):
+    with open(PAYLOAD, "r") as f:
+        payload = f.read()
+    checkpoints = tmp_path / "efs" / "vibepilot" / "test_experiment"
+
+    outputs = [
+        run_stage(tmp_path, payload, checkpoint_dir=str(checkpoints)) for _ in range(4)
+    ]
+
+    assert [o.count("shutdown now") for o in outputs] == [1, 1, 1, 0]
+    assert "Number of lines in the file: 3" in outputs[-1]
+    # Every run restored the previous one's counter and wrote its own back
+    assert (checkpoints / "test_file.txt").read_text() == "0\n1\n2\n3\n"
+    assert not list(checkpoints.glob("*.vibepilot-partial"))
+    assert cache_stats(tmp_path)["write_back_errors"] == 0
@@ -0,0 +1,98 @@
+from ec2_inventory import Ec2Inventory
+
+
+def add_inventory_responses(stubber, instance_id: str):
+    stubber.add_response(
+        "describe_instances",
+        {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {
+                            "InstanceId": instance_id,
+                            "KeyName": "key",
+                            "PublicIpAddress": "203.0.113.1",
+                            "Tags": [{"Key": "Owner", "Value": "me"}],
+                        }
+                    ]
+                }
+            ]
+        },
+        {
+            "Filters": [
+                {"Name": "instance-state-name", "Values": ["running"]},
+                {"Name": "tag:Owner", "Values": ["me"]},
+            ]
+        },
+    )
+    stubber.add_response(
+        "describe_spot_instance_requests",
+        {"SpotInstanceRequests": [{"SpotInstanceRequestId": "sir-1", "Tags": []}]},
+        {
+            "Filters": [
+                {"Name": "state", "Values": ["active"]},
+                {"Name": "tag:Owner", "Values": ["me"]},
+            ]
+        },
+    )
+
+
+def test_listing_applies_the_tag_filters(ec2):
+    client, stubber = ec2
+    inventory = Ec2Inventory(tag_filters={"Owner": "me"}, ec2_client=client)
+    add_inventory_responses(stubber, "i-1")
+
+    assert inventory.fetch_instances() == {
+        "i-1": {
+            "Tags": "Owner=me",
+            "KeyName": "key",
+            "PublicIpAddress": "203.0.113.1",
+            "Region": "us-east-1",
+        }
+    }
+    assert inventory.fetch_spot_requests() == [
+        {"sir-1": "", "KeyName": "", "Region": "us-east-1"}
+    ]
+
+
+def fake_inventory(**kwargs) -> Ec2Inventory:
+    """An inventory whose every refresh lists one more instance."""
+    inventory = Ec2Inventory(**kwargs)
+    fetches = []
+
+    def fetch_instances(region_name=None):
+        fetches.append(region_name)
+        return {f"i-{len(fetches)}": {}}
+
+    inventory.fetch_instances = fetch_instances
+    inventory.fetch_spot_requests = lambda region_name=None: []
+    return inventory
+
+
+def test_snapshot_is_served_from_memory_until_it_expires():
+    inventory = fake_inventory(ttl=30)
+
+    assert list(inventory.instances()) == ["i-1"]
+    assert list(inventory.instances()) == ["i-1"]
+    inventory.ttl = 0
+    assert list(inventory.instances()) == ["i-2"]
+    assert inventory.stats() | {"age_s": 0} == {
+        "hits": 1, "misses": 2, "refreshes": 2, "age_s": 0
+    }
+
+
+def test_regions_are_merged_into_one_snapshot():
+    inventory = fake_inventory(region_names=["us-east-1", "us-west-2"])
+
+    assert len(inventory.instances()) == 2
+
+
+def test_listeners_see_every_refresh():
+    inventory = fake_inventory()
+    seen = []
+    inventory.add_listener(lambda previous, snapshot: seen.append((previous, snapshot)))
+
+    first = inventory.refresh()
+    second = inventory.refresh()
+
+    assert seen == [(None, first), (first, second)]
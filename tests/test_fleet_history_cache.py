@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+from check_preemption import scan_fleets
+from fleet_history_cache import FleetHistoryCache
+from test_check_preemption import START, instance_change, instance_filter
+
+
+def test_overlapping_records_are_stored_once(tmp_path):
+    cache = FleetHistoryCache(str(tmp_path / "history.db"))
+    first, second = instance_change("i-1"), instance_change("i-2")
+    second["Timestamp"] = START + timedelta(minutes=1)
+
+    cache.add_records("sfr-1", [first])
+    cache.add_records("sfr-1", [first, second], state="active")
+
+    assert [r["EventInformation"]["InstanceId"] for r in cache.history("sfr-1")] == ["i-1", "i-2"]
+    assert cache.high_water_mark("sfr-1") == START + timedelta(minutes=1)
+    assert cache.fleet_ids(complete=False) == ["sfr-1"]
+
+
+def test_complete_fleets_are_answered_from_the_cache(ec2, tmp_path):
+    client, stubber = ec2
+    cache = FleetHistoryCache(str(tmp_path / "history.db"))
+    stubber.add_response(
+        "describe_spot_fleet_requests",
+        {
+            "SpotFleetRequestConfigs": [
+                {
+                    "SpotFleetRequestId": "sfr-1",
+                    "SpotFleetRequestState": "cancelled",
+                    "CreateTime": START,
+                    "SpotFleetRequestConfig": {"IamFleetRole": "role", "TargetCapacity": 1},
+                }
+            ]
+        },
+        {"SpotFleetRequestIds": ["sfr-1"]},
+    )
+    stubber.add_response(
+        "describe_spot_fleet_request_history",
+        {"HistoryRecords": [instance_change("i-1")]},
+        {"SpotFleetRequestId": "sfr-1", "StartTime": START, "MaxResults": 1000},
+    )
+    stubber.add_response(
+        "describe_instances",
+        {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {
+                            "InstanceId": "i-1",
+                            "State": {"Name": "terminated"},
+                            "StateReason": {"Code": "Server.SpotInstanceTermination"},
+                        }
+                    ]
+                }
+            ]
+        },
+        instance_filter(["i-1"]),
+    )
+    stubber.add_response(
+        "describe_spot_instance_requests", {"SpotInstanceRequests": []}, instance_filter(["i-1"])
+    )
+
+    scanned = scan_fleets(
+        ["sfr-1"], ec2_client=client, max_workers=1, start_time=START, history_cache=cache
+    )
+    stubber.assert_no_pending_responses()
+    # No responses are queued, so any EC2 call would fail the second scan
+    cached = scan_fleets(
+        ["sfr-1"], ec2_client=client, max_workers=1, start_time=START, history_cache=cache
+    )
+
+    assert cache.is_complete("sfr-1")
+    assert [i["instance_id"] for i in cached["sfr-1"]["preempted_instances"]] == ["i-1"]
+    assert cached["sfr-1"]["fleet_history"] == scanned["sfr-1"]["fleet_history"]
@@ -0,0 +1,93 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from conftest import ROOT
+from launch_aws_spot_fleet import preprocess_user_data
+
+# The user's program only stops when it is signalled; the lines after it show that the
+# script itself survives the signal
+USER_DATA = """#!/bin/bash
+bash -c 'trap "echo signalled > $OUT/signalled; exit 0" USR1; touch $OUT/started; while true; do sleep 0.1; done'
+echo finished > $OUT/finished
+"""
+
+
+def wait_for(condition, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.1)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def metadata_server(tmp_path):
+    """fake_instance_metadata.py, running until the test ends."""
+    port = free_port()
+    with open(tmp_path / "metadata_server.log", "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "fake_instance_metadata.py"), "--port", str(port)],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    url = f"http://127.0.0.1:{port}"
+
+    def up():
+        try:
+            return requests.put(f"{url}/latest/api/token", timeout=1).ok
+        except requests.ConnectionError:
+            return False
+
+    try:
+        wait_for(up)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def test_interruption_notice_signals_the_user_scripts_process_group(tmp_path, metadata_server):
+    user_data = preprocess_user_data(
+        USER_DATA,
+        None,
+        False,
+        "job-1",
+        watch_interruptions=True,
+        interruption_poll_interval=0.2,
+        interruption_signal="USR1",
+        interruption_hook=f'echo "$VIBEPILOT_INTERRUPTION_ACTION" > {tmp_path}/hook',
+    )
+    (tmp_path / "user_data.sh").write_text(user_data)
+    script = subprocess.Popen(
+        ["bash", str(tmp_path / "user_data.sh")],
+        env={**os.environ, "VIBEPILOT_IMDS": metadata_server, "OUT": str(tmp_path)},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        wait_for((tmp_path / "started").exists)
+        time.sleep(0.5)
+        assert not (tmp_path / "signalled").exists()
+
+        assert requests.post(f"{metadata_server}/interrupt", timeout=5).ok
+        output = script.communicate(timeout=20)[0].decode()
+    finally:
+        script.kill()
+
+    assert script.returncode == 0, output
+    assert "Spot interruption notice" in output
+    assert '"action": "terminate"' in (tmp_path / "hook").read_text()
+    assert (tmp_path / "signalled").read_text() == "signalled\n"
+    assert (tmp_path / "finished").read_text() == "finished\n"
@@ -0,0 +1,94 @@
+import json
+
+from ec2_inventory import Ec2Inventory
+from inventory_feed import InventoryFeed, diff_rows, inventory_rows
+
+
+def snapshot(instances: dict, spot_requests: list = ()) -> dict:
+    return {"instances": instances, "spot_requests": list(spot_requests)}
+
+
+def events(messages: list) -> list:
+    """Parse server-sent events into [(name, data)]."""
+    parsed = []
+    for message in messages:
+        fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+class FakeInventory(Ec2Inventory):
+    """An inventory whose refreshes return the snapshots it is given."""
+
+    def __init__(self, *snapshots):
+        super().__init__(ttl=3600)
+        self.snapshots = list(snapshots)
+
+    def refresh(self):
+        self._snapshot, self._refreshed_at = self.snapshots.pop(0), float("inf")
+        for listener in self._listeners:
+            listener(None, self._snapshot)
+        return self._snapshot
+
+
+def test_rows_are_diffed_by_kind_and_id():
+    previous = inventory_rows(
+        snapshot(
+            {"i-1": {"Tags": "a=1"}, "i-2": {"Tags": ""}},
+            [{"sir-1": "a=1", "KeyName": "key", "Region": "us-east-1"}],
+        )
+    )
+    current = inventory_rows(snapshot({"i-1": {"Tags": "a=2"}, "i-3": {"Tags": ""}}))
+
+    assert previous[("spot_request", "sir-1")] == {
+        "Tags": "a=1",
+        "KeyName": "key",
+        "Region": "us-east-1",
+    }
+    changes = sorted(diff_rows(previous, current), key=lambda c: (c["kind"], c["id"]))
+    assert [(c["op"], c["kind"], c["id"]) for c in changes] == [
+        ("changed", "instance", "i-1"),
+        ("removed", "instance", "i-2"),
+        ("added", "instance", "i-3"),
+        ("removed", "spot_request", "sir-1"),
+    ]
+    assert diff_rows(current, current) == []
+    assert inventory_rows(None) == {}
+
+
+def test_stream_sends_a_snapshot_and_then_only_changes():
+    inventory = FakeInventory(
+        snapshot({"i-1": {"Tags": ""}}),
+        snapshot({"i-1": {"Tags": ""}}),
+        snapshot({"i-1": {"Tags": ""}, "i-2": {"Tags": ""}}),
+    )
+    feed = InventoryFeed(inventory, keepalive=0.01)
+    stream = feed.stream()
+
+    assert events([next(stream)]) == [
+        ("snapshot", [{"kind": "instance", "id": "i-1", "row": {"Tags": ""}}])
+    ]
+    assert feed.subscriber_count() == 1
+    # An unchanged refresh sends nothing but keepalives
+    inventory.refresh()
+    assert next(stream) == ": keepalive\n\n"
+    inventory.refresh()
+    assert events([next(stream)]) == [
+        ("diff", [{"op": "added", "kind": "instance", "id": "i-2", "row": {"Tags": ""}}])
+    ]
+    stream.close()
+    assert feed.subscriber_count() == 0
+
+
+def test_subscribers_that_fall_behind_are_dropped():
+    inventory = FakeInventory(*[snapshot({f"i-{n}": {}}) for n in range(4)])
+    feed = InventoryFeed(inventory, max_queued=2, keepalive=0.01)
+    inventory.refresh()
+    stream = feed.stream()
+    next(stream)
+
+    for _ in range(3):
+        inventory.refresh()
+    assert feed.subscriber_count() == 0
+    # The queued diffs are still sent, then the stream ends so the browser reconnects
+    assert [name for name, _ in events(list(stream))] == ["diff", "diff"]
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+import share_ips
+from ip_registry import IpRegistry
+
+
+def utc(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def test_entries_are_filed_under_their_london_day(tmp_path):
+    registry = IpRegistry(str(tmp_path / "registry.db"))
+    # 23:30 UTC is already the next day in London during summer time
+    registry.register("10.0.0.1", utc(2024, 6, 1, 23, 30))
+    registry.register_many([("10.0.0.2", utc(2024, 6, 1, 12)), ("10.0.0.3", utc(2024, 6, 3))])
+
+    assert registry.days() == [("2024-06-01", 1), ("2024-06-02", 1), ("2024-06-03", 1)]
+    assert registry.days("2024-06-02", "2024-06-02") == [("2024-06-02", 1)]
+    (entry,) = registry.entries(start="2024-06-02", end="2024-06-02")
+    assert entry[2:] == ("10.0.0.1", utc(2024, 6, 1, 23, 30), "02/06/2024 - 00:30:00")
+
+
+def test_replay_pages_through_entries(tmp_path, monkeypatch):
+    registry = IpRegistry(str(tmp_path / "registry.db"))
+    registry.register_many(
+        [(f"10.0.0.{n}", utc(2024, 6, 1 + n // 2, 12)) for n in range(5)]
+    )
+    monkeypatch.setattr(share_ips, "registry", registry)
+    client = share_ips.app.test_client()
+
+    ips, cursor, pages = [], None, 0
+    while True:
+        query = {"format": "json", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/replay", query_string=query).get_json()
+        ips += [entry["ip"] for entry in page["entries"]]
+        cursor, pages = page["next_cursor"], pages + 1
+        if cursor is None:
+            break
+
+    assert ips == [f"10.0.0.{n}" for n in range(5)]
+    assert pages == 3
+    assert page["days"] == [
+        {"day": "2024-06-01", "count": 2},
+        {"day": "2024-06-02", "count": 2},
+        {"day": "2024-06-03", "count": 1},
+    ]
+    html = client.get("/replay", query_string={"start": "2024-06-03"}).get_data(as_text=True)
+    assert "1 registrations over 1 days" in html
+    assert "10.0.0.4" in html and "10.0.0.3" not in html
+    assert client.get("/replay", query_string={"cursor": "nonsense"}).status_code == 400
@@ -0,0 +1,84 @@
+import concurrent.futures
+import time
+
+import pytest
+
+from job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+def test_register_and_look_up(store):
+    store.register("job-1", "sfr-1", "us-west-2")
+    store.register_many([("job-2", "sfr-2"), ("job-3", "sfr-2", "eu-west-1")])
+
+    assert store.fleet_id("job-1") == "sfr-1"
+    assert store.job("job-1")["status"] == "registered"
+    assert store.fleet_id("missing") is None
+    assert store.fleet_regions(["sfr-1", "sfr-2", "sfr-9"]) == {
+        "sfr-1": "us-west-2",
+        "sfr-2": "eu-west-1",
+        "sfr-9": None,
+    }
+
+
+def test_registering_again_replaces_the_fleet(store):
+    store.register("job-1", "sfr-1")
+    store.set_fleet_status("sfr-1", "terminated")
+    store.register("job-1", "sfr-2")
+
+    job = store.job("job-1")
+    assert (job["fleet_id"], job["status"]) == ("sfr-2", "registered")
+
+
+def test_concurrent_registrations_are_all_committed(store):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda i: store.register(f"job-{i}", f"sfr-{i}"), range(200)))
+
+    assert store.pending_registrations() == 0
+    assert all(store.fleet_id(f"job-{i}") == f"sfr-{i}" for i in range(200))
+
+
+def test_shards_are_claimed_once(store):
+    store.register("job-1", "sfr-1")
+    store.create_shards("job-1", 3)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        claims = list(executor.map(lambda i: store.claim_shard("job-1", f"i-{i}"), range(8)))
+
+    assert sorted(c for c in claims if c is not None) == [0, 1, 2]
+    holder = next(f"i-{i}" for i, c in enumerate(claims) if c == 1)
+    assert store.claim_shard("job-1", holder) == 1
+    assert store.release_shards("job-1", [holder]) == 1
+    assert store.finish_shard("job-1", 0)
+    assert store.shard_counts("job-1") == {"claimed": 1, "done": 1, "pending": 1}
+
+def test_pool_jobs_run_in_submission_order(store):
+    assert store.create_pool("pool", "sfr-1", "pool-job", target_capacity=2)
+    assert not store.create_pool("pool", "sfr-2", "pool-job-2", target_capacity=1)
+    store.submit_pool_job("a", "pool", "echo a")
+    store.submit_pool_job("b", "pool", "echo b")
+
+    assert store.next_pool_job("pool", "i-1") == "a"
+    assert store.next_pool_job("pool", "i-2") == "b"
+    assert store.next_pool_job("pool", "i-3") is None
+    assert store.finish_pool_job("a", 0)
+    assert store.requeue_pool_jobs(["i-2"]) == 1
+    assert store.pool_counts("pool") == {"done": 1, "queued": 1}
+
+def test_compaction_removes_old_finished_jobs(store):
+    store.register("old", "sfr-1")
+    store.register("live", "sfr-2")
+    store.set_fleet_status("sfr-1", "terminated")
+
+    assert store.compact(retention_seconds=3600) == 0
+    time.sleep(0.01)
+    assert store.compact(retention_seconds=0) == 1
+
+    assert store.job("old") is None
+    assert store.job("live") is not None
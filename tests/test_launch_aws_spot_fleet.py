@@ -0,0 +1,252 @@
+import copy
+import json
+import os
+
+import pytest
+import requests
+from botocore.stub import ANY
+
+import launch_aws_spot_fleet
+
+from conftest import ROOT
+from instance_ranking import InstanceTypeRanker
+from launch_aws_spot_fleet import (
+    AwsSpotInstanceRequest,
+    build_spot_fleet_config,
+    launch,
+    request_spot_fleet,
+    wait_for_fleet_instance,
+)
+
+SUBNETS = ["subnet-0000000000000000a", "subnet-0000000000000000b"]
+USER_DATA = "#!/bin/bash\necho hello\n"
+CONTROLLER = "http://controller:7451"
+
+
+def launch_template() -> dict:
+    with open(os.path.join(ROOT, "default_spot_fleet.json"), "r") as f:
+        template = json.load(f)
+    template["Regions"]["us-east-1"]["SubnetIds"] = SUBNETS
+    return template
+
+
+def request(**kwargs) -> AwsSpotInstanceRequest:
+    return AwsSpotInstanceRequest(
+        instance_name="test",
+        launch_template=os.path.join(ROOT, "default_spot_fleet.json"),
+        user_data="user_data.sh",
+        **kwargs,
+    )
+
+
+def add_ranking_responses(stubber, instance_types: list):
+    """Answer the calls of InstanceTypeRanker.rank, scoring the last instance type best."""
+    stubber.add_response(
+        "describe_subnets",
+        {
+            "Subnets": [
+                {"SubnetId": subnet_id, "AvailabilityZone": zone, "AvailabilityZoneId": zone_id}
+                for subnet_id, zone, zone_id in [
+                    (SUBNETS[0], "us-east-1a", "use1-az1"),
+                    (SUBNETS[1], "us-east-1b", "use1-az2"),
+                ]
+            ]
+        },
+        {"SubnetIds": SUBNETS},
+    )
+    stubber.add_response(
+        "describe_spot_price_history",
+        {
+            "SpotPriceHistory": [
+                {"InstanceType": t, "AvailabilityZone": "us-east-1a", "SpotPrice": "0.1"}
+                for t in instance_types
+            ]
+        },
+        {
+            "InstanceTypes": instance_types,
+            "ProductDescriptions": ["Linux/UNIX"],
+            "StartTime": ANY,
+            "EndTime": ANY,
+        },
+    )
+    for score, instance_type in enumerate(instance_types, start=1):
+        stubber.add_response(
+            "get_spot_placement_scores",
+            {"SpotPlacementScores": [{"AvailabilityZoneId": "use1-az2", "Score": score}]},
+            {
+                "InstanceTypes": [instance_type],
+                "TargetCapacity": 1,
+                "SingleAvailabilityZone": True,
+                "RegionNames": ["us-east-1"],
+            },
+        )
+
+
+def test_spot_fleet_config_is_a_valid_request(ec2):
+    client, stubber = ec2
+    args = request(instance_types=["t3.micro", "t3.small"])
+    config = build_spot_fleet_config(args, launch_template(), USER_DATA, job_uuid="job")
+
+    assert "Regions" not in config
+    assert [s["InstanceType"] for s in config["LaunchSpecifications"]] == ["t3.micro", "t3.small"]
+    assert config["LaunchSpecifications"][0]["SubnetId"] == ", ".join(SUBNETS)
+    assert {"Key": "Name", "Value": "test"} in config["TagSpecifications"][0]["Tags"]
+
+    stubber.add_response(
+        "request_spot_fleet", {"SpotFleetRequestId": "sfr-1"}, {"SpotFleetRequestConfig": config}
+    )
+    assert request_spot_fleet(client, config) == "sfr-1"
+
+
+def test_ranked_config_is_a_valid_request(ec2):
+    client, stubber = ec2
+    instance_types = ["t3.micro", "t3.small"]
+    args = request(instance_types=instance_types)
+    config = build_spot_fleet_config(args, launch_template(), USER_DATA, job_uuid="job")
+    add_ranking_responses(stubber, instance_types)
+
+    ranked = InstanceTypeRanker(client).apply(config, min_score=2, prioritize=True)
+
+    assert [s["InstanceType"] for s in ranked["LaunchSpecifications"]] == ["t3.small", "t3.micro"]
+    assert ranked["LaunchSpecifications"][0]["SubnetId"] == SUBNETS[1]
+    # Launch specifications have no Priority; EC2 rejects the request if they get one
+    assert all("Priority" not in s for s in ranked["LaunchSpecifications"])
+    stubber.add_response(
+        "request_spot_fleet", {"SpotFleetRequestId": "sfr-1"}, {"SpotFleetRequestConfig": ANY}
+    )
+    assert request_spot_fleet(client, ranked) == "sfr-1"
+
+
+def test_priorities_go_to_launch_template_overrides(ec2):
+    client, stubber = ec2
+    instance_types = ["t3.micro", "t3.small"]
+    args = request(instance_types=instance_types)
+    config = build_spot_fleet_config(args, launch_template(), USER_DATA, job_uuid="job")
+    config["LaunchTemplateConfigs"] = [
+        {
+            "LaunchTemplateSpecification": {"LaunchTemplateId": "lt-1", "Version": "1"},
+            "Overrides": [{"InstanceType": t} for t in instance_types],
+        }
+    ]
+    add_ranking_responses(stubber, instance_types)
+
+    ranked = InstanceTypeRanker(client).apply(copy.deepcopy(config), prioritize=True)
+
+    overrides = ranked["LaunchTemplateConfigs"][0]["Overrides"]
+    assert {o["InstanceType"]: o["Priority"] for o in overrides} == {
+        "t3.small": 0.0,
+        "t3.micro": 1.0,
+    }
+    assert ranked["AllocationStrategy"] == "capacityOptimizedPrioritized"
+    assert "Priority" not in config["LaunchTemplateConfigs"][0]["Overrides"][0]
+
+
+def test_wait_for_fleet_instance_retries_unknown_new_instances(ec2):
+    client, stubber = ec2
+    stubber.add_response(
+        "describe_spot_fleet_instances",
+        {"ActiveInstances": [{"InstanceId": "i-1", "InstanceType": "t3.micro"}]},
+        {"SpotFleetRequestId": "sfr-1"},
+    )
+    stubber.add_client_error(
+        "describe_instances",
+        service_error_code="InvalidInstanceID.NotFound",
+        expected_params={"InstanceIds": ["i-1"]},
+    )
+    stubber.add_response(
+        "describe_instances",
+        {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {
+                            "InstanceId": "i-1",
+                            "State": {"Name": "running"},
+                            "Placement": {"AvailabilityZone": "us-east-1a"},
+                        }
+                    ]
+                }
+            ]
+        },
+        {"InstanceIds": ["i-1"]},
+    )
+
+    instance = wait_for_fleet_instance(client, "sfr-1", initial_delay=0)
+
+    assert (instance["instance_id"], instance["instance_type"]) == ("i-1", "t3.micro")
+    assert instance["availability_zone"] == "us-east-1a"
+    assert instance["fulfilled"] <= instance["running"]
+
+
+class PoolController:
+    """Answers the pool requests of launch(): the pool is missing until it is registered,
+    unless `registered` says otherwise, and registering raises `register_error`."""
+
+    def __init__(self, register_error=None, registered=True):
+        self.register_error = register_error
+        self.registered = registered
+        self.pool = None
+
+    def post(self, url, json=None, **kwargs):
+        response = requests.Response()
+        if url.endswith("/jobs"):
+            response.status_code = 200 if self.pool else 404
+            response._content = b'{"position": 1}'
+        else:
+            if self.register_error:
+                raise self.register_error
+            self.pool = json if self.registered else None
+            response.status_code = 200
+        return response
+
+
+@pytest.fixture
+def pool_launch(ec2, monkeypatch):
+    """launch() of a job on a missing pool, with EC2 stubbed to request its fleet."""
+    client, stubber = ec2
+    monkeypatch.setattr(launch_aws_spot_fleet.aws_clients, "ec2_client", lambda region: client)
+    stubber.add_response(
+        "request_spot_fleet", {"SpotFleetRequestId": "sfr-pool"}, {"SpotFleetRequestConfig": ANY}
+    )
+    args = request(pool="pool", terminate_fleet_on_finish_controller=CONTROLLER)
+    output = []
+
+    def run(session):
+        return launch(
+            args,
+            launch_template(),
+            USER_DATA,
+            session=session,
+            out=output.append,
+            controller_reachable=lambda controller: True,
+        )
+
+    yield run, stubber, output
+    stubber.assert_no_pending_responses()
+
+
+def test_missing_pool_is_launched_and_the_job_queued(pool_launch):
+    run, _, output = pool_launch
+    controller = PoolController()
+
+    assert run(controller) == 0
+    assert controller.pool["fleet_id"] == "sfr-pool"
+    assert "queued on pool pool at position 1" in output[-2]
+
+
+def test_pool_fleet_is_cancelled_if_it_cannot_be_registered(pool_launch):
+    run, stubber, _ = pool_launch
+    stubber.add_response(
+        "cancel_spot_fleet_requests",
+        {},
+        {"SpotFleetRequestIds": ["sfr-pool"], "TerminateInstances": True},
+    )
+
+    assert run(PoolController(requests.exceptions.ConnectionError("controller is down"))) == 1
+
+
+def test_job_is_not_queued_on_a_pool_that_is_gone(pool_launch):
+    run, _, output = pool_launch
+
+    assert run(PoolController(registered=False)) == 1
+    assert not any("queued" in line for line in output)
@@ -0,0 +1,111 @@
+import requests
+from botocore.stub import ANY
+
+import launch_aws_spot_fleet_batch
+from launch_aws_spot_fleet_batch import launch_batch
+from test_launch_aws_spot_fleet import USER_DATA, request
+
+CONTROLLER = "http://controller:7451"
+
+
+class FakeSession:
+    """Records the registration requests sent to the controller, failing them if asked to."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.posts = []
+
+    def post(self, url, json):
+        if self.fail:
+            raise requests.exceptions.ConnectionError("controller is down")
+        self.posts.append(json["jobs"])
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+def batch_jobs(tmp_path, count: int, **kwargs) -> list:
+    user_data = tmp_path / "user_data.sh"
+    user_data.write_text(USER_DATA)
+    jobs = []
+    for _ in range(count):
+        job = request(terminate_fleet_on_finish_controller=CONTROLLER, **kwargs)
+        job.user_data = str(user_data)
+        jobs.append(job)
+    return jobs
+
+
+def add_fleet_responses(stubber, count: int):
+    for i in range(count):
+        stubber.add_response(
+            "request_spot_fleet",
+            {"SpotFleetRequestId": f"sfr-{i}"},
+            {"SpotFleetRequestConfig": ANY},
+        )
+
+
+def test_each_chunk_is_registered_in_one_request(ec2, tmp_path, monkeypatch):
+    client, stubber = ec2
+    monkeypatch.setattr(
+        launch_aws_spot_fleet_batch, "check_termination_controller_status", lambda c: True
+    )
+    add_fleet_responses(stubber, 4)
+    session = FakeSession()
+
+    results = launch_batch(
+        batch_jobs(tmp_path, 4), ec2_client=client, max_workers=2, session=session
+    )
+
+    assert [r["error"] for r in results] == [None] * 4
+    assert [len(jobs) for jobs in session.posts] == [2, 2]
+    assert {(j["uuid"], j["fleet_id"]) for jobs in session.posts for j in jobs} == {
+        (r["job_uuid"], r["fleet_id"]) for r in results
+    }
+
+
+def test_chunks_that_cannot_be_registered_are_cancelled(ec2, tmp_path, monkeypatch):
+    client, stubber = ec2
+    monkeypatch.setattr(
+        launch_aws_spot_fleet_batch, "check_termination_controller_status", lambda c: True
+    )
+    add_fleet_responses(stubber, 2)
+    stubber.add_response(
+        "cancel_spot_fleet_requests",
+        {},
+        {"SpotFleetRequestIds": ["sfr-0", "sfr-1"], "TerminateInstances": True},
+    )
+
+    results = launch_batch(
+        batch_jobs(tmp_path, 2), ec2_client=client, max_workers=1, session=FakeSession(fail=True)
+    )
+
+    assert [r["fleet_id"] for r in results] == [None, None]
+    assert all("cancelled" in r["error"] for r in results)
+
+
+def test_wait_for_running_is_rejected(ec2, tmp_path, monkeypatch):
+    client, _ = ec2
+    monkeypatch.setattr(
+        launch_aws_spot_fleet_batch, "check_termination_controller_status", lambda c: True
+    )
+    session = FakeSession()
+
+    results = launch_batch(
+        batch_jobs(tmp_path, 1, wait_for_running=True), ec2_client=client, session=session
+    )
+
+    assert results[0]["fleet_id"] is None
+    assert "wait_for_running" in results[0]["error"]
+    assert session.posts == []
+
+
+def test_pool_jobs_are_rejected(ec2, tmp_path, monkeypatch):
+    client, _ = ec2
+    monkeypatch.setattr(
+        launch_aws_spot_fleet_batch, "check_termination_controller_status", lambda c: True
+    )
+
+    results = launch_batch(batch_jobs(tmp_path, 1, pool="pool"), ec2_client=client)
+
+    assert results[0]["fleet_id"] is None
+    assert "--pool" in results[0]["error"]
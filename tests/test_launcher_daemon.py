@@ -0,0 +1,62 @@
+import os
+import stat
+
+from launcher_daemon import Launcher, create_app, write_token
+
+REQUIRED = ["--launch-template", "template.json", "--user-data", "user_data.sh", "--instance-name", "test"]
+
+
+def test_parse_resolves_paths_against_the_submitters_cwd(tmp_path):
+    args, exit_code, stdout, stderr = Launcher().parse(
+        REQUIRED + ["--user-data-stage", "s3://bucket/stage"], str(tmp_path)
+    )
+
+    assert (exit_code, stdout, stderr) == (None, "", "")
+    assert args.launch_template == str(tmp_path / "template.json")
+    assert args.user_data == str(tmp_path / "user_data.sh")
+    assert args.user_data_stage == "s3://bucket/stage"
+
+
+def test_parse_returns_help_and_errors_without_printing_them(tmp_path, capsys):
+    launcher = Launcher()
+
+    args, exit_code, stdout, _ = launcher.parse(["--help"], str(tmp_path))
+    assert (args, exit_code) == (None, 0)
+    assert "--launch-template" in stdout
+
+    args, exit_code, _, stderr = launcher.parse(REQUIRED[2:], str(tmp_path))
+    assert (args, exit_code) == (None, 2)
+    assert "--launch-template" in stderr
+
+    args, exit_code, _, stderr = launcher.parse(REQUIRED + ["--pool-size", "0", "--pool", "p"], str(tmp_path))
+    assert (args, exit_code) == (None, 1)
+    assert stderr.startswith("AssertionError")
+
+    assert capsys.readouterr() == ("", "")
+
+
+def test_token_is_required_over_tcp(tmp_path):
+    path = str(tmp_path / "launcher.token")
+    with open(path, "w") as f:
+        f.write("old")
+    os.chmod(path, 0o644)
+
+    token = write_token(path)
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    with open(path, "r") as f:
+        assert f.read() == token
+    client = create_app(Launcher(), token=token).test_client()
+    assert client.get("/status").status_code == 401
+    assert client.get("/status", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/status", headers={"Authorization": f"Bearer {token}"})
+    assert response.json["status"] == "healthy"
+
+
+def test_submissions_need_an_argv_list():
+    client = create_app(Launcher()).test_client()
+
+    assert client.post("/launch", json={"argv": "--help"}).status_code == 400
+    response = client.post("/launch", json={"argv": ["--help"]})
+    assert response.json["exit_code"] == 0
+    assert "--launch-template" in response.json["stdout"]
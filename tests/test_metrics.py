@@ -0,0 +1,83 @@
+from flask import Flask
+
+import metrics
+import termination_controller
+from metrics import Registry, instrument_app
+
+
+def samples(text: str) -> dict:
+    """Parse the sample lines of a Prometheus text exposition into {series: value}."""
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line and not line.startswith("#")
+    }
+
+
+def test_metrics_are_rendered_in_the_text_format():
+    registry = Registry()
+    counter = registry.counter("jobs_total", "Jobs.", ("status",))
+    counter.inc('a "quoted"\nvalue')
+    counter.inc("done", amount=2)
+    histogram = registry.histogram("wait_seconds", "Waits.", buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 5.0]:
+        histogram.observe(value)
+    registry.callback("queue_depth", "Depth.", lambda: 3)
+    registry.callback("broken", "Broken.", lambda: 1 / 0)
+
+    text = registry.render()
+
+    assert "# TYPE jobs_total counter" in text
+    assert "# TYPE wait_seconds histogram" in text
+    assert "# broken unavailable: division by zero" in text
+    assert samples(text) == {
+        'jobs_total{status="a \\"quoted\\"\\nvalue"}': 1,
+        'jobs_total{status="done"}': 2,
+        'wait_seconds_bucket{le="0.1"}': 1,
+        'wait_seconds_bucket{le="1.0"}': 2,
+        'wait_seconds_bucket{le="+Inf"}': 3,
+        "wait_seconds_sum": 5.55,
+        "wait_seconds_count": 3,
+        "queue_depth": 3,
+    }
+
+
+def test_requests_are_counted_by_route():
+    app, registry = Flask(__name__), Registry()
+    instrument_app(app, registry)
+    app.add_url_rule("/jobs/<job_id>", "job", lambda job_id: job_id)
+    client = app.test_client()
+
+    for job_id in ["a", "b"]:
+        client.get(f"/jobs/{job_id}")
+    client.get("/missing")
+    response = client.get("/metrics")
+
+    assert response.content_type == metrics.CONTENT_TYPE
+    values = samples(response.get_data(as_text=True))
+    assert values['vibepilot_http_requests_total{route="/jobs/<job_id>",method="GET",status="200"}'] == 2
+    assert values['vibepilot_http_requests_total{route="unmatched",method="GET",status="404"}'] == 1
+    assert values['vibepilot_http_request_duration_seconds_count{route="/jobs/<job_id>",method="GET"}'] == 2
+
+
+def test_sqlite_transactions_are_timed(tmp_path):
+    conn = metrics.connect(str(tmp_path / "test.db"), "test_db")
+    with conn:
+        conn.execute("CREATE TABLE t (x)")
+    conn.close()
+
+    values = samples(metrics.REGISTRY.render())
+    assert values['vibepilot_sqlite_write_seconds_count{database="test_db"}'] == 1
+
+
+def test_controller_serves_its_metrics():
+    text = termination_controller.app.test_client().get("/metrics").get_data(as_text=True)
+
+    for name in [
+        "vibepilot_termination_queue_depth",
+        "vibepilot_pending_registrations",
+        "vibepilot_pool_jobs",
+        "vibepilot_http_requests_total",
+    ]:
+        assert f"# TYPE {name} " in text
+    assert "unavailable" not in text
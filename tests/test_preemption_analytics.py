@@ -0,0 +1,80 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from fleet_history_cache import FleetHistoryCache
+from preemption_analytics import cached_events_frame, events_frame, load_timeline, preemption_report
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def history(fleet: int) -> list:
+    records = [
+        {"EventType": "fleetRequestChange", "Timestamp": START,
+         "EventInformation": {"EventSubType": "submitted"}},
+    ]
+    for n, zone in enumerate(["us-east-1a", "us-east-1b"]):
+        instance_id = f"i-{fleet}{n}"
+        description = json.dumps({"instanceType": "g5.xlarge", "availabilityZone": zone})
+        records += [
+            {"EventType": "instanceChange", "Timestamp": START + timedelta(minutes=1 + n),
+             "EventInformation": {"EventSubType": "launched", "InstanceId": instance_id,
+                                  "EventDescription": description}},
+            {"EventType": "instanceChange", "Timestamp": START + timedelta(hours=1, minutes=1 + n),
+             "EventInformation": {"EventSubType": "terminated", "InstanceId": instance_id}},
+        ]
+    return records
+
+
+def cache_with_fleets(tmp_path) -> FleetHistoryCache:
+    cache = FleetHistoryCache(str(tmp_path / "history.db"))
+    for fleet in range(2):
+        fleet_id = f"sfr-{fleet}"
+        cache.add_records(fleet_id, history(fleet), state="cancelled")
+        cache.save_instances(
+            fleet_id,
+            {
+                "preempted_instances": [{"instance_id": f"i-{fleet}0"}],
+                "non_preempted_instances": [{"instance_id": f"i-{fleet}1"}],
+            },
+        )
+    return cache
+
+
+def test_events_frame_flattens_records():
+    records = history(0)
+    records[1]["EventInformation"]["EventDescription"] = "not json"
+
+    events = events_frame({"sfr-0": records})
+
+    assert list(events["event_sub_type"]) == [
+        "submitted", "launched", "terminated", "launched", "terminated"
+    ]
+    assert events["timestamp"].iloc[1] == pd.Timestamp(START + timedelta(minutes=1))
+    assert list(events["availability_zone"].iloc[1:4]) == [None, None, "us-east-1b"]
+    assert events["fleet_id"].dtype == "category"
+
+
+def test_cached_events_match_loaded_records(tmp_path):
+    cache = cache_with_fleets(tmp_path)
+
+    cached = cached_events_frame(cache)
+    loaded = events_frame({fleet_id: cache.history(fleet_id) for fleet_id in cache.fleet_ids()})
+
+    pd.testing.assert_frame_equal(cached, loaded, check_dtype=False)
+    assert len(cached_events_frame(cache, ["sfr-1"])) == len(history(1))
+
+
+def test_report_from_a_cold_cache(tmp_path):
+    cache_with_fleets(tmp_path).close()
+
+    timeline = load_timeline(FleetHistoryCache(str(tmp_path / "history.db")))
+    report = preemption_report(timeline)
+
+    assert len(timeline) == 4
+    assert set(timeline["instance_type"]) == {"g5.xlarge"}
+    assert (timeline["lifetime_s"] == 3600).all()
+    by_zone = report["by_availability_zone"].set_index("availability_zone")
+    assert by_zone.loc["us-east-1a", "preemption_rate"] == 1.0
+    assert by_zone.loc["us-east-1b", "preemption_rate"] == 0.0
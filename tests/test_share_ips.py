@@ -0,0 +1,18 @@
+import share_ips
+
+
+def test_dashboard_escapes_tag_values(monkeypatch):
+    tags = "Name=<script>alert(1)</script>"
+    snapshot = {
+        "instances": {
+            "i-1": {"Tags": tags, "KeyName": "key", "PublicIpAddress": "1.2.3.4", "Region": "us-east-1"}
+        },
+        "spot_requests": [{"sir-1": tags, "KeyName": "<b>key</b>", "Region": "us-east-1"}],
+    }
+    monkeypatch.setattr(share_ips.inventory, "snapshot", lambda: snapshot)
+
+    html = share_ips.app.test_client().get("/dashboard").get_data(as_text=True)
+
+    assert "<script>alert" not in html and "<b>key" not in html
+    assert html.count("Name=&lt;script&gt;alert(1)&lt;/script&gt;") == 2
+    assert "<td>sir-1</td>" in html
@@ -0,0 +1,307 @@
+import uuid
+
+import pytest
+
+import termination_controller
+from fleet_autoscaler import ScalingPolicy
+
+
+@pytest.fixture
+def controller(ec2, monkeypatch):
+    """The controller's test client, with EC2 stubbed and terminations processed on demand."""
+    client, stubber = ec2
+    monkeypatch.setattr(termination_controller, "_ec2_client", client)
+    monkeypatch.setattr(termination_controller.termination_queue, "start", lambda: None)
+    yield termination_controller.app.test_client(), stubber
+
+
+def new_id(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:17]}"
+
+
+def active_instances(instance_ids: list) -> dict:
+    return {
+        "ActiveInstances": [
+            {"InstanceId": i, "InstanceType": "t3.micro", "SpotInstanceRequestId": f"sir-{i}"}
+            for i in instance_ids
+        ]
+    }
+
+
+def test_register_jobs(controller):
+    client, _ = controller
+    jobs = [
+        {"uuid": str(uuid.uuid4()), "fleet_id": new_id("sfr"), "region": "us-west-2"},
+        {"uuid": str(uuid.uuid4()), "fleet_id": new_id("sfr"), "submitted_at": 1.5, "shards": 2},
+    ]
+    response = client.post("/register_jobs", json={"jobs": jobs})
+    assert response.status_code == 200
+    assert response.json == {"status": "registered", "count": 2}
+
+    first = client.get(f"/termination_status/{jobs[0]['uuid']}").json["job"]
+    assert (first["fleet_id"], first["region"], first["status"]) == (
+        jobs[0]["fleet_id"],
+        "us-west-2",
+        "registered",
+    )
+    second = client.get(f"/termination_status/{jobs[1]['uuid']}").json["job"]
+    assert second["phases"]["submitted"] == 1.5
+    assert second["shards"] == {"pending": 2}
+
+
+def test_register_jobs_rejects_bad_payloads(controller):
+    client, _ = controller
+    assert client.post("/register_jobs", json={}).status_code == 400
+    assert client.post("/register_jobs", json={"jobs": [{"uuid": "x"}]}).status_code == 400
+
+
+def test_latency_histograms_of_job_events(controller):
+    client, _ = controller
+    job_uuid, since = str(uuid.uuid4()), 4e9
+    for phase, offset in [("submitted", 0), ("fulfilled", 20), ("running", 45)]:
+        response = client.get(
+            f"/job_event/{job_uuid}/{phase}",
+            query_string={"ts": since + offset, "instance_type": "t3.micro"},
+        )
+        assert response.status_code == 200
+    assert client.get(f"/job_event/{job_uuid}/unknown").status_code == 400
+
+    groups = client.get(
+        "/latency", query_string={"since": since, "group_by": "instance_type"}
+    ).json["groups"]
+
+    assert groups[0]["instance_type"] == "t3.micro"
+    intervals = groups[0]["intervals"]
+    assert set(intervals) == {"submit_to_fulfilled", "submit_to_running"}
+    assert intervals["submit_to_running"]["mean_s"] == 45
+    assert {"le": 60, "count": 1} in intervals["submit_to_running"]["buckets"]
+
+
+def test_terminate_fleet(controller):
+    client, stubber = controller
+    job_uuid, fleet_id = str(uuid.uuid4()), new_id("sfr")
+    client.get(f"/register_job/{job_uuid}/{fleet_id}")
+
+    response = client.get(f"/terminate_fleet/{job_uuid}")
+    assert response.status_code == 202
+    assert response.json["termination"]["status"] == "pending"
+    # A second request for the same fleet joins the first
+    assert client.get(f"/terminate_fleet/{job_uuid}").json["termination"]["status"] == "pending"
+
+    stubber.add_response(
+        "cancel_spot_fleet_requests",
+        {
+            "SuccessfulFleetRequests": [
+                {
+                    "SpotFleetRequestId": fleet_id,
+                    "CurrentSpotFleetRequestState": "cancelled_terminating",
+                    "PreviousSpotFleetRequestState": "active",
+                }
+            ]
+        },
+        {"SpotFleetRequestIds": [fleet_id], "TerminateInstances": True},
+    )
+    assert termination_controller.termination_queue.process_once() == 1
+
+    status = client.get(f"/termination_status/{job_uuid}").json
+    assert status["termination"]["status"] == "terminated"
+    assert status["job"]["status"] == "terminated"
+    assert client.get(f"/terminate_fleet/{uuid.uuid4()}").status_code == 404
+
+
+def test_claim_shard_is_idempotent(controller):
+    client, _ = controller
+    job_uuid = str(uuid.uuid4())
+    client.get(f"/register_job/{job_uuid}/{new_id('sfr')}?shards=2")
+
+    first = client.get(f"/claim_shard/{job_uuid}?instance_id=i-a")
+    retried = client.get(f"/claim_shard/{job_uuid}?instance_id=i-a")
+    other = client.get(f"/claim_shard/{job_uuid}?instance_id=i-b")
+
+    assert first.get_data(as_text=True) == "0\n"
+    assert retried.get_data(as_text=True) == "0\n"
+    assert other.get_data(as_text=True) == "1\n"
+    assert client.get(f"/claim_shard/{job_uuid}").status_code == 400
+    assert client.get(f"/claim_shard/{uuid.uuid4()}?instance_id=i-a").status_code == 404
+
+
+def test_shards_of_lost_instances_are_claimed_again(controller):
+    client, stubber = controller
+    job_uuid = str(uuid.uuid4())
+    client.get(f"/register_job/{job_uuid}/{new_id('sfr')}?shards=1")
+    assert client.get(f"/claim_shard/{job_uuid}?instance_id=i-lost").status_code == 200
+
+    stubber.add_response(
+        "describe_instances",
+        {"Reservations": []},
+        {"Filters": [{"Name": "instance-id", "Values": ["i-lost"]}]},
+    )
+    response = client.get(f"/claim_shard/{job_uuid}?instance_id=i-new")
+    assert response.get_data(as_text=True) == "0\n"
+    stubber.assert_no_pending_responses()
+
+
+def test_terminate_fleet_waits_for_shards(controller):
+    client, _ = controller
+    job_uuid = str(uuid.uuid4())
+    client.get(f"/register_job/{job_uuid}/{new_id('sfr')}?shards=1")
+
+    response = client.get(f"/terminate_fleet/{job_uuid}")
+    assert response.status_code == 202
+    assert response.json["status"] == "waiting_for_shards"
+
+
+def test_finished_shards_shrink_and_then_terminate_the_fleet(controller):
+    client, stubber = controller
+    job_uuid, fleet_id = str(uuid.uuid4()), new_id("sfr")
+    client.get(f"/register_job/{job_uuid}/{fleet_id}?shards=2")
+    for instance_id in ["i-a", "i-b"]:
+        client.get(f"/claim_shard/{job_uuid}?instance_id={instance_id}")
+
+    stubber.add_response(
+        "modify_spot_fleet_request",
+        {"Return": True},
+        {
+            "SpotFleetRequestId": fleet_id,
+            "TargetCapacity": 1,
+            "ExcessCapacityTerminationPolicy": "noTermination",
+        },
+    )
+    response = client.get(f"/finish_shard/{job_uuid}/0")
+    assert (response.json["unfinished"], response.json["termination"]) == (1, None)
+    stubber.assert_no_pending_responses()
+
+    response = client.get(f"/finish_shard/{job_uuid}/1")
+    assert response.json["unfinished"] == 0
+    assert response.json["termination"]["status"] == "pending"
+    stubber.add_response(
+        "cancel_spot_fleet_requests",
+        {"SuccessfulFleetRequests": [{"SpotFleetRequestId": fleet_id}]},
+        {"SpotFleetRequestIds": [fleet_id], "TerminateInstances": True},
+    )
+    assert termination_controller.termination_queue.process_once() == 1
+    assert client.get(f"/finish_shard/{job_uuid}/2").status_code == 404
+    assert client.get(f"/claim_shard/{job_uuid}?instance_id=i-c").status_code == 410
+
+def test_pool_jobs_are_handed_out_in_order(controller):
+    client, _ = controller
+    pool, pool_uuid = new_id("pool"), str(uuid.uuid4())
+    payload = {"fleet_id": new_id("sfr"), "job_uuid": pool_uuid, "target_capacity": 1}
+    assert client.post(f"/pools/{pool}/jobs", data="echo a").status_code == 404
+    assert client.post(f"/pools/{pool}", json=payload).status_code == 201
+    assert client.post(f"/pools/{pool}", json=payload).status_code == 409
+
+    jobs = [str(uuid.uuid4()) for _ in range(2)]
+    for position, job_uuid in enumerate(jobs, start=1):
+        response = client.post(
+            f"/pools/{pool}/jobs", query_string={"uuid": job_uuid}, data=f"echo {position}"
+        )
+        assert response.json["position"] == position
+
+    response = client.get(f"/pools/{pool}/next_job?instance_id=i-a")
+    assert response.get_data(as_text=True) == f"{jobs[0]}\n"
+    assert client.get(f"/pool_jobs/{jobs[0]}/script").get_data(as_text=True) == "echo 1"
+    assert client.get(f"/pool_jobs/{jobs[0]}/finish?exit_code=0").status_code == 200
+    assert client.get(f"/pools/{pool}").json["jobs"] == {"done": 1, "queued": 1}
+
+def test_leave_pool_keeps_the_fleet_while_jobs_run(controller):
+    client, stubber = controller
+    pool, fleet_id = new_id("pool"), new_id("sfr")
+    client.post(
+        f"/pools/{pool}",
+        json={"fleet_id": fleet_id, "job_uuid": str(uuid.uuid4()), "target_capacity": 2},
+    )
+    # The autoscaler scales a pool to zero when no instance is busy yet
+    termination_controller.job_store.set_pool_capacity(pool, 0)
+    client.post(f"/pools/{pool}/jobs", data="echo busy")
+    assert client.get(f"/pools/{pool}/next_job?instance_id=i-busy").status_code == 200
+
+    stubber.add_response(
+        "describe_spot_fleet_instances",
+        active_instances(["i-idle", "i-busy"]),
+        {"SpotFleetRequestId": fleet_id},
+    )
+    stubber.add_response("terminate_instances", {}, {"InstanceIds": ["i-idle"]})
+    response = client.get(f"/pools/{pool}/leave?instance_id=i-idle")
+
+    assert response.status_code == 200
+    assert response.json["termination"] is None
+    assert termination_controller.job_store.pool(pool) is not None
+
+
+def test_last_instance_leaving_cancels_the_pool(controller):
+    client, stubber = controller
+    pool, fleet_id, pool_uuid = new_id("pool"), new_id("sfr"), str(uuid.uuid4())
+    client.post(
+        f"/pools/{pool}",
+        json={"fleet_id": fleet_id, "job_uuid": pool_uuid, "target_capacity": 1},
+    )
+
+    stubber.add_response(
+        "describe_spot_fleet_instances",
+        active_instances(["i-last"]),
+        {"SpotFleetRequestId": fleet_id},
+    )
+    response = client.get(f"/pools/{pool}/leave?instance_id=i-last")
+
+    assert response.status_code == 200
+    assert response.json["termination"]["status"] == "pending"
+    assert termination_controller.job_store.pool(pool) is None
+    assert termination_controller.termination_queue.job_status(pool_uuid)["fleet_id"] == fleet_id
+    stubber.add_response(
+        "cancel_spot_fleet_requests",
+        {"SuccessfulFleetRequests": [{"SpotFleetRequestId": fleet_id}]},
+        {"SpotFleetRequestIds": [fleet_id], "TerminateInstances": True},
+    )
+    assert termination_controller.termination_queue.process_once() == 1
+
+
+def test_scaling_a_pool_down_terminates_its_idle_instances(controller, monkeypatch):
+    client, stubber = controller
+    monkeypatch.setattr(
+        termination_controller,
+        "AUTOSCALING_POLICY",
+        ScalingPolicy(scale_up_cooldown=0, scale_down_cooldown=0, scale_down_delay=0),
+    )
+    pool, fleet_id = new_id("pool"), new_id("sfr")
+    client.post(
+        f"/pools/{pool}",
+        json={"fleet_id": fleet_id, "job_uuid": str(uuid.uuid4()), "target_capacity": 3},
+    )
+    client.post(f"/pools/{pool}/jobs", data="echo busy")
+    assert client.get(f"/pools/{pool}/next_job?instance_id=i-busy").status_code == 200
+
+    stubber.add_response(
+        "modify_spot_fleet_request",
+        {"Return": True},
+        {
+            "SpotFleetRequestId": fleet_id,
+            "TargetCapacity": 1,
+            "ExcessCapacityTerminationPolicy": "noTermination",
+        },
+    )
+    stubber.add_response(
+        "describe_spot_fleet_instances",
+        active_instances(["i-idle-2", "i-busy", "i-idle-1"]),
+        {"SpotFleetRequestId": fleet_id},
+    )
+    stubber.add_response("terminate_instances", {}, {"InstanceIds": ["i-idle-1", "i-idle-2"]})
+
+    pool_info = termination_controller.job_store.pool(pool)
+    assert termination_controller.autoscale_pool(pool_info) == 1
+    stubber.assert_no_pending_responses()
+    assert termination_controller.job_store.pool(pool)["target_capacity"] == 1
+
+def test_boot_traces(controller):
+    client, _ = controller
+    job_uuid = str(uuid.uuid4())
+    assert client.post(f"/boot_trace/{job_uuid}", data=" \n").status_code == 400
+    trace = "1.0\tbegin\tuser_data\n2.0\tend\tuser_data\n"
+    response = client.post(
+        f"/boot_trace/{job_uuid}", data=trace, query_string={"instance_type": "c5.large"}
+    )
+    assert response.status_code == 200
+
+    traces = {t["uuid"]: t for t in client.get("/boot_traces").json["traces"]}
+    assert traces[job_uuid]["trace"] == trace
+    assert traces[job_uuid]["instance_type"] == "c5.large"
@@ -0,0 +1,51 @@
+from termination_queue import TerminationQueue
+
+
+def cancel_all(fleet_ids: list) -> dict:
+    return {"SuccessfulFleetRequests": [{"SpotFleetRequestId": f} for f in fleet_ids]}
+
+
+def test_requests_for_a_fleet_are_deduplicated_and_batched():
+    calls, updates = [], []
+    queue = TerminationQueue(
+        lambda fleet_ids: calls.append(fleet_ids) or cancel_all(fleet_ids),
+        on_update=lambda fleet_id, status: updates.append((fleet_id, status)),
+    )
+    queue.submit("job-1", "sfr-1")
+    queue.submit("job-2", "sfr-1")
+    queue.submit("job-3", "sfr-2")
+
+    assert queue.process_once() == 2
+    assert calls == [["sfr-1", "sfr-2"]]
+    assert queue.job_status("job-2")["status"] == "terminated"
+    assert updates.count(("sfr-1", "pending")) == 1
+    assert ("sfr-1", "terminated") in updates
+
+
+def test_failed_cancellations_are_retried():
+    responses = [
+        {
+            "UnsuccessfulFleetRequests": [
+                {"SpotFleetRequestId": "sfr-1", "Error": {"Code": "unexpectedError"}}
+            ]
+        },
+        cancel_all(["sfr-1"]),
+    ]
+    queue = TerminationQueue(lambda fleet_ids: responses.pop(0), base_delay=0)
+    queue.submit("job-1", "sfr-1")
+
+    queue.process_once()
+    assert queue.status("sfr-1")["status"] == "pending"
+    queue.process_once()
+    assert queue.status("sfr-1")["status"] == "terminated"
+    assert queue.status("sfr-1")["attempts"] == 2
+
+
+def test_finished_fleets_are_forgotten_after_the_retention_period():
+    queue = TerminationQueue(cancel_all, retention=0)
+    for i in range(10):
+        queue.submit(f"job-{i}", f"sfr-{i}")
+    queue.process_once()
+
+    assert queue.size() == 0
+    assert queue.job_status("job-0") is None
@@ -0,0 +1,72 @@
+import base64
+import gzip
+import hashlib
+import os
+import subprocess
+
+import pytest
+
+from user_data_staging import DirectoryBlobStore, encode_user_data
+
+
+def large_user_data(tmp_path) -> str:
+    # Random hex compresses to about half its size, well over the limit
+    padding = os.urandom(40 * 1024).hex()
+    return f"#!/bin/bash\n: {padding}\necho staged > {tmp_path / 'ran'}\n"
+
+
+def test_small_user_data_is_gzipped_inline():
+    encoded = encode_user_data("#!/bin/bash\necho hi\n")
+    assert gzip.decompress(base64.b64decode(encoded)) == b"#!/bin/bash\necho hi\n"
+
+
+def test_over_limit_user_data_without_a_blob_store_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="over the"):
+        encode_user_data(large_user_data(tmp_path))
+
+
+def test_over_limit_user_data_is_staged_by_hash(tmp_path, caplog):
+    user_data = large_user_data(tmp_path)
+    store = DirectoryBlobStore(str(tmp_path / "blobs"))
+    bootstrap = base64.b64decode(encode_user_data(user_data, blob_store=store)).decode()
+
+    (key,) = os.listdir(store.root)
+    with open(os.path.join(store.root, key), "rb") as f:
+        blob = f.read()
+    sha256 = hashlib.sha256(blob).hexdigest()
+    assert key == f"{sha256}.gz"
+    assert gzip.decompress(blob).decode() == user_data
+    assert store.url(key) in bootstrap
+    assert f"{sha256}  " in bootstrap
+
+    # The bootstrap fetches the script, checks its hash and runs it
+    (tmp_path / "bootstrap.sh").write_text(bootstrap)
+    subprocess.run(["bash", str(tmp_path / "bootstrap.sh")], check=True, timeout=60)
+    assert (tmp_path / "ran").read_text() == "staged\n"
+
+    # The same script is not uploaded again
+    mtime = os.stat(os.path.join(store.root, key)).st_mtime_ns
+    with caplog.at_level("INFO"):
+        assert encode_user_data(user_data, blob_store=store) == base64.b64encode(
+            bootstrap.encode()
+        ).decode()
+    assert f"Reusing staged user data {key}" in caplog.text
+    assert os.listdir(store.root) == [key]
+    assert os.stat(os.path.join(store.root, key)).st_mtime_ns == mtime
+
+
+def test_tampered_blob_is_not_run(tmp_path):
+    store = DirectoryBlobStore(str(tmp_path / "blobs"))
+    bootstrap = base64.b64decode(
+        encode_user_data(large_user_data(tmp_path), blob_store=store)
+    ).decode()
+    (key,) = os.listdir(store.root)
+    with open(os.path.join(store.root, key), "wb") as f:
+        f.write(gzip.compress(b"#!/bin/bash\necho tampered\n"))
+
+    (tmp_path / "bootstrap.sh").write_text(bootstrap)
+    result = subprocess.run(
+        ["bash", str(tmp_path / "bootstrap.sh")], capture_output=True, timeout=60
+    )
+    assert result.returncode != 0
+    assert not (tmp_path / "ran").exists()
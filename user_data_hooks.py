@@ -0,0 +1,499 @@
+"""Bash snippets that preprocess_user_data injects into user data scripts.
+
+Every snippet only defines variables and functions prefixed with VIBEPILOT_/vibepilot_ so
+that it cannot clash with the user's script, and never fails the script when the
+controller or shared storage is unreachable."""
+import re
+import shlex
+
+# Reads the instance type and availability zone from the instance metadata service (IMDSv2).
+# VIBEPILOT_IMDS can point the hooks at a fake metadata server (see fake_instance_metadata.py).
+INSTANCE_METADATA_PROLOGUE = """\
+VIBEPILOT_IMDS=${VIBEPILOT_IMDS:-http://169.254.169.254}
+vibepilot_imds_token() {
+    curl -s -m 5 -X PUT "$VIBEPILOT_IMDS/latest/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 21600"
+}
+VIBEPILOT_IMDS_TOKEN=$(vibepilot_imds_token)
+vibepilot_metadata() {
+    curl -sf -m 5 -H "X-aws-ec2-metadata-token: $VIBEPILOT_IMDS_TOKEN" "$VIBEPILOT_IMDS/latest/meta-data/$1"
+}
+VIBEPILOT_INSTANCE_ID=$(vibepilot_metadata instance-id)
+VIBEPILOT_INSTANCE_TYPE=$(vibepilot_metadata instance-type)
+VIBEPILOT_AZ=$(vibepilot_metadata placement/availability-zone)"""
+
+# Reports a job phase to the controller
+REPORT_PHASE_FUNCTION = """\
+vibepilot_report_phase() {{
+    wget -q -O /dev/null -T 10 -t 3 "{controller}/job_event/{job_uuid}/$1?ts=$(date +%s.%N)&instance_type=$VIBEPILOT_INSTANCE_TYPE&availability_zone=$VIBEPILOT_AZ&instance_id=$VIBEPILOT_INSTANCE_ID" || true
+}}"""
+
+# Polls for a spot interruption notice in the background. On a notice it reports the
+# interruption, runs the checkpoint hook and signals the user script's process group,
+# which has about two minutes left. The token is renewed well before its 6 hour TTL.
+INTERRUPTION_WATCHER = """\
+vibepilot_interruption_watcher() {{
+    local action token_time=$SECONDS
+    while true; do
+        if (( SECONDS - token_time > 3600 )); then
+            VIBEPILOT_IMDS_TOKEN=$(vibepilot_imds_token)
+            token_time=$SECONDS
+        fi
+        action=$(vibepilot_metadata spot/instance-action)
+        if [ -n "$action" ]; then
+            echo "Spot interruption notice: $action"
+            export VIBEPILOT_INTERRUPTION_ACTION="$action"
+{on_interruption}
+            return
+        fi
+        sleep {poll_interval}
+    done
+}}
+vibepilot_interruption_watcher &
+VIBEPILOT_WATCHER_PID=$!"""
+REPORT_INTERRUPTION = "            vibepilot_report_phase interrupted"
+RUN_INTERRUPTION_HOOK = "            bash -c {hook} || true"
+# Only the user script's process group is signalled, so the watcher, hook subshells and
+# other background helpers (e.g. the checkpoint writer) are left alone
+USER_PGID_FILE = "VIBEPILOT_USER_PGID_FILE=$(mktemp)"
+SIGNAL_USER_SCRIPT = """\
+            VIBEPILOT_USER_PGID=$(cat "$VIBEPILOT_USER_PGID_FILE" 2> /dev/null)
+            [ -n "$VIBEPILOT_USER_PGID" ] && kill -s {signal} -- "-$VIBEPILOT_USER_PGID" 2> /dev/null"""
+# Runs the user script in a subshell in its own process group (set -m gives background
+# jobs one) and records the group for the watcher. The subshell handles the signal with a
+# no-op trap, so only the processes it starts react to it; handled signals are reset to
+# their defaults in the programs they run.
+PROCESS_GROUP_START = """\
+set -m
+(
+trap : {signal}"""
+PROCESS_GROUP_END = """\
+) &
+VIBEPILOT_USER_PID=$!
+set +m
+echo "$VIBEPILOT_USER_PID" > "$VIBEPILOT_USER_PGID_FILE"
+wait "$VIBEPILOT_USER_PID\""""
+STOP_INTERRUPTION_WATCHER = 'kill "$VIBEPILOT_WATCHER_PID" 2> /dev/null || true'
+
+# Claims a shard of an array job. The user script only runs if the instance got one, with
+# the shard index and count exported to it.
+CLAIM_SHARD = """\
+export VIBEPILOT_SHARD_COUNT={shard_count}
+export VIBEPILOT_SHARD_INDEX=$(wget -q -O - -T 10 -t 5 "{controller}/claim_shard/{job_uuid}?instance_id=$VIBEPILOT_INSTANCE_ID" || true)
+if [ -z "$VIBEPILOT_SHARD_INDEX" ]; then
+    echo "No shard of job {job_uuid} left to claim"
+fi"""
+FINISH_SHARD = """\
+if [ -n "$VIBEPILOT_SHARD_INDEX" ]; then
+    wget -q -O /dev/null -T 10 -t 5 "{controller}/finish_shard/{job_uuid}/$VIBEPILOT_SHARD_INDEX" || true
+fi"""
+
+# Runs jobs from a warm pool's queue one after another. An instance that stays idle for
+# the idle timeout asks the controller to leave the pool, which shrinks the fleet so the
+# instance is not replaced and terminates the instance. The rest of the script only runs
+# until the instance shuts down.
+POOL_WORKER = """\
+VIBEPILOT_IDLE_SINCE=$SECONDS
+while true; do
+    VIBEPILOT_JOB_UUID=$(wget -q -O - -T 10 -t 3 "{controller}/pools/{pool}/next_job?instance_id=$VIBEPILOT_INSTANCE_ID" || true)
+    if [ -n "$VIBEPILOT_JOB_UUID" ]; then
+        echo "Running pool job $VIBEPILOT_JOB_UUID"
+        VIBEPILOT_JOB_SCRIPT=$(mktemp)
+        if wget -q -O "$VIBEPILOT_JOB_SCRIPT" -T 30 -t 3 "{controller}/pool_jobs/$VIBEPILOT_JOB_UUID/script"; then
+            VIBEPILOT_JOB_UUID="$VIBEPILOT_JOB_UUID" bash "$VIBEPILOT_JOB_SCRIPT"
+            VIBEPILOT_EXIT_CODE=$?
+        else
+            VIBEPILOT_EXIT_CODE=255
+        fi
+        rm -f "$VIBEPILOT_JOB_SCRIPT"
+        wget -q -O /dev/null -T 10 -t 5 "{controller}/pool_jobs/$VIBEPILOT_JOB_UUID/finish?exit_code=$VIBEPILOT_EXIT_CODE" || true
+        VIBEPILOT_IDLE_SINCE=$SECONDS
+    elif {idle_expired}; then
+        if wget -q -O /dev/null -T 10 -t 3 "{controller}/pools/{pool}/leave?instance_id=$VIBEPILOT_INSTANCE_ID"; then
+            echo "Leaving pool {pool} after $((SECONDS - VIBEPILOT_IDLE_SINCE))s idle"
+            break
+        fi
+        VIBEPILOT_IDLE_SINCE=$SECONDS
+    else
+        sleep {poll_interval}
+    fi
+done"""
+
+BOOT_TRACE_FILE = "/var/log/vibepilot_boot_trace.tsv"
+
+# Appends "<epoch seconds>\t<kind>\t<label>" lines to the trace file. Commands are traced
+# with a DEBUG trap, which runs before every simple command; a command's duration is the
+# time until the next trace line. EPOCHREALTIME (bash 5) avoids forking date per command.
+TRACE_FUNCTIONS = f"""\
+VIBEPILOT_TRACE_FILE={BOOT_TRACE_FILE}
+: > "$VIBEPILOT_TRACE_FILE"
+vibepilot_trace() {{
+    local label="${{2//$'\\t'/ }}"
+    printf '%s\\t%s\\t%s\\n' "${{EPOCHREALTIME:-$(date +%s.%N)}}" "$1" "${{label//$'\\n'/ }}" >> "$VIBEPILOT_TRACE_FILE"
+}}
+vibepilot_stage() {{
+    vibepilot_trace stage "$*"
+}}"""
+# Traps are set at the top level: a DEBUG trap reset inside a function is not always seen
+# by the caller
+TRACE_START = """\
+vibepilot_trace begin user_data
+trap 'vibepilot_trace cmd "L$LINENO: ${BASH_COMMAND:0:200}"' DEBUG"""
+TRACE_STOP = """\
+trap - DEBUG
+vibepilot_trace end user_data"""
+
+# Sends the whole trace to the controller in one request
+PUSH_TRACE_TO_CONTROLLER = """\
+wget -q -O /dev/null -T 30 -t 3 --post-file="$VIBEPILOT_TRACE_FILE" "{controller}/boot_trace/{job_uuid}?instance_type=$VIBEPILOT_INSTANCE_TYPE&availability_zone=$VIBEPILOT_AZ" || true"""
+
+# Copies the trace to shared storage, e.g. EFS
+SAVE_TRACE_TO_DIR = """\
+mkdir -p {trace_dir} && cp "$VIBEPILOT_TRACE_FILE" {trace_dir}/{job_uuid}.tsv || true"""
+
+# Mounts an EFS file system, installing the mount helper if needed
+EFS_MOUNT = """\
+command -v mount.efs > /dev/null || yum install -y amazon-efs-utils
+mkdir -p {mount_point}
+mountpoint -q {mount_point} || mount -t efs {file_system_id} {mount_point}
+"""
+
+DATA_CACHE_CONFIG = """\
+export VIBEPILOT_DATA_CACHE={cache_dir}
+export VIBEPILOT_DATA_CACHE_PARALLELISM={parallelism}"""
+
+# Formats the instance-store NVMe drives, striped together if there are several, and mounts
+# them at $VIBEPILOT_DATA_CACHE. VIBEPILOT_NVME_DEVICES overrides the drives found; set it
+# empty to cache in a plain directory, e.g. to run the hooks locally. Without a drive the
+# cache still works, on the root volume.
+MOUNT_INSTANCE_STORE = """\
+vibepilot_mount_instance_store() {
+    local devices device link
+    if [ -n "${VIBEPILOT_NVME_DEVICES+set}" ]; then
+        devices=$VIBEPILOT_NVME_DEVICES
+    else
+        devices=$(for link in /dev/disk/by-id/nvme-Amazon_EC2_NVMe_Instance_Storage_*; do
+            [ -e "$link" ] && [[ "$link" != *-part* ]] && readlink -f "$link"
+        done | sort -u)
+    fi
+    mkdir -p "$VIBEPILOT_DATA_CACHE"
+    if [ -z "$devices" ] || mountpoint -q "$VIBEPILOT_DATA_CACHE"; then
+        return 0
+    fi
+    device=$devices
+    if [ "$(wc -w <<< "$devices")" -gt 1 ]; then
+        device=/dev/md/vibepilot_cache
+        mdadm --create "$device" --run --level=0 --raid-devices="$(wc -w <<< "$devices")" $devices || return 1
+    fi
+    mkfs.xfs -f -q "$device" && mount -o noatime "$device" "$VIBEPILOT_DATA_CACHE"
+}
+vibepilot_mount_instance_store || echo "Could not mount the instance store, caching on the root volume"
+mkdir -p "$VIBEPILOT_DATA_CACHE"/{objects,index,view,tmp}
+: > "$VIBEPILOT_DATA_CACHE/stats.tsv\""""
+
+# Read-through cache of files on shared storage. A file is copied in unless a copy of the
+# same path, size and mtime is already cached, so only EFS metadata is read on a hit.
+# Copies are stored once per SHA-256 of their content and hard-linked into the view at
+# $VIBEPILOT_DATA_CACHE/view<path>, which the user script must treat as read-only. Every
+# lookup appends "<hit|miss|error>\t<bytes>" to stats.tsv.
+DATA_CACHE_FUNCTIONS = """\
+vibepilot_now() {
+    echo "${EPOCHREALTIME:-$(date +%s.%N)}"
+}
+vibepilot_cache_file() {
+    local src=$1 meta key object tmp kind=hit view="$VIBEPILOT_DATA_CACHE/view$1"
+    if ! meta=$(stat -L -c '%s %Y' "$src"); then
+        printf 'error\\t0\\n' >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+        return 1
+    fi
+    key=$(printf '%s\\t%s' "$src" "$meta" | sha256sum | cut -d ' ' -f 1)
+    object=$(cat "$VIBEPILOT_DATA_CACHE/index/$key" 2> /dev/null)
+    if [ -z "$object" ] || [ ! -f "$VIBEPILOT_DATA_CACHE/objects/$object" ]; then
+        kind=miss
+        tmp=$(mktemp -p "$VIBEPILOT_DATA_CACHE/tmp")
+        if ! cp "$src" "$tmp"; then
+            rm -f "$tmp"
+            printf 'error\\t0\\n' >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+            return 1
+        fi
+        object=$(sha256sum "$tmp" | cut -d ' ' -f 1)
+        mv -f "$tmp" "$VIBEPILOT_DATA_CACHE/objects/$object"
+        echo "$object" > "$tmp.index" && mv -f "$tmp.index" "$VIBEPILOT_DATA_CACHE/index/$key"
+    fi
+    mkdir -p "$(dirname "$view")" && ln -f "$VIBEPILOT_DATA_CACHE/objects/$object" "$view"
+    printf '%s\\t%s\\n' "$kind" "${meta% *}" >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+}
+vibepilot_prefetch() {
+    local started path
+    started=$(vibepilot_now)
+    for path in "$@"; do
+        if [ -e "$path" ]; then
+            find -H "$path" -type f -print0
+        else
+            echo "Cannot prefetch $path, it does not exist" >&2
+            printf 'error\\t0\\n' >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+        fi
+    done | xargs -0 -r -n 1 -P "$VIBEPILOT_DATA_CACHE_PARALLELISM" bash -c 'vibepilot_cache_file "$1"' _
+    printf 'prefetch_s\\t%s\\n' "$(awk -v a="$started" -v b="$(vibepilot_now)" 'BEGIN { print b - a }')" >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+}
+vibepilot_cached() {
+    if [ -e "$VIBEPILOT_DATA_CACHE/view$1" ]; then
+        echo "$VIBEPILOT_DATA_CACHE/view$1"
+    else
+        echo "$1"
+    fi
+}
+export -f vibepilot_now vibepilot_cache_file vibepilot_prefetch vibepilot_cached"""
+
+PREFETCH_INPUTS = """\
+echo "Prefetching into $VIBEPILOT_DATA_CACHE:" {inputs}
+vibepilot_prefetch {inputs}"""
+
+# Checkpoints are saved to $VIBEPILOT_CHECKPOINT_DIR on the instance store, restored from
+# and written back to shared storage. A write-back copies the files changed since the
+# previous one, each to a temporary name that is then renamed, so the shared copy never
+# holds a partial checkpoint. Its marker, like the one set on restore, is backdated by
+# 50 ms because mtimes only advance every clock tick. flock serialises the periodic
+# writer, the final flush and hooks (e.g. --interruption-hook
+# vibepilot_write_back_checkpoints).
+CHECKPOINT_CONFIG = """\
+export VIBEPILOT_CHECKPOINT_DIR="$VIBEPILOT_DATA_CACHE/checkpoints"
+export VIBEPILOT_CHECKPOINT_TARGET={checkpoint_dir}"""
+CHECKPOINT_WRITE_BACK = """\
+mkdir -p "$VIBEPILOT_CHECKPOINT_DIR" "$VIBEPILOT_CHECKPOINT_TARGET"
+cp -a "$VIBEPILOT_CHECKPOINT_TARGET/." "$VIBEPILOT_CHECKPOINT_DIR/" || true
+find "$VIBEPILOT_CHECKPOINT_DIR" -name '*.vibepilot-partial' -delete
+printf 'restored\\t%s\\n' "$(du -sb "$VIBEPILOT_CHECKPOINT_DIR" | cut -f 1)" >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+touch -d "@$(awk -v now="$(vibepilot_now)" 'BEGIN { printf "%.3f", now - 0.05 }')" "$VIBEPILOT_DATA_CACHE/tmp/written_back"
+vibepilot_write_back_checkpoints() {
+    (
+        flock 9
+        local last="$VIBEPILOT_DATA_CACHE/tmp/written_back" next="$VIBEPILOT_DATA_CACHE/tmp/written_back.next"
+        local file dest failed=0
+        touch -d "@$(awk -v now="$(vibepilot_now)" 'BEGIN { printf "%.3f", now - 0.05 }')" "$next"
+        while IFS= read -r -d '' file; do
+            dest="$VIBEPILOT_CHECKPOINT_TARGET/${file#"$VIBEPILOT_CHECKPOINT_DIR"/}"
+            if mkdir -p "$(dirname "$dest")" && cp "$file" "$dest.vibepilot-partial" && mv -f "$dest.vibepilot-partial" "$dest"; then
+                printf 'written_back\\t%s\\n' "$(stat -c %s "$file")" >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+            else
+                rm -f "$dest.vibepilot-partial"
+                printf 'write_back_error\\t0\\n' >> "$VIBEPILOT_DATA_CACHE/stats.tsv"
+                failed=1
+            fi
+        done < <(find "$VIBEPILOT_CHECKPOINT_DIR" -type f -newer "$last" -print0)
+        # Failed files are retried by the next write-back
+        [ "$failed" = 0 ] && mv -f "$next" "$last"
+    ) 9> "$VIBEPILOT_DATA_CACHE/tmp/write_back.lock"
+}
+export -f vibepilot_write_back_checkpoints"""
+CHECKPOINT_WRITER = """\
+vibepilot_checkpoint_writer() {{
+    while sleep {interval}; do
+        vibepilot_write_back_checkpoints
+    done
+}}
+vibepilot_checkpoint_writer &
+VIBEPILOT_CHECKPOINT_WRITER_PID=$!"""
+FLUSH_CHECKPOINTS = """\
+kill "$VIBEPILOT_CHECKPOINT_WRITER_PID" 2> /dev/null || true
+echo "Writing checkpoints back to $VIBEPILOT_CHECKPOINT_TARGET"
+vibepilot_write_back_checkpoints"""
+
+# Sums stats.tsv into stats.json and prints it to the job's log
+DATA_CACHE_REPORT = """\
+awk -F '\\t' '{ n[$1]++; v[$1] += $2 } END {
+    printf "{\\"hits\\": %d, \\"hit_bytes\\": %d, \\"misses\\": %d, \\"fetched_bytes\\": %d, \\"fetch_errors\\": %d, ", n["hit"], v["hit"], n["miss"], v["miss"], n["error"]
+    printf "\\"prefetch_s\\": %.3f, \\"fetch_mb_per_s\\": %.1f, ", v["prefetch_s"], (v["prefetch_s"] > 0 ? v["miss"] / v["prefetch_s"] / 1e6 : 0)
+    printf "\\"restored_bytes\\": %d, \\"written_back_files\\": %d, \\"written_back_bytes\\": %d, \\"write_back_errors\\": %d}\\n", v["restored"], n["written_back"], v["written_back"], n["write_back_error"]
+}' "$VIBEPILOT_DATA_CACHE/stats.tsv" > "$VIBEPILOT_DATA_CACHE/stats.json"
+echo "Data cache stats: $(cat "$VIBEPILOT_DATA_CACHE/stats.json")\""""
+
+# "# vibepilot-stage: <name>" comments in the user script mark the start of a stage
+STAGE_MARKER = re.compile(r"^(\s*)#\s*vibepilot-stage:\s*(.+?)\s*$", re.MULTILINE)
+
+
+def split_shebang(user_data: str) -> tuple[str, str]:
+    """Split a script into its shebang line ("" if it has none) and its body."""
+    if user_data.startswith("#!"):
+        shebang, _, body = user_data.partition("\n")
+        return shebang, body
+    return "", user_data
+
+
+def mark_stages(body: str) -> str:
+    """Turn "# vibepilot-stage: <name>" comments into vibepilot_stage calls."""
+    return STAGE_MARKER.sub(
+        lambda m: f"{m.group(1)}vibepilot_stage {shlex.quote(m.group(2))}", body
+    )
+
+
+def trace_body(
+    body: str, job_uuid: str, controller: str = None, trace_dir: str = None
+) -> tuple[list[str], str, list[str]]:
+    """Wrap a script body in boot tracing.
+
+    Returns:
+        The prologue lines, the wrapped body and the epilogue lines that push the trace
+        to the controller and/or copy it to trace_dir."""
+    prologue = [TRACE_FUNCTIONS]
+    wrapped = "\n".join([TRACE_START, mark_stages(body), TRACE_STOP])
+    epilogue = []
+    if controller:
+        epilogue.append(PUSH_TRACE_TO_CONTROLLER.format(controller=controller, job_uuid=job_uuid))
+    if trace_dir:
+        epilogue.append(
+            SAVE_TRACE_TO_DIR.format(trace_dir=shlex.quote(trace_dir), job_uuid=job_uuid)
+        )
+    return prologue, wrapped, epilogue
+
+
+def shard_body(
+    body: str, job_uuid: str, controller: str, shard_count: int
+) -> tuple[list[str], str, list[str]]:
+    """Make a script body run as one shard of an array job.
+
+    Returns:
+        The prologue lines that claim a shard, the body, which only runs if a shard was
+        claimed, and the epilogue lines that report the shard done. The prologue needs
+        INSTANCE_METADATA_PROLOGUE before it."""
+    prologue = [
+        CLAIM_SHARD.format(controller=controller, job_uuid=job_uuid, shard_count=shard_count)
+    ]
+    wrapped = "\n".join(['if [ -n "$VIBEPILOT_SHARD_INDEX" ]; then', body, "fi"])
+    epilogue = [FINISH_SHARD.format(controller=controller, job_uuid=job_uuid)]
+    return prologue, wrapped, epilogue
+
+
+def pool_worker(
+    controller: str,
+    pool: str,
+    idle_timeout: float = None,
+    poll_interval: float = 5.0,
+) -> list[str]:
+    """Build the loop that runs a warm pool's jobs after the script's setup.
+
+    Args:
+        controller (str): URL of the controller holding the pool's queue.
+        pool (str): Name of the pool.
+        idle_timeout (float): Seconds without a job after which the instance leaves the
+            pool. If None, idle instances stay in the pool until it is cancelled.
+        poll_interval (float): Seconds between polls of an empty queue.
+
+    Returns:
+        The lines to run after the script's body. They need INSTANCE_METADATA_PROLOGUE."""
+    if idle_timeout is None:
+        idle_expired = "false"
+    else:
+        idle_expired = f"(( SECONDS - VIBEPILOT_IDLE_SINCE >= {int(idle_timeout)} ))"
+    return [
+        POOL_WORKER.format(
+            controller=controller,
+            pool=pool,
+            idle_expired=idle_expired,
+            poll_interval=poll_interval,
+        )
+    ]
+
+
+def process_group_body(body: str, signal: str) -> str:
+    """Run a script body in its own process group, which the interruption watcher signals.
+
+    The body runs in a subshell, so its variables and `exit` do not reach the lines after
+    it."""
+    return "\n".join(
+        [PROCESS_GROUP_START.format(signal=shlex.quote(signal)), body, PROCESS_GROUP_END]
+    )
+
+
+def interruption_watcher(
+    poll_interval: float = 5.0,
+    signal: str = None,
+    hook: str = None,
+    report: bool = False,
+) -> tuple[list[str], list[str]]:
+    """Build the spot interruption watcher.
+
+    Args:
+        poll_interval (float): Seconds between polls of the spot instance-action endpoint.
+        signal (str): Signal (e.g. USR1) to send to the user script's process group on an
+            interruption notice.
+        hook (str): Command to run on an interruption notice, e.g. a checkpoint script. The
+            notice is in its VIBEPILOT_INTERRUPTION_ACTION environment variable.
+        report (bool): Report the interruption to the controller. Requires the
+            vibepilot_report_phase function.
+
+    Returns:
+        The prologue lines that start the watcher and the epilogue lines that stop it.
+        The prologue needs INSTANCE_METADATA_PROLOGUE before it. With a signal, the
+        script's body must be wrapped with process_group_body."""
+    on_interruption = []
+    if report:
+        on_interruption.append(REPORT_INTERRUPTION)
+    if hook:
+        on_interruption.append(RUN_INTERRUPTION_HOOK.format(hook=shlex.quote(hook)))
+    prologue = []
+    if signal:
+        on_interruption.append(SIGNAL_USER_SCRIPT.format(signal=shlex.quote(signal)))
+        prologue.append(USER_PGID_FILE)
+    prologue += [
+        INTERRUPTION_WATCHER.format(
+            on_interruption="\n".join(on_interruption or ["            :"]),
+            poll_interval=poll_interval,
+        )
+    ]
+    return prologue, [STOP_INTERRUPTION_WATCHER]
+
+
+def data_cache(
+    cache_dir: str,
+    inputs: list[str] = (),
+    parallelism: int = 16,
+    checkpoint_dir: str = None,
+    checkpoint_interval: float = 60.0,
+    efs_file_system_id: str = None,
+    efs_mount_point: str = "/data",
+) -> tuple[list[str], list[str]]:
+    """Build the stage that caches job data from shared storage on the instance store.
+
+    Args:
+        cache_dir (str): Where to mount the instance-store NVMe drives and keep the cache.
+        inputs (list[str]): Absolute paths of files or directories on shared storage to
+            prefetch before the user script runs. The script finds them under
+            $VIBEPILOT_DATA_CACHE/view, or with `vibepilot_cached <path>`, and can prefetch
+            more with `vibepilot_prefetch <path>...`.
+        parallelism (int): Files copied at the same time.
+        checkpoint_dir (str): Directory on shared storage restored into
+            $VIBEPILOT_CHECKPOINT_DIR before the script runs, and that checkpoints the
+            script saves there are written back to in the background and when it finishes.
+        checkpoint_interval (float): Seconds between background write-backs.
+        efs_file_system_id (str): EFS file system to mount at efs_mount_point first.
+        efs_mount_point (str): Where to mount the EFS file system.
+
+    Returns:
+        The prologue lines that mount the cache, restore checkpoints and prefetch inputs,
+        and the epilogue lines that flush checkpoints and print the cache's hit, miss and
+        transfer stats."""
+    prologue = []
+    if efs_file_system_id:
+        prologue.append(
+            EFS_MOUNT.format(
+                file_system_id=shlex.quote(efs_file_system_id),
+                mount_point=shlex.quote(efs_mount_point),
+            ).rstrip("\n")
+        )
+    prologue += [
+        DATA_CACHE_CONFIG.format(cache_dir=shlex.quote(cache_dir), parallelism=parallelism),
+        MOUNT_INSTANCE_STORE,
+        DATA_CACHE_FUNCTIONS,
+    ]
+    epilogue = []
+    if checkpoint_dir:
+        prologue += [
+            CHECKPOINT_CONFIG.format(checkpoint_dir=shlex.quote(checkpoint_dir)),
+            CHECKPOINT_WRITE_BACK,
+            CHECKPOINT_WRITER.format(interval=checkpoint_interval),
+        ]
+        epilogue.append(FLUSH_CHECKPOINTS)
+    if inputs:
+        prologue.append(PREFETCH_INPUTS.format(inputs=" ".join(map(shlex.quote, inputs))))
+    epilogue.append(DATA_CACHE_REPORT)
+    return prologue, epilogue
@@ -0,0 +1,198 @@
+import base64
+import functools
+import gzip
+import hashlib
+import logging
+import os
+import shlex
+import sys
+import threading
+from typing import Optional
+
+import botocore.exceptions
+
+# For aws_clients, as in launch_aws_spot_fleet
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibepilot"))
+
+import aws_clients
+from user_data_hooks import EFS_MOUNT
+
+# EC2 rejects user data larger than this, before base64 encoding
+USER_DATA_LIMIT = 16 * 1024
+# Presigned S3 URLs have to outlive the time a fleet can take to be fulfilled
+PRESIGNED_URL_EXPIRY_SECONDS = 7 * 24 * 3600
+
+# Replaces a staged script: downloads it, checks its hash and runs it in place of itself
+FETCH_AND_VERIFY_BOOTSTRAP = """\
+#!/bin/bash
+set -euo pipefail
+{mount}VIBEPILOT_BLOB=$(mktemp)
+curl -fsS --retry 10 --retry-delay 3 -o "$VIBEPILOT_BLOB" {url}
+echo "{sha256}  $VIBEPILOT_BLOB" | sha256sum -c --quiet -
+gunzip -c "$VIBEPILOT_BLOB" > "$VIBEPILOT_BLOB.sh"
+chmod 700 "$VIBEPILOT_BLOB.sh"
+exec "$VIBEPILOT_BLOB.sh"
+"""
+
+
+def gzip_user_data(user_data: str) -> bytes:
+    """Gzip a script reproducibly, so the same script always has the same hash."""
+    return gzip.compress(user_data.encode("utf-8"), compresslevel=9, mtime=0)
+
+
+class DirectoryBlobStore:
+    """Content-addressed blobs in a directory, e.g. on EFS, fetched by instances from
+    `fetch_url` (a file:// URL of the directory as instances see it, or an HTTP server
+    in front of it).
+
+    If `efs_file_system_id` is given, the bootstrap mounts that file system at the
+    directory's mount point before fetching."""
+
+    def __init__(
+        self,
+        root: str,
+        fetch_url: Optional[str] = None,
+        efs_file_system_id: Optional[str] = None,
+        efs_mount_point: Optional[str] = None,
+    ):
+        self.root = root
+        self.fetch_url = (fetch_url or f"file://{os.path.abspath(root)}").rstrip("/")
+        self.efs_file_system_id = efs_file_system_id
+        self.efs_mount_point = efs_mount_point or os.path.dirname(os.path.abspath(root))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.root, key))
+
+    def put(self, key: str, data: bytes):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def url(self, key: str) -> str:
+        return f"{self.fetch_url}/{key}"
+
+    def mount_commands(self) -> str:
+        if not self.efs_file_system_id:
+            return ""
+        return EFS_MOUNT.format(
+            file_system_id=shlex.quote(self.efs_file_system_id),
+            mount_point=shlex.quote(self.efs_mount_point),
+        )
+
+
+class S3BlobStore:
+    """Content-addressed blobs in an S3 bucket, or any S3-compatible endpoint, fetched by
+    instances through presigned URLs so they need no credentials or AWS CLI."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        s3_client=None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.s3_client = s3_client or aws_clients.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, data: bytes):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def url(self, key: str) -> str:
+        return self.s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=PRESIGNED_URL_EXPIRY_SECONDS,
+        )
+
+    def mount_commands(self) -> str:
+        return ""
+
+
+@functools.lru_cache(maxsize=None)
+def blob_store_for(
+    stage: str,
+    fetch_url: Optional[str] = None,
+    efs_file_system_id: Optional[str] = None,
+    s3_endpoint_url: Optional[str] = None,
+):
+    """Return the blob store for a staging location: s3://bucket/prefix or a directory.
+
+    Stores are cached, so concurrent launches share clients."""
+    if stage.startswith("s3://"):
+        bucket, _, prefix = stage[len("s3://"):].partition("/")
+        return S3BlobStore(bucket, prefix, endpoint_url=s3_endpoint_url)
+    return DirectoryBlobStore(stage, fetch_url, efs_file_system_id)
+
+
+def stage_blob(blob_store, data: bytes) -> str:
+    """Store data under its SHA-256, unless it is already staged, and return the hash."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    key = f"{sha256}.gz"
+    if blob_store.exists(key):
+        logging.info(f"Reusing staged user data {key}")
+    else:
+        blob_store.put(key, data)
+        logging.info(f"Staged {len(data)} bytes of user data as {key}")
+    return sha256
+
+
+def encode_user_data(
+    user_data: str,
+    compress: bool = True,
+    blob_store=None,
+    limit: int = USER_DATA_LIMIT,
+) -> str:
+    """Base64-encode user data for a launch specification, shrinking it to fit EC2's limit.
+
+    Args:
+        user_data (str): The user data script.
+        compress (bool): Gzip the script (cloud-init decompresses it before running it).
+        blob_store: Where to stage scripts that are still over the limit, a
+            DirectoryBlobStore or S3BlobStore. The script is replaced by a small bootstrap
+            that fetches it, checks its SHA-256 and runs it.
+        limit (int): Maximum user data size in bytes.
+
+    Returns:
+        str: The base64-encoded user data.
+
+    Raises:
+        ValueError: If the user data is over the limit and there is no blob store."""
+    if compress:
+        data = gzip_user_data(user_data)
+        if len(data) <= limit:
+            return base64.b64encode(data).decode("utf-8")
+    else:
+        data = user_data.encode("utf-8")
+        if len(data) <= limit:
+            # Plain scripts have always been sent without base64 padding
+            return base64.b64encode(data).decode("utf-8").rstrip("=")
+        data = gzip_user_data(user_data)
+    if blob_store is None:
+        raise ValueError(
+            f"User data is {len(data)} bytes compressed, over the {limit} byte limit. "
+            "Pass a staging location to stage it on shared storage."
+        )
+
+    sha256 = stage_blob(blob_store, data)
+    bootstrap = FETCH_AND_VERIFY_BOOTSTRAP.format(
+        mount=blob_store.mount_commands(),
+        url=shlex.quote(blob_store.url(f"{sha256}.gz")),
+        sha256=sha256,
+    )
+    return base64.b64encode(bootstrap.encode("utf-8")).decode("utf-8")
@@ -0,0 +1,176 @@
+"""Shared AWS clients for the launcher, check_preemption, share_ips and the controller.
+
+Clients are created once per (service, region, endpoint) and shared by every thread, so
+requests reuse pooled connections and the client-side rate limiter of botocore's
+adaptive retry mode throttles all threads together. Every call's latency, errors,
+retries and throttles are counted per operation.
+"""
+import bisect
+import collections
+import os
+import threading
+import time
+from typing import Optional
+
+import boto3
+import botocore.config
+
+DEFAULT_REGION = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50"))
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "10"))
+THROTTLING_ERROR_CODES = {
+    "RequestLimitExceeded",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "SlowDown",
+}
+# Upper bounds in seconds of the call latency histogram of every operation
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_session = None
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class CallStats:
+    """Thread-safe per-operation counters of AWS calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = collections.defaultdict(
+            lambda: {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "throttles": 0,
+                "total_s": 0.0,
+                "max_s": 0.0,
+                # Calls per LATENCY_BUCKETS bucket, the last one unbounded
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        )
+
+    def record_call(
+        self, operation: str, latency: float, error_code: Optional[str], retries: int
+    ):
+        with self._lock:
+            stats = self._stats[operation]
+            stats["calls"] += 1
+            stats["retries"] += retries
+            stats["total_s"] += latency
+            stats["max_s"] = max(stats["max_s"], latency)
+            stats["buckets"][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            if error_code:
+                stats["errors"] += 1
+
+    def record_throttle(self, operation: str):
+        with self._lock:
+            self._stats[operation]["throttles"] += 1
+
+    def snapshot(self) -> dict:
+        """Return {"<service>.<Operation>": counters}, with the mean latency of each."""
+        with self._lock:
+            result = {
+                op: dict(stats, buckets=list(stats["buckets"]))
+                for op, stats in self._stats.items()
+            }
+        for stats in result.values():
+            stats["mean_s"] = stats["total_s"] / stats["calls"] if stats["calls"] else 0.0
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+call_stats = CallStats()
+
+
+def _operation(service: str, event_name: str) -> str:
+    # Event names look like "after-call.ec2.DescribeInstances"
+    return f"{service}.{event_name.rsplit('.', 1)[-1]}"
+
+
+def _instrument(client, service: str):
+    events = client.meta.events
+
+    # before-parameter-build is the first event of a call, even for stubbed clients
+    def before_parameter_build(context, **kwargs):
+        context["vibepilot_started_at"] = time.monotonic()
+
+    def after_call(parsed, context, event_name, **kwargs):
+        started_at = context.get("vibepilot_started_at")
+        if started_at is None:
+            return
+        metadata = parsed.get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+        call_stats.record_call(
+            _operation(service, event_name),
+            time.monotonic() - started_at,
+            parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None,
+            metadata.get("RetryAttempts", 0),
+        )
+
+    def after_call_error(context, event_name, **kwargs):
+        started_at = context.get("vibepilot_started_at")
+        if started_at is not None:
+            call_stats.record_call(
+                _operation(service, event_name), time.monotonic() - started_at, "Exception", 0
+            )
+
+    def needs_retry(response, event_name, **kwargs):
+        # Called after every attempt; response is (http_response, parsed) or None
+        if response is None:
+            return None
+        parsed = response[1] if len(response) > 1 else {}
+        if parsed.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+            call_stats.record_throttle(_operation(service, event_name))
+        return None
+
+    events.register(f"before-parameter-build.{service}", before_parameter_build)
+    events.register(f"after-call.{service}", after_call)
+    events.register(f"after-call-error.{service}", after_call_error)
+    events.register(f"needs-retry.{service}", needs_retry)
+
+
+def client(
+    service: str,
+    region_name: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+):
+    """Return the shared client of a service in a region.
+
+    Args:
+        service (str): AWS service name, e.g. "ec2".
+        region_name (str): Region of the client. Defaults to AWS_REGION or
+            AWS_DEFAULT_REGION, then to boto3's own configuration.
+        endpoint_url (str): Endpoint of an AWS-compatible service, e.g. an S3-compatible
+            store."""
+    region_name = region_name or DEFAULT_REGION
+    key = (service, region_name, endpoint_url)
+    cached = _clients.get(key)
+    if cached is not None:
+        return cached
+    global _session
+    # boto3 sessions are not thread-safe, so clients are created under the lock
+    with _clients_lock:
+        if key not in _clients:
+            if _session is None:
+                _session = boto3.session.Session()
+            new_client = _session.client(
+                service,
+                region_name=region_name,
+                endpoint_url=endpoint_url,
+                config=botocore.config.Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"mode": "adaptive", "total_max_attempts": MAX_ATTEMPTS},
+                ),
+            )
+            _instrument(new_client, service)
+            _clients[key] = new_client
+        return _clients[key]
+
+
+def ec2_client(region_name: Optional[str] = None):
+    """Return the shared EC2 client of a region."""
+    return client("ec2", region_name)
@@ -0,0 +1,189 @@
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Optional
+
+import aws_clients
+
+
+def _tag_string(tags: list) -> str:
+    return ",".join(f"{t['Key']}={t['Value']}" for t in tags)
+
+
+class Ec2Inventory:
+    """In-memory snapshot of running instances and active spot requests.
+
+    The shared EC2 client of each region is used by every refresh, and the regions are
+    listed concurrently, so a refresh takes as long as the slowest region. Listing is done
+    with paginators and with the state and tag filters applied by EC2, so only the rows we
+    show are transferred.
+    Snapshots are served from memory; a background thread refreshes them every
+    `refresh_interval` seconds, and a read falls back to a synchronous refresh only when
+    the snapshot is older than `ttl` (e.g. before the thread has been started).
+    Listeners added with add_listener see every new snapshot, however it was refreshed.
+    """
+
+    def __init__(
+        self,
+        region_name: str = "us-east-1",
+        ttl: float = 30.0,
+        refresh_interval: float = 10.0,
+        tag_filters: Optional[dict] = None,
+        ec2_client=None,
+        region_names: Optional[list] = None,
+    ):
+        self.region_name = region_name
+        self.region_names = list(region_names or [region_name])
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.tag_filters = tag_filters or {}
+        self._ec2 = ec2_client
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot = None
+        self._refreshed_at = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._listeners = []
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+    @property
+    def ec2(self):
+        return self.ec2_for(self.region_name)
+
+    def ec2_for(self, region_name: str):
+        if self._ec2 is not None:
+            return self._ec2
+        return aws_clients.ec2_client(region_name)
+
+    def _filters(self, state_filter: dict) -> list:
+        filters = [state_filter]
+        for key, value in self.tag_filters.items():
+            filters.append({"Name": f"tag:{key}", "Values": [value]})
+        return filters
+
+    def fetch_instances(self, region_name: Optional[str] = None) -> dict:
+        """List running instances of a region, keyed by instance ID."""
+        region_name = region_name or self.region_name
+        result = {}
+        paginator = self.ec2_for(region_name).get_paginator("describe_instances")
+        filters = self._filters({"Name": "instance-state-name", "Values": ["running"]})
+        for page in paginator.paginate(Filters=filters):
+            for reservation in page.get("Reservations", []):
+                for inst in reservation.get("Instances", []):
+                    result[inst["InstanceId"]] = {
+                        "Tags": _tag_string(inst.get("Tags", [])),
+                        "KeyName": inst.get("KeyName", ""),
+                        "PublicIpAddress": inst.get("PublicIpAddress", ""),
+                        "Region": region_name,
+                    }
+        return result
+
+    def fetch_spot_requests(self, region_name: Optional[str] = None) -> list:
+        """List active spot instance requests of a region as
+        [{request_id: tags, "KeyName": key, "Region": region}]."""
+        region_name = region_name or self.region_name
+        total_result = []
+        paginator = self.ec2_for(region_name).get_paginator("describe_spot_instance_requests")
+        filters = self._filters({"Name": "state", "Values": ["active"]})
+        for page in paginator.paginate(Filters=filters):
+            for req in page.get("SpotInstanceRequests", []):
+                total_result.append(
+                    {
+                        req["SpotInstanceRequestId"]: _tag_string(req.get("Tags", [])),
+                        "KeyName": req.get("LaunchSpecification", {}).get("KeyName", ""),
+                        "Region": region_name,
+                    }
+                )
+        return total_result
+
+    def refresh(self) -> dict:
+        """Fetch a new snapshot of every region from EC2 and make it the current one."""
+        snapshot = {"instances": {}, "spot_requests": []}
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=2 * len(self.region_names)
+        ) as executor:
+            instances = [
+                executor.submit(self.fetch_instances, r) for r in self.region_names
+            ]
+            spot_requests = [
+                executor.submit(self.fetch_spot_requests, r) for r in self.region_names
+            ]
+            for future in instances:
+                snapshot["instances"].update(future.result())
+            for future in spot_requests:
+                snapshot["spot_requests"] += future.result()
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = snapshot
+            self._refreshed_at = time.monotonic()
+            self._stats["refreshes"] += 1
+        for listener in list(self._listeners):
+            try:
+                listener(previous, snapshot)
+            except Exception as e:
+                logging.error(f"Error in EC2 inventory listener: {e}")
+        return snapshot
+
+    def add_listener(self, listener):
+        """Call listener(previous, snapshot) after every refresh; previous is None at first."""
+        self._listeners.append(listener)
+
+    def snapshot(self) -> dict:
+        """Return the current snapshot, refreshing it first only if it has expired."""
+        with self._lock:
+            snapshot = self._snapshot
+            age = time.monotonic() - self._refreshed_at
+            fresh = snapshot is not None and age <= self.ttl
+            self._stats["hits" if fresh else "misses"] += 1
+        if fresh:
+            return snapshot
+        # Only one caller refreshes; the others wait for it and reuse its snapshot
+        with self._refresh_lock:
+            with self._lock:
+                snapshot = self._snapshot
+                age = time.monotonic() - self._refreshed_at
+            if snapshot is None or age > self.ttl:
+                snapshot = self.refresh()
+        return snapshot
+
+    def stats(self) -> dict:
+        """Return the snapshot reads served from memory (hits) or after a synchronous
+        refresh (misses), the number of refreshes and the current snapshot's age."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["age_s"] = (
+                time.monotonic() - self._refreshed_at if self._snapshot is not None else 0.0
+            )
+        return stats
+
+    def instances(self) -> dict:
+        return self.snapshot()["instances"]
+
+    def spot_requests(self) -> list:
+        return self.snapshot()["spot_requests"]
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                with self._refresh_lock:
+                    self.refresh()
+            except Exception as e:
+                logging.error(f"Error refreshing EC2 inventory: {e}")
+            self._stop.wait(self.refresh_interval)
+
+    def start(self):
+        """Start the background refresh thread, if it is not running yet."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._refresh_loop, name="ec2-inventory-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
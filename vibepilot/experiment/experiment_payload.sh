@@ -1,10 +1,16 @@
 #!/bin/bash
-sudo yum install amazon-efs-utils -y
+# With the data cache stage (see launch_experiment.sh), EFS is mounted and
+# /data/vibepilot/test_experiment is restored onto the instance store for us
+if [ -n "${VIBEPILOT_CHECKPOINT_DIR:-}" ]; then
+    export DIR=$VIBEPILOT_CHECKPOINT_DIR
+else
+    sudo yum install amazon-efs-utils -y
 
-mkdir -p /data
-mount -t efs fs-0a339851322a7e6db /data
+    mkdir -p /data
+    mount -t efs fs-0a339851322a7e6db /data
 
-export DIR=/data/vibepilot/test_experiment
+    export DIR=/data/vibepilot/test_experiment
+fi
 
 mkdir -p $DIR
 
@@ -21,6 +27,10 @@ cat "$FILE"
 
 if [ "$n" -lt 3 ]; then
     echo "Less than 3 lines in the file, shutting down..."
+    if [ -n "${VIBEPILOT_CHECKPOINT_DIR:-}" ]; then
+        # The stage only writes checkpoints back after the script, which shutdown cuts short
+        vibepilot_write_back_checkpoints
+    fi
     shutdown now
 fi
 
@@ -0,0 +1,98 @@
+import dataclasses
+import math
+import threading
+import time
+from typing import Callable, Optional
+
+
+@dataclasses.dataclass
+class ScalingPolicy:
+    """Bounds and damping of a fleet's autoscaling."""
+
+    min_capacity: int = 0
+    max_capacity: int = 10
+    jobs_per_instance: int = 1
+    """Jobs one instance works through at a time."""
+    scale_up_cooldown: float = 60.0
+    """Seconds after any capacity change before scaling up again."""
+    scale_down_cooldown: float = 300.0
+    """Seconds after any capacity change before scaling down again."""
+    scale_down_margin: int = 1
+    """Scale down only when the fleet is this many instances larger than needed."""
+    scale_down_delay: float = 300.0
+    """Seconds the fleet must stay too large before scaling down."""
+
+
+def desired_capacity(demand: int, policy: ScalingPolicy) -> int:
+    """Instances needed for `demand` queued and running jobs, within the policy bounds."""
+    needed = math.ceil(demand / max(1, policy.jobs_per_instance))
+    return max(policy.min_capacity, min(policy.max_capacity, needed))
+
+
+class FleetAutoscaler:
+    """Decide target capacities of fleets from their pending work.
+
+    Scaling up is immediate, but for the cooldown after the last change. Scaling down
+    waits until the fleet has been at least `scale_down_margin` instances too large for
+    `scale_down_delay` seconds, and never goes below the instances busy with jobs. The
+    clock is injectable, so decisions can be replayed against a recorded workload.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._fleets = {}
+
+    def decide(
+        self,
+        fleet: str,
+        target_capacity: int,
+        demand: int,
+        busy: int,
+        policy: ScalingPolicy,
+    ) -> Optional[int]:
+        """Return the new target capacity of a fleet, or None to leave it as it is.
+
+        Args:
+            fleet (str): Key of the fleet, e.g. its pool name.
+            target_capacity (int): Its current target capacity.
+            demand (int): Number of queued and running jobs.
+            busy (int): Number of instances running a job.
+            policy (ScalingPolicy): The fleet's scaling policy.
+
+        A returned capacity is assumed to be applied."""
+        now = self.clock()
+        desired = desired_capacity(demand, policy)
+        with self._lock:
+            state = self._fleets.setdefault(
+                fleet, {"last_change": float("-inf"), "too_large_since": None}
+            )
+            since_change = now - state["last_change"]
+            if desired > target_capacity:
+                state["too_large_since"] = None
+                if since_change < policy.scale_up_cooldown:
+                    return None
+                new_capacity = desired
+            elif desired <= target_capacity - policy.scale_down_margin:
+                if state["too_large_since"] is None:
+                    state["too_large_since"] = now
+                if (
+                    now - state["too_large_since"] < policy.scale_down_delay
+                    or since_change < policy.scale_down_cooldown
+                ):
+                    return None
+                new_capacity = min(
+                    target_capacity, max(desired, busy, policy.min_capacity)
+                )
+                if new_capacity == target_capacity:
+                    return None
+            else:
+                state["too_large_since"] = None
+                return None
+            state["last_change"] = now
+            state["too_large_since"] = None
+        return new_capacity
+
+    def forget(self, fleet: str):
+        with self._lock:
+            self._fleets.pop(fleet, None)
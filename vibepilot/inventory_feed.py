@@ -0,0 +1,121 @@
+import json
+import logging
+import queue
+import threading
+from typing import Iterator, Optional
+
+
+def inventory_rows(snapshot: Optional[dict]) -> dict:
+    """Flatten an Ec2Inventory snapshot into {(kind, id): row}.
+
+    Kinds are "instance" and "spot_request"; rows are the instance details, or a spot
+    request's Tags, KeyName and Region."""
+    rows = {}
+    if snapshot is None:
+        return rows
+    for instance_id, details in snapshot["instances"].items():
+        rows[("instance", instance_id)] = dict(details)
+    for item in snapshot["spot_requests"]:
+        request_id = next((k for k in item if k not in ("KeyName", "Region")), "")
+        rows[("spot_request", request_id)] = {
+            "Tags": item.get(request_id, ""),
+            "KeyName": item.get("KeyName", ""),
+            "Region": item.get("Region", ""),
+        }
+    return rows
+
+
+def diff_rows(previous: dict, current: dict) -> list:
+    """Return the changes between two inventory_rows, as
+    [{"op": "added" | "removed" | "changed", "kind": ..., "id": ..., "row": ...}]."""
+    changes = []
+    for key, row in current.items():
+        old = previous.get(key)
+        if old is None:
+            changes.append({"op": "added", "kind": key[0], "id": key[1], "row": row})
+        elif old != row:
+            changes.append({"op": "changed", "kind": key[0], "id": key[1], "row": row})
+    for key in previous.keys() - current.keys():
+        changes.append({"op": "removed", "kind": key[0], "id": key[1], "row": None})
+    return changes
+
+
+def _event(name: str, version: int, data) -> str:
+    return f"id: {version}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+class InventoryFeed:
+    """Push EC2 inventory changes to any number of server-sent event streams.
+
+    The feed listens to an Ec2Inventory, so EC2 is polled by the inventory's single refresh
+    thread however many viewers are connected. Every refresh is diffed against the last one
+    and only the changed rows are queued to the subscribers, each of which first receives a
+    full snapshot. A subscriber that falls `max_queued` diffs behind is dropped; its browser
+    reconnects and starts again from a new snapshot.
+    """
+
+    def __init__(self, inventory, max_queued: int = 256, keepalive: float = 15.0):
+        self.inventory = inventory
+        self.max_queued = max_queued
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._version = 0
+        self._subscribers = set()
+        inventory.add_listener(self.publish)
+
+    def publish(self, previous: Optional[dict], snapshot: dict):
+        """Diff a new inventory snapshot against the current rows and queue the changes."""
+        rows = inventory_rows(snapshot)
+        with self._lock:
+            changes = diff_rows(self._rows, rows)
+            self._rows = rows
+            if not changes:
+                return
+            self._version += 1
+            message = _event("diff", self._version, changes)
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    logging.warning("Dropping a live dashboard subscriber that fell behind")
+                    self._subscribers.discard(subscriber)
+
+    def subscribe(self) -> tuple:
+        """Return (snapshot event, queue of the diff events that follow it)."""
+        subscriber = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            rows = [
+                {"kind": kind, "id": row_id, "row": row}
+                for (kind, row_id), row in self._rows.items()
+            ]
+            message = _event("snapshot", self._version, rows)
+            self._subscribers.add(subscriber)
+        return message, subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self) -> Iterator[str]:
+        """Yield a text/event-stream: a snapshot, then diffs and keepalive comments."""
+        # Serves the first viewer before the refresh thread has produced a snapshot; a
+        # snapshot the feed has already seen diffs to nothing
+        self.publish(None, self.inventory.snapshot())
+        message, subscriber = self.subscribe()
+        try:
+            yield message
+            while True:
+                try:
+                    yield subscriber.get(timeout=self.keepalive)
+                except queue.Empty:
+                    with self._lock:
+                        if subscriber not in self._subscribers:
+                            return
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
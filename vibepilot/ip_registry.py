@@ -0,0 +1,120 @@
+import collections
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterator, Optional
+from zoneinfo import ZoneInfo
+
+import metrics
+
+LONDON = ZoneInfo("Europe/London")
+
+
+class IpRegistry:
+    """Durable store of registered (ip, timestamp) entries.
+
+    Every entry is written with its London calendar day and its formatted London time, so
+    reads never convert time zones. Entries are indexed by (day, id), and a per-day count
+    table is kept up to date on every write, so a date range or a page of entries can be
+    read without scanning the rest of the registry. Each thread gets its own connection
+    and the database runs in WAL mode, so reads do not block registrations.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(
+                """
+CREATE TABLE IF NOT EXISTS registrations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    local_time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registrations_day_id ON registrations (day, id);
+CREATE TABLE IF NOT EXISTS days (
+    day TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = metrics.connect(self.path, "ip_registry")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, ip: str, timestamp: int) -> int:
+        """Store an entry and return its ID."""
+        dt = datetime.fromtimestamp(timestamp, LONDON)
+        day = dt.date().isoformat()
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO registrations (ip, timestamp, day, local_time) VALUES (?, ?, ?, ?)",
+                (ip, timestamp, day, dt.strftime("%d/%m/%Y - %H:%M:%S")),
+            )
+            conn.execute(
+                "INSERT INTO days (day, count) VALUES (?, 1) "
+                "ON CONFLICT(day) DO UPDATE SET count = count + 1",
+                (day,),
+            )
+        return cur.lastrowid
+
+    def register_many(self, entries: list) -> int:
+        """Store [(ip, timestamp)] entries in one transaction and return how many."""
+        rows, day_counts = [], collections.Counter()
+        for ip, timestamp in entries:
+            dt = datetime.fromtimestamp(timestamp, LONDON)
+            day = dt.date().isoformat()
+            rows.append((ip, timestamp, day, dt.strftime("%d/%m/%Y - %H:%M:%S")))
+            day_counts[day] += 1
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO registrations (ip, timestamp, day, local_time) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany(
+                "INSERT INTO days (day, count) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count",
+                list(day_counts.items()),
+            )
+        return len(rows)
+
+    def days(self, start: Optional[str] = None, end: Optional[str] = None) -> list:
+        """Return [(day, count)] for the days in [start, end] (ISO dates, inclusive)."""
+        return self._conn().execute(
+            "SELECT day, count FROM days WHERE day >= ? AND day <= ? ORDER BY day",
+            (start or "", end or "9999-99-99"),
+        ).fetchall()
+
+    def entries(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        after_id: int = 0,
+        limit: int = 1000,
+    ) -> Iterator[tuple]:
+        """Yield up to `limit` entries as (id, day, ip, timestamp, local_time).
+
+        Entries are ordered by day, then registration order. Pass the (day, id) of the
+        last entry of a page as `start` and `after_id` to get the next page.
+        """
+        start = start or ""
+        cur = self._conn().execute(
+            """
+SELECT id, day, ip, timestamp, local_time FROM registrations
+WHERE ((day = ? AND id > ?) OR day > ?) AND day <= ?
+ORDER BY day, id
+LIMIT ?
+""",
+            (start, after_id, start, end or "9999-99-99", limit),
+        )
+        yield from cur
@@ -0,0 +1,626 @@
+import collections
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    uuid TEXT PRIMARY KEY,
+    fleet_id TEXT NOT NULL
+);
+"""
+# Columns added after the original (uuid, fleet_id) schema, with their definitions
+EXTRA_COLUMNS = {
+    "status": "TEXT NOT NULL DEFAULT 'registered'",
+    "created_at": "REAL",
+    "updated_at": "REAL",
+    "region": "TEXT",
+}
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_events (
+    uuid TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    instance_type TEXT,
+    availability_zone TEXT,
+    PRIMARY KEY (uuid, phase)
+);
+"""
+# Shards of array jobs, claimed by the fleet's instances
+SHARDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    uuid TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    instance_id TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (uuid, shard)
+);
+"""
+# Warm pools: maintain fleets whose instances run queued jobs one after another
+POOLS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    name TEXT PRIMARY KEY,
+    fleet_id TEXT NOT NULL,
+    job_uuid TEXT NOT NULL,
+    target_capacity INTEGER NOT NULL,
+    idle_timeout REAL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pool_jobs (
+    uuid TEXT PRIMARY KEY,
+    pool TEXT NOT NULL,
+    script TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    instance_id TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    exit_code INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pool_jobs_pool_status ON pool_jobs (pool, status, submitted_at);
+"""
+# Autoscaling bounds of pools, added after the pools schema
+POOL_EXTRA_COLUMNS = {
+    "min_capacity": "INTEGER NOT NULL DEFAULT 0",
+    "max_capacity": "INTEGER",
+}
+# Boot traces sent by instances, as the raw "<timestamp>\t<kind>\t<label>" lines
+BOOT_TRACES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS boot_traces (
+    uuid TEXT PRIMARY KEY,
+    instance_type TEXT,
+    availability_zone TEXT,
+    received_at REAL NOT NULL,
+    trace TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boot_traces_received_at ON boot_traces (received_at);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_fleet_id ON jobs (fleet_id);
+CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at);
+"""
+# Phases of a job's life, in order, that can be recorded as job events. A spot interruption
+# notice can arrive at any point after the instance is running.
+JOB_PHASES = [
+    "submitted",
+    "fulfilled",
+    "running",
+    "user_data_started",
+    "job_finished",
+    "interrupted",
+]
+# Job statuses after which a job can be removed by compaction
+FINISHED_STATUSES = ["terminated", "termination_failed"]
+
+
+class JobStore:
+    """SQLite store of the controller's jobs.
+
+    Every thread gets its own connection and the database runs in WAL mode, so readers
+    never wait for writers. Registrations are group-committed: callers hand their rows to
+    a writer thread, which commits everything that arrived in the meantime in one
+    transaction, and return once their rows are durable.
+    """
+
+    def __init__(self, path: str, max_batch_size: int = 1000):
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._writer = None
+        self._stop = False
+        self._claim_lock = threading.Lock()
+        self._migrate()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = metrics.connect(self.path, "jobs", timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self):
+        conn = self._conn()
+        with conn:
+            conn.executescript(SCHEMA)
+            conn.executescript(EVENTS_SCHEMA)
+            conn.executescript(BOOT_TRACES_SCHEMA)
+            conn.executescript(SHARDS_SCHEMA)
+            conn.executescript(POOLS_SCHEMA)
+            for table, extra_columns in [("jobs", EXTRA_COLUMNS), ("pools", POOL_EXTRA_COLUMNS)]:
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for name, definition in extra_columns.items():
+                    if name not in columns:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            conn.executescript(INDEXES)
+
+    def register_many(self, jobs: list):
+        """Durably register [(uuid, fleet_id)] or [(uuid, fleet_id, region)] tuples,
+        group-committed with other callers."""
+        if not jobs:
+            return
+        done = threading.Event()
+        entry = {"jobs": jobs, "done": done, "error": None}
+        with self._cond:
+            self._pending.append(entry)
+            self._cond.notify()
+        self._start_writer()
+        done.wait()
+        if entry["error"] is not None:
+            raise entry["error"]
+
+    def pending_registrations(self) -> int:
+        """Number of registration batches waiting for the writer thread."""
+        with self._cond:
+            return len(self._pending)
+
+    def register(self, job_uuid: str, fleet_id: str, region: Optional[str] = None):
+        self.register_many([(job_uuid, fleet_id, region)])
+
+    def _write(self, entries: list):
+        now = time.time()
+        rows = [
+            (job[0], job[1], job[2] if len(job) > 2 else None, now, now)
+            for entry in entries
+            for job in entry["jobs"]
+        ]
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                """
+INSERT INTO jobs (uuid, fleet_id, region, status, created_at, updated_at)
+VALUES (?, ?, ?, 'registered', ?, ?)
+ON CONFLICT(uuid) DO UPDATE SET
+    fleet_id = excluded.fleet_id,
+    region = excluded.region,
+    status = 'registered',
+    updated_at = excluded.updated_at
+""",
+                rows,
+            )
+
+    def _run_writer(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if not self._pending and self._stop:
+                    return
+                entries, size = [], 0
+                while self._pending and size < self.max_batch_size:
+                    entry = self._pending.popleft()
+                    entries.append(entry)
+                    size += len(entry["jobs"])
+            try:
+                self._write(entries)
+            except Exception as e:
+                logging.error(f"Error committing {size} job registrations: {e}")
+                for entry in entries:
+                    entry["error"] = e
+            for entry in entries:
+                entry["done"].set()
+
+    def _start_writer(self):
+        with self._cond:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._stop = False
+            self._writer = threading.Thread(
+                target=self._run_writer, name="job-store-writer", daemon=True
+            )
+            self._writer.start()
+
+    def close(self):
+        """Flush pending registrations and stop the writer thread."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._writer is not None:
+            self._writer.join()
+
+    def fleet_id(self, job_uuid: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT fleet_id FROM jobs WHERE uuid = ?", (job_uuid,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def job(self, job_uuid: str) -> Optional[dict]:
+        cur = self._conn().execute(
+            "SELECT uuid, fleet_id, region, status, created_at, updated_at FROM jobs WHERE uuid = ?",
+            (job_uuid,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cur.description], row))
+
+    def fleet_regions(self, fleet_ids: list) -> dict:
+        """Return {fleet_id: region} for the given fleets; None if no region is known."""
+        regions = {fleet_id: None for fleet_id in fleet_ids}
+        if not fleet_ids:
+            return regions
+        placeholders = ",".join("?" for _ in fleet_ids)
+        rows = self._conn().execute(
+            f"SELECT fleet_id, MAX(region) FROM jobs WHERE fleet_id IN ({placeholders}) GROUP BY fleet_id",
+            list(fleet_ids),
+        )
+        regions.update(rows.fetchall())
+        return regions
+
+    def set_fleet_status(self, fleet_id: str, status: str):
+        """Set the status of every job running on a fleet."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE fleet_id = ?",
+                (status, time.time(), fleet_id),
+            )
+
+    def record_events(self, events: list):
+        """Record [(uuid, phase, timestamp, instance_type, availability_zone)] job events.
+
+        The first report of a phase wins, so retried callbacks do not move timestamps."""
+        if not events:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                """
+INSERT INTO job_events (uuid, phase, timestamp, instance_type, availability_zone)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(uuid, phase) DO NOTHING
+""",
+                events,
+            )
+
+    def job_phases(self, job_uuid: str) -> dict:
+        """Return {phase: timestamp} for one job."""
+        rows = self._conn().execute(
+            "SELECT phase, timestamp FROM job_events WHERE uuid = ?", (job_uuid,)
+        )
+        return dict(rows.fetchall())
+
+    def phase_table(self, since: float = 0.0) -> list:
+        """Return one dict per job with the timestamp of every phase, and the instance type
+        and availability zone reported for it, for jobs submitted after `since`."""
+        columns = ",\n".join(
+            f"MAX(CASE WHEN phase = '{phase}' THEN timestamp END) AS {phase}"
+            for phase in JOB_PHASES
+        )
+        cur = self._conn().execute(
+            f"""
+SELECT uuid, MAX(instance_type) AS instance_type, MAX(availability_zone) AS availability_zone,
+{columns}
+FROM job_events
+GROUP BY uuid
+HAVING COALESCE(submitted, 0) >= ?
+""",
+            (since,),
+        )
+        names = [c[0] for c in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def create_shards(self, job_uuid: str, count: int):
+        """Make shards 0..count-1 of an array job claimable. Existing shards are kept."""
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO shards (uuid, shard) VALUES (?, ?) ON CONFLICT(uuid, shard) DO NOTHING",
+                [(job_uuid, shard) for shard in range(count)],
+            )
+
+    def claim_shard(self, job_uuid: str, instance_id: str) -> Optional[int]:
+        """Atomically give the lowest pending shard of a job to an instance.
+
+        An instance that already holds a claimed shard gets the same shard back, so claims
+        can be retried.
+
+        Returns:
+            Optional[int]: The shard index, or None if no shard is pending."""
+        conn = self._conn()
+        # One claimer at a time, so two instances never read the same pending shard
+        with self._claim_lock, conn:
+            row = conn.execute(
+                """
+SELECT shard FROM shards
+WHERE uuid = ? AND ((status = 'claimed' AND instance_id = ?) OR status = 'pending')
+ORDER BY status = 'pending', shard
+LIMIT 1
+""",
+                (job_uuid, instance_id),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """
+UPDATE shards SET status = 'claimed', instance_id = ?, claimed_at = ?, attempts = attempts + 1
+WHERE uuid = ? AND shard = ? AND status = 'pending'
+""",
+                (instance_id, time.time(), job_uuid, row[0]),
+            )
+        return row[0]
+
+    def release_shards(self, job_uuid: str, instance_ids: list) -> int:
+        """Make the unfinished shards claimed by the given instances pending again.
+
+        Returns:
+            int: The number of shards released."""
+        if not instance_ids:
+            return 0
+        placeholders = ",".join("?" for _ in instance_ids)
+        conn = self._conn()
+        with self._claim_lock, conn:
+            cur = conn.execute(
+                f"""
+UPDATE shards SET status = 'pending', instance_id = NULL, claimed_at = NULL
+WHERE uuid = ? AND status = 'claimed' AND instance_id IN ({placeholders})
+""",
+                (job_uuid, *instance_ids),
+            )
+        return cur.rowcount
+
+    def finish_shard(self, job_uuid: str, shard: int) -> bool:
+        """Mark a shard done. Returns False if the job has no such shard."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE shards SET status = 'done', finished_at = ? WHERE uuid = ? AND shard = ?",
+                (time.time(), job_uuid, shard),
+            )
+        return cur.rowcount > 0
+
+    def shard_counts(self, job_uuid: str) -> dict:
+        """Return {status: number of shards} for a job; empty if it is not an array job."""
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) FROM shards WHERE uuid = ? GROUP BY status", (job_uuid,)
+        )
+        return dict(rows.fetchall())
+
+    def claimed_shards(self, job_uuid: str) -> dict:
+        """Return {instance_id: shard} for the shards of a job currently claimed."""
+        rows = self._conn().execute(
+            "SELECT instance_id, shard FROM shards WHERE uuid = ? AND status = 'claimed'",
+            (job_uuid,),
+        )
+        return dict(rows.fetchall())
+
+    def create_pool(
+        self,
+        name: str,
+        fleet_id: str,
+        job_uuid: str,
+        target_capacity: int,
+        idle_timeout: Optional[float] = None,
+        min_capacity: int = 0,
+        max_capacity: Optional[int] = None,
+    ) -> bool:
+        """Register a warm pool. Returns False if a pool with that name already exists.
+
+        The pool is autoscaled between min_capacity and max_capacity instances, which
+        defaults to its initial target capacity."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                """
+INSERT INTO pools (
+    name, fleet_id, job_uuid, target_capacity, idle_timeout, created_at,
+    min_capacity, max_capacity
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(name) DO NOTHING
+""",
+                (
+                    name,
+                    fleet_id,
+                    job_uuid,
+                    target_capacity,
+                    idle_timeout,
+                    time.time(),
+                    min_capacity,
+                    target_capacity if max_capacity is None else max_capacity,
+                ),
+            )
+        return cur.rowcount > 0
+
+    def pool(self, name: str) -> Optional[dict]:
+        cur = self._conn().execute("SELECT * FROM pools WHERE name = ?", (name,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cur.description], row))
+
+    def pools(self) -> list:
+        cur = self._conn().execute("SELECT * FROM pools ORDER BY name")
+        names = [c[0] for c in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def set_pool_capacity(self, name: str, target_capacity: int):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE pools SET target_capacity = ? WHERE name = ?", (target_capacity, name)
+            )
+
+    def delete_pool(self, name: str):
+        """Forget a pool. Its finished jobs are kept until compaction."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM pools WHERE name = ?", (name,))
+
+    def submit_pool_job(self, job_uuid: str, pool: str, script: str):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO pool_jobs (uuid, pool, script, submitted_at) VALUES (?, ?, ?, ?)",
+                (job_uuid, pool, script, time.time()),
+            )
+
+    def next_pool_job(self, pool: str, instance_id: str) -> Optional[str]:
+        """Atomically hand the oldest queued job of a pool to an instance.
+
+        Returns:
+            Optional[str]: The job UUID, or None if the queue is empty."""
+        conn = self._conn()
+        with self._claim_lock, conn:
+            row = conn.execute(
+                """
+SELECT uuid FROM pool_jobs WHERE pool = ? AND status = 'queued'
+ORDER BY submitted_at LIMIT 1
+""",
+                (pool,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """
+UPDATE pool_jobs SET status = 'running', instance_id = ?, started_at = ?, attempts = attempts + 1
+WHERE uuid = ?
+""",
+                (instance_id, time.time(), row[0]),
+            )
+        return row[0]
+
+    def pool_job(self, job_uuid: str, with_script: bool = False) -> Optional[dict]:
+        columns = "*" if with_script else (
+            "uuid, pool, status, instance_id, submitted_at, started_at, finished_at, "
+            "exit_code, attempts"
+        )
+        cur = self._conn().execute(
+            f"SELECT {columns} FROM pool_jobs WHERE uuid = ?", (job_uuid,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cur.description], row))
+
+    def finish_pool_job(self, job_uuid: str, exit_code: Optional[int]) -> bool:
+        """Mark a running pool job done (exit code 0) or failed. Returns False if the job
+        is not running, e.g. because it was requeued after its instance was lost."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                """
+UPDATE pool_jobs SET status = ?, finished_at = ?, exit_code = ?
+WHERE uuid = ? AND status = 'running'
+""",
+                ("done" if exit_code == 0 else "failed", time.time(), exit_code, job_uuid),
+            )
+        return cur.rowcount > 0
+
+    def running_pool_jobs(self, pool: str) -> dict:
+        """Return {job UUID: instance ID} for the running jobs of a pool."""
+        rows = self._conn().execute(
+            "SELECT uuid, instance_id FROM pool_jobs WHERE pool = ? AND status = 'running'",
+            (pool,),
+        )
+        return dict(rows.fetchall())
+
+    def requeue_pool_jobs(self, instance_ids: list) -> int:
+        """Put the running jobs of the given instances back at the front of their queue.
+
+        Returns:
+            int: The number of jobs requeued."""
+        if not instance_ids:
+            return 0
+        placeholders = ",".join("?" for _ in instance_ids)
+        conn = self._conn()
+        with self._claim_lock, conn:
+            cur = conn.execute(
+                f"""
+UPDATE pool_jobs SET status = 'queued', instance_id = NULL, started_at = NULL
+WHERE status = 'running' AND instance_id IN ({placeholders})
+""",
+                instance_ids,
+            )
+        return cur.rowcount
+
+    def finished_pool_jobs(self, pool: str) -> list:
+        """Return the submission, start and finish times of a pool's finished jobs as
+        dicts, in submission order."""
+        cur = self._conn().execute(
+            """
+SELECT uuid, submitted_at, started_at, finished_at FROM pool_jobs
+WHERE pool = ? AND status IN ('done', 'failed') AND started_at IS NOT NULL
+ORDER BY submitted_at
+""",
+            (pool,),
+        )
+        names = [c[0] for c in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def pool_counts(self, pool: str) -> dict:
+        """Return {status: number of jobs} for a pool."""
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) FROM pool_jobs WHERE pool = ? GROUP BY status", (pool,)
+        )
+        return dict(rows.fetchall())
+
+    def save_boot_trace(
+        self,
+        job_uuid: str,
+        trace: str,
+        instance_type: Optional[str] = None,
+        availability_zone: Optional[str] = None,
+    ):
+        """Store the boot trace of a job, replacing any trace it sent before."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """
+INSERT OR REPLACE INTO boot_traces (uuid, instance_type, availability_zone, received_at, trace)
+VALUES (?, ?, ?, ?, ?)
+""",
+                (job_uuid, instance_type, availability_zone, time.time(), trace),
+            )
+
+    def boot_traces(self, since: float = 0.0, limit: Optional[int] = None) -> list:
+        """Return the boot traces received after `since` as dicts, oldest first."""
+        cur = self._conn().execute(
+            """
+SELECT uuid, instance_type, availability_zone, received_at, trace FROM boot_traces
+WHERE received_at >= ? ORDER BY received_at LIMIT ?
+""",
+            (since, -1 if limit is None else limit),
+        )
+        names = [c[0] for c in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def compact(self, retention_seconds: float) -> int:
+        """Delete finished jobs older than the retention period and shrink the database.
+
+        Returns:
+            int: The number of jobs deleted."""
+        cutoff = time.time() - retention_seconds
+        conn = self._conn()
+        placeholders = ",".join("?" for _ in FINISHED_STATUSES)
+        with conn:
+            cur = conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND COALESCE(updated_at, 0) < ?",
+                (*FINISHED_STATUSES, cutoff),
+            )
+            conn.execute(
+                "DELETE FROM job_events WHERE timestamp < ? AND uuid NOT IN (SELECT uuid FROM jobs)",
+                (cutoff,),
+            )
+            conn.execute("DELETE FROM boot_traces WHERE received_at < ?", (cutoff,))
+            conn.execute("DELETE FROM shards WHERE uuid NOT IN (SELECT uuid FROM jobs)")
+            conn.execute(
+                "DELETE FROM pool_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (cutoff,),
+            )
+        deleted = cur.rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if deleted:
+            conn.execute("VACUUM")
+        return deleted
@@ -0,0 +1,222 @@
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from typing import Literal, Optional
+
+import botocore.exceptions
+import requests
+import tyro
+
+
+@dataclasses.dataclass(kw_only=True)
+class ControllerLoadTest:
+    """Drive the termination controller with register -> terminate traffic."""
+
+    mode: Literal["in-process", "http"] = "in-process"
+    """Call the Flask app directly, or send HTTP requests to a running controller."""
+
+    url: str = "http://localhost:7451"
+    """Controller address, used in http mode."""
+
+    jobs: int = 500
+    """Number of jobs to register and terminate."""
+
+    instances_per_fleet: int = 4
+    """How many instances of each fleet call /terminate_fleet when the job finishes,
+    as with maintain fleets."""
+
+    concurrency: int = 32
+    """Number of concurrent clients."""
+
+    job_duration: float = 0.0
+    """Seconds between registering a job and its instances asking for termination."""
+
+    ec2_latency: float = 0.05
+    """Latency of a stub CancelSpotFleetRequests call, in seconds (in-process mode)."""
+
+    ec2_throttle_rate: float = 0.0
+    """Fraction of stub EC2 calls that fail with RequestLimitExceeded (in-process mode)."""
+
+    output: Optional[str] = None
+    """If supplied, write the report as JSON to this path."""
+
+
+class StubEc2:
+    """Stand-in for the EC2 client with injectable latency and throttling."""
+
+    def __init__(self, latency: float = 0.05, throttle_rate: float = 0.0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def cancel_spot_fleet_requests(self, SpotFleetRequestIds, TerminateInstances=True):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if random.random() < self.throttle_rate:
+                raise botocore.exceptions.ClientError(
+                    {"Error": {"Code": "RequestLimitExceeded", "Message": "Request limit exceeded."}},
+                    "CancelSpotFleetRequests",
+                )
+            self.cancelled += len(SpotFleetRequestIds)
+        return {
+            "SuccessfulFleetRequests": [
+                {"SpotFleetRequestId": fleet_id, "CurrentSpotFleetRequestState": "cancelled_terminating"}
+                for fleet_id in SpotFleetRequestIds
+            ],
+            "UnsuccessfulFleetRequests": [],
+        }
+
+
+class LatencyRecorder:
+    """Thread-safe per-route latency samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, route: str, seconds: float, ok: bool):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, wall_time: float) -> dict:
+        def percentile(sorted_samples, q):
+            index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+            return sorted_samples[index]
+
+        report = {}
+        with self._lock:
+            for route, samples in self.samples.items():
+                samples = sorted(samples)
+                report[route] = {
+                    "requests": len(samples),
+                    "errors": self.errors.get(route, 0),
+                    "throughput_rps": len(samples) / wall_time if wall_time else 0.0,
+                    "p50_ms": 1000 * percentile(samples, 0.50),
+                    "p95_ms": 1000 * percentile(samples, 0.95),
+                    "p99_ms": 1000 * percentile(samples, 0.99),
+                    "max_ms": 1000 * samples[-1],
+                }
+        return report
+
+
+def in_process_client(stub: StubEc2):
+    """Import the controller against a throwaway database and route EC2 calls to the stub.
+
+    Returns:
+        A function (path) -> status code that calls the Flask app in-process."""
+    os.environ.setdefault(
+        "TERMINATION_CONTROLLER_DB",
+        os.path.join(tempfile.mkdtemp(), "termination_controller.db"),
+    )
+    import termination_controller
+
+    # The controller logs every request at INFO, which would drown out the report
+    logging.getLogger().setLevel(logging.WARNING)
+    termination_controller._ec2_client = stub
+    client = termination_controller.app.test_client()
+    return lambda path: client.get(path).status_code
+
+
+def http_client(url: str):
+    """Returns a function (path) -> status code that sends GET requests to url."""
+    local = threading.local()
+
+    def get(path: str) -> int:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        return session.get(url + path).status_code
+
+    return get
+
+
+def run_load_test(get, args: ControllerLoadTest) -> dict:
+    """Run register -> terminate for args.jobs jobs and return the latency report."""
+    recorder = LatencyRecorder()
+
+    def timed(route: str, path: str, expected: tuple):
+        start = time.perf_counter()
+        try:
+            ok = get(path) in expected
+        except Exception as e:
+            logging.error(f"{route} request failed: {e}")
+            ok = False
+        recorder.record(route, time.perf_counter() - start, ok)
+
+    def job(_):
+        job_uuid = str(uuid.uuid4())
+        fleet_id = f"sfr-{uuid.uuid4()}"
+        timed("register_job", f"/register_job/{job_uuid}/{fleet_id}", (200,))
+        if args.job_duration:
+            time.sleep(args.job_duration)
+        return job_uuid
+
+    def terminate(job_uuid):
+        timed("terminate_fleet", f"/terminate_fleet/{job_uuid}", (200, 202))
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        terminations = []
+        for job_uuid in executor.map(job, range(args.jobs)):
+            # Every instance of the fleet asks for termination at nearly the same time
+            for _ in range(args.instances_per_fleet):
+                terminations.append(executor.submit(terminate, job_uuid))
+        concurrent.futures.wait(terminations)
+    wall_time = time.perf_counter() - start
+
+    report = recorder.report(wall_time)
+    report["wall_time_s"] = wall_time
+    return report
+
+
+if __name__ == "__main__":
+    args = tyro.cli(ControllerLoadTest)
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    stub = None
+    if args.mode == "in-process":
+        stub = StubEc2(latency=args.ec2_latency, throttle_rate=args.ec2_throttle_rate)
+        get = in_process_client(stub)
+    else:
+        get = http_client(args.url)
+
+    report = run_load_test(get, args)
+    if stub is not None:
+        # Let the termination worker drain before reporting EC2 usage
+        import termination_controller
+
+        while termination_controller.termination_queue.depth():
+            time.sleep(0.05)
+        report["ec2"] = {"cancel_calls": stub.calls, "fleets_cancelled": stub.cancelled}
+
+    print(f"{'route':<18}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in report.items():
+        if not isinstance(stats, dict) or "requests" not in stats:
+            continue
+        print(
+            f"{route:<18}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10.1f}"
+            f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+    print(f"Wall time: {report['wall_time_s']:.2f}s")
+    if "ec2" in report:
+        print(f"EC2 cancel calls: {report['ec2']['cancel_calls']} for {report['ec2']['fleets_cancelled']} fleets")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to: {args.output}")
@@ -0,0 +1,308 @@
+"""Prometheus text-format metrics for the controller and share_ips.
+
+Counters and histograms are dictionaries updated under one lock per metric, so recording
+costs a dictionary lookup and a few additions. Gauges and collected metrics are callbacks
+evaluated only when /metrics is scraped.
+"""
+import bisect
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+import aws_clients
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labelvalues -> [count per bucket (the last one +Inf), sum]
+        self._values = {}
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        for labelvalues, counts, total in values:
+            yield from render_histogram(
+                self.name, self.labelnames, labelvalues, self.buckets, counts, total
+            )
+
+
+def render_histogram(
+    name: str,
+    labelnames: tuple,
+    labelvalues: tuple,
+    buckets: tuple,
+    counts: list,
+    total: float,
+) -> Iterator[str]:
+    """Yield the sample lines of one histogram series from its per-bucket counts."""
+    cumulative = 0
+    for bound, count in zip(list(buckets) + [float("inf")], counts):
+        cumulative += count
+        le = f'le="{_format_value(float(bound))}"'
+        yield f"{name}_bucket{_format_labels(labelnames, labelvalues, le)} {cumulative}"
+    labels = _format_labels(labelnames, labelvalues)
+    yield f"{name}_sum{labels} {_format_value(float(total))}"
+    yield f"{name}_count{labels} {cumulative}"
+
+
+class Callback:
+    """A gauge or counter whose value is read from a callback at scrape time.
+
+    The callback returns a number, or {labelvalues tuple: number} for labelled metrics."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable,
+        labelnames: tuple = (),
+        metric_type: str = "gauge",
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labelvalues, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Registry:
+    """Metrics rendered together on one /metrics endpoint, in registration order."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable,
+        labelnames: tuple = (),
+        metric_type: str = "gauge",
+    ) -> Callback:
+        """Register a metric read from `callback` at scrape time, replacing any previous one."""
+        metric = Callback(name, documentation, callback, labelnames, metric_type)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def collector(self, name: str, render: Callable[[], Iterator[str]]):
+        """Register a function that yields the sample lines of several metrics itself."""
+        collector = _Collector(name, render)
+        with self._lock:
+            self._metrics[name] = collector
+        return collector
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One failing callback must not take the other metrics down with it
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Collector:
+    def __init__(self, name: str, render: Callable[[], Iterator[str]]):
+        self.name = name
+        self.render = render
+
+
+REGISTRY = Registry()
+
+SQLITE_WRITE_SECONDS = REGISTRY.histogram(
+    "vibepilot_sqlite_write_seconds",
+    "Duration of SQLite write transactions, including their commit.",
+    ("database",),
+)
+
+
+class TimedConnection(sqlite3.Connection):
+    """SQLite connection whose `with conn:` transactions are timed.
+
+    Set `database` after connecting to label the connection's transactions."""
+
+    database = "sqlite"
+
+    def __enter__(self):
+        self._transaction_started_at = time.perf_counter()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info):
+        try:
+            return super().__exit__(*exc_info)
+        finally:
+            SQLITE_WRITE_SECONDS.observe(
+                time.perf_counter() - self._transaction_started_at, self.database
+            )
+
+
+def connect(path: str, database: str, **kwargs) -> sqlite3.Connection:
+    """Open a TimedConnection labelled `database`."""
+    conn = sqlite3.connect(path, factory=TimedConnection, **kwargs)
+    conn.database = database
+    return conn
+
+
+def render_aws_calls() -> Iterator[str]:
+    """Yield the per-operation AWS call counters and latencies of aws_clients.call_stats."""
+    stats = aws_clients.call_stats.snapshot()
+    labelnames = ("operation",)
+    for key, documentation in [
+        ("calls", "AWS API calls."),
+        ("errors", "AWS API calls that failed."),
+        ("retries", "Retries of AWS API calls made by botocore."),
+        ("throttles", "AWS API attempts rejected with a throttling error."),
+    ]:
+        name = f"vibepilot_aws_{key}_total"
+        yield f"# HELP {name} {documentation}"
+        yield f"# TYPE {name} counter"
+        for operation, op_stats in stats.items():
+            yield f"{name}{_format_labels(labelnames, (operation,))} {op_stats[key]}"
+    name = "vibepilot_aws_call_duration_seconds"
+    yield f"# HELP {name} Duration of AWS API calls, including retries."
+    yield f"# TYPE {name} histogram"
+    for operation, op_stats in stats.items():
+        yield from render_histogram(
+            name,
+            labelnames,
+            (operation,),
+            aws_clients.LATENCY_BUCKETS,
+            op_stats["buckets"],
+            op_stats["total_s"],
+        )
+
+
+REGISTRY.collector("vibepilot_aws", render_aws_calls)
+
+
+def instrument_app(app, registry: Optional[Registry] = None):
+    """Count and time every request of a Flask app per route, and serve /metrics.
+
+    Requests are labelled by their URL rule rather than their path, so the number of
+    series stays bounded; requests that match no route are labelled "unmatched"."""
+    from flask import Response, g, request
+
+    registry = registry or REGISTRY
+    requests_total = registry.counter(
+        "vibepilot_http_requests_total",
+        "HTTP requests handled, by route, method and status code.",
+        ("route", "method", "status"),
+    )
+    request_seconds = registry.histogram(
+        "vibepilot_http_request_duration_seconds",
+        "Time to handle an HTTP request, up to its response headers, by route and method.",
+        ("route", "method"),
+    )
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started_at = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started_at = g.get("metrics_started_at")
+        if started_at is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            request_seconds.observe(time.perf_counter() - started_at, route, request.method)
+            requests_total.inc(route, request.method, str(response.status_code))
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    return app
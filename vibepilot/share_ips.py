@@ -1,118 +1,265 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
+from markupsafe import escape
 from datetime import datetime
+from urllib.parse import urlencode
 from zoneinfo import ZoneInfo
-from collections import OrderedDict
-import boto3  # add this line
+import json
+import os
 
-app = Flask(__name__)
-registered_entries = []  # store (ip, timestamp) in order
+from ec2_inventory import Ec2Inventory
+from inventory_feed import InventoryFeed
+from ip_registry import IpRegistry
+import metrics
+
+app = metrics.instrument_app(Flask(__name__))
+registry = IpRegistry(os.environ.get(
+    "SHARE_IPS_DB", os.path.join(os.path.dirname(__file__), "share_ips.db")
+))
+REPLAY_PAGE_SIZE = 1000
+REPLAY_MAX_PAGE_SIZE = 10000
+
+# Optional EC2 tag selectors for the dashboard, e.g. SHARE_IPS_TAG_FILTERS="Owner=me,Project=vibepilot"
+TAG_FILTERS = dict(
+    item.split("=", 1)
+    for item in os.environ.get("SHARE_IPS_TAG_FILTERS", "").split(",")
+    if "=" in item
+)
+# Regions listed on the dashboard, e.g. SHARE_IPS_REGIONS="us-east-1,us-west-2"
+REGIONS = [r for r in os.environ.get("SHARE_IPS_REGIONS", "us-east-1").split(",") if r]
+inventory = Ec2Inventory(
+    region_name=REGIONS[0],
+    region_names=REGIONS,
+    ttl=float(os.environ.get("SHARE_IPS_INVENTORY_TTL", "30")),
+    refresh_interval=float(os.environ.get("SHARE_IPS_INVENTORY_REFRESH", "10")),
+    tag_filters=TAG_FILTERS,
+)
+feed = InventoryFeed(inventory)
+
+def inventory_reads():
+    stats = inventory.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+metrics.REGISTRY.callback(
+    "vibepilot_inventory_reads_total",
+    "EC2 inventory snapshot reads, by whether they were served from the cache.",
+    inventory_reads,
+    ("result",),
+    "counter",
+)
+metrics.REGISTRY.callback(
+    "vibepilot_inventory_refreshes_total",
+    "EC2 inventory refreshes.",
+    lambda: inventory.stats()["refreshes"],
+    metric_type="counter",
+)
+metrics.REGISTRY.callback(
+    "vibepilot_inventory_age_seconds",
+    "Age of the EC2 inventory snapshot.",
+    lambda: inventory.stats()["age_s"],
+)
+metrics.REGISTRY.callback(
+    "vibepilot_dashboard_subscribers",
+    "Browsers connected to the live dashboard.",
+    feed.subscriber_count,
+)
+
+# Tag values are set by whoever launches the instances, so they are only ever rendered
+# as escaped template variables
+DASHBOARD_TEMPLATE = """<html><head><style>
+.table-container { display:inline-block; vertical-align:top; margin-right:20px; }
+table { border-collapse: collapse; }
+th, td { border:1px solid black; padding:5px; }
+</style></head><body>
+<h1>Instances and Spot Requests</h1><p><a href="dashboard/live">Live view</a></p>
+<div class="table-container">
+<h2>Instances</h2>
+<table><tr><th>InstanceId</th><th>Tags</th><th>KeyName</th><th>PublicIpAddress</th><th>Region</th></tr>
+{% for inst_id, details in instances.items() %}
+<tr><td>{{ inst_id }}</td><td>{{ details["Tags"] }}</td><td>{{ details["KeyName"] }}</td><td>{{ details["PublicIpAddress"] }}</td><td>{{ details.get("Region", "") }}</td></tr>
+{% endfor %}
+</table></div>
+<div class="table-container">
+<h2>Spot Requests</h2>
+<table><tr><th>RequestId</th><th>Tags</th><th>KeyName</th><th>Region</th></tr>
+{% for req in spot_requests %}
+<tr><td>{{ req.RequestId }}</td><td>{{ req.Tags }}</td><td>{{ req.KeyName }}</td><td>{{ req.Region }}</td></tr>
+{% endfor %}
+</table></div>
+</body></html>"""
+
+LIVE_DASHBOARD_HTML = """<html><head><style>
+.table-container { display:inline-block; vertical-align:top; margin-right:20px; }
+table { border-collapse: collapse; }
+th, td { border:1px solid black; padding:5px; }
+tr.added { background:#dfd; } tr.changed { background:#ffd; }
+</style></head><body>
+<h1>Instances and Spot Requests <small id="status">(connecting)</small></h1>
+<div class="table-container"><h2>Instances</h2><table id="instance">
+<tr><th>InstanceId</th><th>Tags</th><th>KeyName</th><th>PublicIpAddress</th><th>Region</th></tr>
+</table></div>
+<div class="table-container"><h2>Spot Requests</h2><table id="spot_request">
+<tr><th>RequestId</th><th>Tags</th><th>KeyName</th><th>Region</th></tr>
+</table></div>
+<script>
+const COLUMNS = {
+  instance: ["Tags", "KeyName", "PublicIpAddress", "Region"],
+  spot_request: ["Tags", "KeyName", "Region"],
+};
+function rowId(kind, id) { return kind + ":" + id; }
+function render(kind, id, row, op) {
+  let tr = document.getElementById(rowId(kind, id));
+  if (!tr) {
+    tr = document.createElement("tr");
+    tr.id = rowId(kind, id);
+    document.getElementById(kind).appendChild(tr);
+  }
+  tr.replaceChildren(...[id, ...COLUMNS[kind].map(c => row[c] || "")].map(value => {
+    const td = document.createElement("td");
+    td.textContent = value;
+    return td;
+  }));
+  tr.className = op || "";
+}
+const source = new EventSource("events");
+source.addEventListener("snapshot", event => {
+  for (const kind in COLUMNS) {
+    document.querySelectorAll("#" + kind + " tr[id]").forEach(tr => tr.remove());
+  }
+  for (const item of JSON.parse(event.data)) render(item.kind, item.id, item.row);
+  document.getElementById("status").textContent = "(live)";
+});
+source.addEventListener("diff", event => {
+  for (const change of JSON.parse(event.data)) {
+    if (change.op === "removed") {
+      const tr = document.getElementById(rowId(change.kind, change.id));
+      if (tr) tr.remove();
+    } else {
+      render(change.kind, change.id, change.row, change.op);
+    }
+  }
+});
+source.onerror = () => {
+  document.getElementById("status").textContent = "(reconnecting)";
+};
+</script></body></html>"""
 
 @app.route('/register', methods=['GET'])
 def register_ip():
     ip = request.remote_addr
     now = datetime.now(ZoneInfo("Europe/London"))
     timestamp = int(now.timestamp())
-    registered_entries.append((ip, timestamp))
+    registry.register(ip, timestamp)
     return jsonify({"status": "registered", "ip": ip, "timestamp": timestamp}), 200
 
 @app.route('/replay', methods=['GET'])
 def replay_ips():
-    # group entries by calendar day in London time
-    groups = OrderedDict()
-    for ip, ts in registered_entries:
-        date = datetime.fromtimestamp(ts, ZoneInfo("Europe/London")).date().isoformat()
-        if date not in groups:
-            groups[date] = []
-        groups[date].append({"ip": ip, "timestamp": ts})
-
-    # render HTML tables per date
-    html = ['<html><body>']
-    html.append('<h1>IP Addresses Registered</h1>')
-    for date, entries in groups.items():
-        html.append(f'<h2>{date}</h2>')
-        html.append('<table border="1"><tr><th>IP Address</th><th>Timestamp</th></tr>')
-        for item in entries:
-            dt = datetime.fromtimestamp(item["timestamp"], ZoneInfo("Europe/London"))
-            ts_str = dt.strftime("%d/%m/%Y - %H:%M:%S")
-            html.append(f'<tr><td>{item["ip"]}</td><td>{ts_str}</td></tr>')
-        html.append('</table>')
-    html.append('</body></html>')
-
-    return render_template_string(''.join(html)), 200, {'Content-Type': 'text/html'}
+    """Stream registered entries grouped by London day.
+
+    Query parameters: start and end (ISO dates, inclusive), limit (entries per page),
+    cursor (returned by the previous page) and format ("html" or "json"). Every page also
+    carries the number of entries of each day in the range, read from the per-day counts.
+    """
+    start = request.args.get('start')
+    end = request.args.get('end')
+    day_counts = registry.days(start, end)
+    limit = min(max(request.args.get('limit', REPLAY_PAGE_SIZE, type=int), 1), REPLAY_MAX_PAGE_SIZE)
+    after_id = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            start, after_id = cursor.rsplit(':', 1)
+            after_id = int(after_id)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+    rows = registry.entries(start=start, end=end, after_id=after_id, limit=limit)
+
+    def next_cursor(last, count):
+        return f"{last[1]}:{last[0]}" if last is not None and count == limit else None
+
+    if request.args.get('format') == 'json':
+        def generate_json():
+            yield '{"entries": ['
+            last, count = None, 0
+            for row in rows:
+                yield (',' if count else '') + json.dumps(
+                    {"day": row[1], "ip": row[2], "timestamp": row[3]}
+                )
+                last, count = row, count + 1
+            yield '], "next_cursor": ' + json.dumps(next_cursor(last, count))
+            yield ', "days": ' + json.dumps([{"day": d, "count": n} for d, n in day_counts]) + '}'
+        return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+    def generate_html():
+        yield '<html><body><h1>IP Addresses Registered</h1>'
+        total = sum(n for _, n in day_counts)
+        yield f'<p>{total} registrations over {len(day_counts)} days</p>'
+        counts = dict(day_counts)
+        day, last, count = None, None, 0
+        for row in rows:
+            if row[1] != day:
+                if day is not None:
+                    yield '</table>'
+                day = row[1]
+                yield f'<h2>{day} ({counts.get(day, 0)} registrations)</h2><table border="1"><tr><th>IP Address</th><th>Timestamp</th></tr>'
+            yield f'<tr><td>{escape(row[2])}</td><td>{row[4]}</td></tr>'
+            last, count = row, count + 1
+        if day is not None:
+            yield '</table>'
+        cursor = next_cursor(last, count)
+        if cursor:
+            query = urlencode({k: v for k, v in request.args.items() if k != 'cursor'} | {'cursor': cursor})
+            yield f'<p><a href="?{escape(query)}">Next page</a></p>'
+        yield '</body></html>'
+    return Response(stream_with_context(generate_html()), mimetype='text/html')
 
 @app.route('/spot_requests', methods=['GET'])
 def _spot_requests():
     return jsonify(spot_requests()), 200, {'Content-Type': 'application/json'}
 
 def spot_requests():
-    ec2 = boto3.client('ec2', region_name='us-east-1')
-    resp = ec2.describe_spot_instance_requests(
-        Filters=[{"Name": "state", "Values": ["active"]}]
-    )
-    total_result = []
-    for req in resp.get("SpotInstanceRequests", []):
-        result = {}
-        req_id = req["SpotInstanceRequestId"]
-        tags = req.get("Tags", [])
-        tag_str = ",".join(f"{t['Key']}={t['Value']}" for t in tags)
-        print(tag_str)
-        result[req_id] = tag_str
-        result["KeyName"] = req.get("LaunchSpecification", {}).get("KeyName", "")
-        total_result.append(result)
-    return total_result
+    return inventory.spot_requests()
 
 @app.route('/list_instances', methods=['GET'])
 def _list_instances():
     return jsonify(list_instances()), 200, {'Content-Type': 'application/json'}
 
 def list_instances():
-    ec2 = boto3.client('ec2', region_name='us-east-1')
-    resp = ec2.describe_instances()
-    result = {}
-    for reservation in resp.get("Reservations", []):
-        for inst in reservation.get("Instances", []):
-            inst_id = inst["InstanceId"]
-            # skip if instance is not running
-            if inst.get("State", {}).get("Name") != "running":
-                continue
-            # build comma-separated tag string
-            tag_str = ",".join(f"{t['Key']}={t['Value']}" for t in inst.get("Tags", []))
-            result[inst_id] = {
-                "Tags": tag_str,
-                "KeyName": inst.get("KeyName", ""),
-                "PublicIpAddress": inst.get("PublicIpAddress", "")
-            }
-    return result
+    return inventory.instances()
 
 @app.route('/dashboard', methods=['GET'])
 def dashboard():
-    instances = list_instances()
-    spot_reqs = spot_requests()
-    html = ['<html><head><style>',
-            '.table-container { display:inline-block; vertical-align:top; margin-right:20px; }',
-            'table { border-collapse: collapse; }',
-            'th, td { border:1px solid black; padding:5px; }',
-            '</style></head><body>']
-    html.append('<h1>Instances and Spot Requests</h1>')
-    # Instances table
-    html.append('<div class="table-container">')
-    html.append('<h2>Instances</h2>')
-    html.append('<table><tr><th>InstanceId</th><th>Tags</th><th>KeyName</th><th>PublicIpAddress</th></tr>')
-    for inst_id, details in instances.items():
-        html.append(f'<tr><td>{inst_id}</td><td>{details["Tags"]}</td><td>{details["KeyName"]}</td><td>{details["PublicIpAddress"]}</td></tr>')
-    html.append('</table></div>')
-    # Spot Requests table
-    html.append('<div class="table-container">')
-    html.append('<h2>Spot Requests</h2>')
-    html.append('<table><tr><th>RequestId</th><th>Tags</th><th>KeyName</th></tr>')
+    snapshot = inventory.snapshot()
+    instances = snapshot["instances"]
+    spot_reqs = snapshot["spot_requests"]
+    spot_requests = []
     for item in spot_reqs:
-        req_id = next((k for k in item.keys() if k != "KeyName"), "")
-        tag_str = item.get(req_id, "")
-        keyname = item.get("KeyName", "")
-        html.append(f'<tr><td>{req_id}</td><td>{tag_str}</td><td>{keyname}</td></tr>')
-    html.append('</table></div>')
-    html.append('</body></html>')
-    return render_template_string(''.join(html)), 200, {'Content-Type': 'text/html'}
+        req_id = next((k for k in item.keys() if k not in ("KeyName", "Region")), "")
+        spot_requests.append({
+            "RequestId": req_id,
+            "Tags": item.get(req_id, ""),
+            "KeyName": item.get("KeyName", ""),
+            "Region": item.get("Region", ""),
+        })
+    html = render_template_string(
+        DASHBOARD_TEMPLATE, instances=instances, spot_requests=spot_requests
+    )
+    return html, 200, {'Content-Type': 'text/html'}
+
+@app.route('/dashboard/live', methods=['GET'])
+def live_dashboard():
+    """Dashboard page that applies the changes pushed by /dashboard/events."""
+    return LIVE_DASHBOARD_HTML, 200, {'Content-Type': 'text/html'}
+
+@app.route('/dashboard/events', methods=['GET'])
+def dashboard_events():
+    """Server-sent events: a "snapshot" of every row, then a "diff" of the rows added,
+    removed or changed by each inventory refresh."""
+    return Response(
+        feed.stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3671)
+    inventory.start()
+    app.run(host='0.0.0.0', port=3671, threaded=True)
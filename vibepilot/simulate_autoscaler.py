@@ -0,0 +1,250 @@
+import dataclasses
+import json
+import logging
+import statistics
+from typing import Optional
+
+import tyro
+
+from fleet_autoscaler import FleetAutoscaler, ScalingPolicy
+from job_store import JobStore
+
+
+@dataclasses.dataclass(kw_only=True)
+class AutoscalerSimulation:
+    """Replay a recorded pool workload against the autoscaler and a simulated EC2."""
+
+    trace: Optional[str] = None
+    """JSONL workload trace with one {"submitted_at": seconds, "duration": seconds} per job."""
+
+    db: Optional[str] = None
+    """Record the trace from the finished jobs of a pool in this controller database."""
+
+    pool: Optional[str] = None
+    """Pool to record the trace of, with --db."""
+
+    save_trace: Optional[str] = None
+    """If supplied, write the recorded trace as JSONL to this path."""
+
+    initial_capacity: int = 1
+    min_capacity: int = 0
+    max_capacity: int = 10
+    scale_up_cooldown: float = 60.0
+    scale_down_cooldown: float = 300.0
+    scale_down_margin: int = 1
+    scale_down_delay: float = 300.0
+
+    idle_timeout: Optional[float] = 600.0
+    """Seconds an idle instance waits for a job before it leaves the pool."""
+
+    boot_time: float = 120.0
+    """Seconds between raising the target capacity and the new instance taking jobs."""
+
+    interval: float = 30.0
+    """Seconds between autoscaling decisions, as in the controller."""
+
+    step: float = 1.0
+    """Simulation time step in seconds."""
+
+    compare_fixed: bool = True
+    """Also simulate a fixed pool of max_capacity instances without autoscaling."""
+
+    output: Optional[str] = None
+    """If supplied, write the report and capacity timeline as JSON to this path."""
+
+
+class SimulatedEc2:
+    """Stand-in for the EC2 spot fleet calls the controller makes, with boot delays.
+
+    Instances are added until a fleet reaches its target capacity, and with the
+    noTermination policy lowering the target never removes running instances.
+    """
+
+    def __init__(self, boot_time: float = 120.0):
+        self.boot_time = boot_time
+        self.now = 0.0
+        self.fleets = {}
+        self.modify_calls = []
+        self._next_instance = 0
+
+    def create_fleet(self, fleet_id: str, target_capacity: int):
+        self.fleets[fleet_id] = {"target": target_capacity, "instances": {}}
+        self.launch(fleet_id)
+
+    def launch(self, fleet_id: str):
+        fleet = self.fleets[fleet_id]
+        while len(fleet["instances"]) < fleet["target"]:
+            self._next_instance += 1
+            instance_id = f"i-{self._next_instance:08x}"
+            fleet["instances"][instance_id] = {"ready_at": self.now + self.boot_time}
+
+    def modify_spot_fleet_request(self, SpotFleetRequestId, TargetCapacity, **kwargs):
+        self.modify_calls.append((self.now, SpotFleetRequestId, TargetCapacity))
+        self.fleets[SpotFleetRequestId]["target"] = TargetCapacity
+        self.launch(SpotFleetRequestId)
+        return {"Return": True}
+
+    def describe_spot_fleet_instances(self, SpotFleetRequestId, **kwargs):
+        instances = self.fleets[SpotFleetRequestId]["instances"]
+        return {"ActiveInstances": [{"InstanceId": i} for i in instances]}
+
+    def terminate(self, fleet_id: str, instance_id: str):
+        del self.fleets[fleet_id]["instances"][instance_id]
+
+
+def record_trace(job_store: JobStore, pool: str) -> list:
+    """Read the workload of a pool's finished jobs, with times relative to the first."""
+    jobs = job_store.finished_pool_jobs(pool)
+    if not jobs:
+        return []
+    start = jobs[0]["submitted_at"]
+    return [
+        {"submitted_at": j["submitted_at"] - start, "duration": j["finished_at"] - j["started_at"]}
+        for j in jobs
+    ]
+
+
+def simulate(
+    trace: list,
+    policy: Optional[ScalingPolicy],
+    initial_capacity: int,
+    idle_timeout: Optional[float] = 600.0,
+    boot_time: float = 120.0,
+    interval: float = 30.0,
+    step: float = 1.0,
+) -> dict:
+    """Run a pool through a workload trace.
+
+    Idle instances leave the pool as they do through the controller's /leave route, and
+    every `interval` seconds the autoscaler decides the pool's target capacity. Without a
+    policy the pool keeps its initial capacity and instances never leave.
+
+    Returns:
+        dict: Instance-hours, utilisation, queue wait statistics, the number of
+            modify_spot_fleet_request calls and the capacity timeline."""
+    fleet_id = "sfr-simulated"
+    ec2 = SimulatedEc2(boot_time)
+    ec2.create_fleet(fleet_id, initial_capacity)
+    autoscaler = FleetAutoscaler(clock=lambda: ec2.now)
+    jobs = sorted(trace, key=lambda j: j["submitted_at"])
+    queue, waits, timeline = [], [], []
+    workers = {}  # instance ID -> {"busy_until": time or None, "idle_since": time}
+    next_job, next_decision = 0, 0.0
+    instance_seconds = busy_seconds = 0.0
+    end = (jobs[-1]["submitted_at"] if jobs else 0) + boot_time
+
+    def pending_work() -> bool:
+        busy = any(w["busy_until"] for w in workers.values())
+        return next_job < len(jobs) or bool(queue) or busy or ec2.now < end
+
+    while pending_work():
+        now = ec2.now
+        while next_job < len(jobs) and jobs[next_job]["submitted_at"] <= now:
+            queue.append(jobs[next_job])
+            next_job += 1
+
+        instances = ec2.fleets[fleet_id]["instances"]
+        for instance_id, instance in list(instances.items()):
+            instance_seconds += step
+            if instance["ready_at"] > now:
+                continue
+            worker = workers.setdefault(instance_id, {"busy_until": None, "idle_since": now})
+            if worker["busy_until"] is not None and worker["busy_until"] <= now:
+                worker["busy_until"], worker["idle_since"] = None, now
+            if worker["busy_until"] is None and queue:
+                job = queue.pop(0)
+                waits.append(now - job["submitted_at"])
+                worker["busy_until"] = now + job["duration"]
+            if worker["busy_until"] is not None:
+                busy_seconds += step
+            elif (
+                policy is not None
+                and idle_timeout is not None
+                and now - worker["idle_since"] >= idle_timeout
+            ):
+                remaining = len(instances) - 1
+                if remaining < policy.min_capacity:
+                    worker["idle_since"] = now
+                    continue
+                fleet = ec2.fleets[fleet_id]
+                if min(fleet["target"], remaining) != fleet["target"]:
+                    ec2.modify_spot_fleet_request(fleet_id, min(fleet["target"], remaining))
+                ec2.terminate(fleet_id, instance_id)
+                del workers[instance_id]
+
+        if policy is not None and now >= next_decision:
+            next_decision = now + interval
+            running = [w for w in workers.values() if w["busy_until"] is not None]
+            target = autoscaler.decide(
+                fleet_id,
+                ec2.fleets[fleet_id]["target"],
+                len(queue) + len(running),
+                len(running),
+                policy,
+            )
+            if target is not None:
+                ec2.modify_spot_fleet_request(fleet_id, target)
+        timeline.append((now, ec2.fleets[fleet_id]["target"], len(instances), len(queue)))
+        ec2.now += step
+
+    waits.sort()
+    return {
+        "jobs": len(jobs),
+        "duration_s": ec2.now,
+        "instance_hours": instance_seconds / 3600,
+        "utilisation": busy_seconds / instance_seconds if instance_seconds else 0.0,
+        "mean_wait_s": statistics.fmean(waits) if waits else 0.0,
+        "p95_wait_s": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+        "modify_calls": len(ec2.modify_calls),
+        "timeline": timeline,
+    }
+
+
+if __name__ == "__main__":
+    args = tyro.cli(AutoscalerSimulation)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    if args.db:
+        assert args.pool, "--pool is required with --db"
+        trace = record_trace(JobStore(args.db), args.pool)
+    else:
+        assert args.trace, "Either --trace or --db must be provided"
+        with open(args.trace, "r") as f:
+            trace = [json.loads(line) for line in f if line.strip()]
+    logging.info(f"Loaded a trace of {len(trace)} jobs")
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            for job in trace:
+                f.write(json.dumps(job) + "\n")
+
+    policy = ScalingPolicy(
+        min_capacity=args.min_capacity,
+        max_capacity=args.max_capacity,
+        scale_up_cooldown=args.scale_up_cooldown,
+        scale_down_cooldown=args.scale_down_cooldown,
+        scale_down_margin=args.scale_down_margin,
+        scale_down_delay=args.scale_down_delay,
+    )
+    simulation = dict(
+        idle_timeout=args.idle_timeout,
+        boot_time=args.boot_time,
+        interval=args.interval,
+        step=args.step,
+    )
+    reports = {"autoscaled": simulate(trace, policy, args.initial_capacity, **simulation)}
+    if args.compare_fixed:
+        reports["fixed"] = simulate(trace, None, args.max_capacity, **simulation)
+
+    for name, report in reports.items():
+        print(
+            f"{name:>10}: {report['instance_hours']:.2f} instance-hours, "
+            f"{report['utilisation']:.0%} utilisation, mean wait {report['mean_wait_s']:.0f}s, "
+            f"p95 wait {report['p95_wait_s']:.0f}s, {report['modify_calls']} capacity changes"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f)
+        print(f"Report written to: {args.output}")
@@ -1,13 +1,24 @@
+import bisect
+import dataclasses
 import datetime
 import logging
 import os
 import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
 
-import boto3
-from flask import Flask, abort, jsonify
+from flask import Flask, Response, abort, jsonify, request
 
-# initialize Flask app
-app = Flask(__name__)
+import aws_clients
+import metrics
+from fleet_autoscaler import FleetAutoscaler, ScalingPolicy
+from job_store import JOB_PHASES, JobStore
+from termination_queue import TerminationQueue
+
+# initialize Flask app, with per-route request metrics and /metrics
+app = metrics.instrument_app(Flask(__name__))
 
 # Configure logging
 now = datetime.datetime.now()
@@ -25,81 +36,736 @@ logging.basicConfig(
 )
 
 # set up SQLite DB in same folder
-DB_PATH = os.path.join(os.path.dirname(__file__), "termination_controller.db")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-conn.execute(
-    """
-CREATE TABLE IF NOT EXISTS jobs (
-    uuid TEXT PRIMARY KEY,
-    fleet_id TEXT NOT NULL
+DB_PATH = os.environ.get(
+    "TERMINATION_CONTROLLER_DB",
+    os.path.join(os.path.dirname(__file__), "termination_controller.db"),
 )
-"""
+job_store = JobStore(DB_PATH)
+# Finished jobs are kept this long before compaction removes them
+RETENTION_DAYS = float(os.environ.get("TERMINATION_CONTROLLER_RETENTION_DAYS", "30"))
+COMPACTION_INTERVAL_SECONDS = 3600
+
+# Intervals between job phases that /latency reports, as (name, from phase, to phase)
+LATENCY_INTERVALS = [
+    ("submit_to_fulfilled", "submitted", "fulfilled"),
+    ("submit_to_running", "submitted", "running"),
+    ("submit_to_user_data", "submitted", "user_data_started"),
+    ("running_to_user_data", "running", "user_data_started"),
+    ("job_duration", "user_data_started", "job_finished"),
+    ("time_to_interruption", "running", "interrupted"),
+]
+# Upper bounds, in seconds, of the /latency histogram buckets
+LATENCY_BUCKETS = [10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, float("inf")]
+
+# Job status recorded for each termination queue status
+JOB_STATUS_BY_TERMINATION_STATUS = {
+    "pending": "terminating",
+    "terminated": "terminated",
+    "failed": "termination_failed",
+}
+
+
+# Region of jobs registered without one
+DEFAULT_REGION = os.environ.get("TERMINATION_CONTROLLER_DEFAULT_REGION", "us-east-1")
+
+# Replaces the EC2 clients of every region when set, e.g. with a stub in load tests
+_ec2_client = None
+
+
+def ec2_client(region_name: Optional[str] = None):
+    """Return the shared EC2 client of a region."""
+    if _ec2_client is not None:
+        return _ec2_client
+    return aws_clients.ec2_client(region_name or DEFAULT_REGION)
+
+
+def fleet_ec2_client(fleet_id: str):
+    """Return the EC2 client of the region a fleet was launched in."""
+    return ec2_client(job_store.fleet_regions([fleet_id])[fleet_id])
+
+
+def cancel_spot_fleets(fleet_ids: list) -> dict:
+    """Cancel many spot fleets, and their instances, with one EC2 call per region.
+
+    A region whose call fails reports its fleets as unsuccessful, so only they are retried."""
+    by_region = {}
+    for fleet_id, region in job_store.fleet_regions(fleet_ids).items():
+        by_region.setdefault(region or DEFAULT_REGION, []).append(fleet_id)
+    response = {"SuccessfulFleetRequests": [], "UnsuccessfulFleetRequests": []}
+    for region, region_fleet_ids in by_region.items():
+        try:
+            region_response = ec2_client(region).cancel_spot_fleet_requests(
+                SpotFleetRequestIds=region_fleet_ids, TerminateInstances=True
+            )
+        except Exception as e:
+            if len(by_region) == 1:
+                raise
+            logging.error(f"Error cancelling spot fleets in {region}: {e}")
+            code = getattr(e, "response", {}).get("Error", {}).get("Code", "RequestError")
+            region_response = {
+                "UnsuccessfulFleetRequests": [
+                    {"SpotFleetRequestId": f, "Error": {"Code": code, "Message": str(e)}}
+                    for f in region_fleet_ids
+                ]
+            }
+        for key in response:
+            response[key] += region_response.get(key, [])
+    return response
+
+
+def record_termination_status(fleet_id: str, status: str):
+    """Store a fleet's termination status on its jobs."""
+    job_status = JOB_STATUS_BY_TERMINATION_STATUS.get(status)
+    if job_status:
+        job_store.set_fleet_status(fleet_id, job_status)
+
+
+# Instance states in which an instance can still finish the shard it claimed
+LIVE_INSTANCE_STATES = ["pending", "running"]
+_resize_lock = threading.Lock()
+LOST_JOB_CHECK_INTERVAL_SECONDS = 60
+
+# Pools are scaled with this policy, bounded by each pool's own min and max capacity
+AUTOSCALING_POLICY = ScalingPolicy(
+    scale_up_cooldown=float(os.environ.get("AUTOSCALING_SCALE_UP_COOLDOWN", "60")),
+    scale_down_cooldown=float(os.environ.get("AUTOSCALING_SCALE_DOWN_COOLDOWN", "300")),
+    scale_down_delay=float(os.environ.get("AUTOSCALING_SCALE_DOWN_DELAY", "300")),
 )
-conn.commit()
+AUTOSCALING_INTERVAL_SECONDS = 30
+autoscaler = FleetAutoscaler()
+_lost_job_checks = {}
+_lost_job_checks_lock = threading.Lock()
 
 
-def terminate_spot_fleet(fleet_id: str):
-    """Stub: terminate a spot fleet by ID."""
-    logging.info(f"Attempting to terminate spot fleet: {fleet_id}")
-    # TODO: Add proper error handling for boto3 calls
-    ec2 = boto3.client("ec2", region_name="us-east-1")
-    try:
-        response = ec2.cancel_spot_fleet_requests(
-            SpotFleetRequestIds=[fleet_id], TerminateInstances=True
-        )
-        logging.info(
-            f"Successfully cancelled spot fleet request {fleet_id}. Response: {response}"
+def live_instances(instance_ids: list, region_name: Optional[str] = None) -> set:
+    """Return the subset of instance IDs whose instances are pending or running."""
+    live = set()
+    if not instance_ids:
+        return live
+    paginator = ec2_client(region_name).get_paginator("describe_instances")
+    # Filtering by instance ID does not fail on instances EC2 no longer knows about
+    for page in paginator.paginate(
+        Filters=[{"Name": "instance-id", "Values": list(instance_ids)}]
+    ):
+        for reservation in page.get("Reservations", []):
+            for instance in reservation.get("Instances", []):
+                if instance["State"]["Name"] in LIVE_INSTANCE_STATES:
+                    live.add(instance["InstanceId"])
+    return live
+
+
+def release_lost_shards(job_uuid: str) -> int:
+    """Release the shards claimed by instances of a job that are no longer running.
+
+    Covers instances that were preempted without reporting it."""
+    claimed = job_store.claimed_shards(job_uuid)
+    if not claimed:
+        return 0
+    live = live_instances(list(claimed), job_store.job(job_uuid)["region"])
+    lost = [instance_id for instance_id in claimed if instance_id not in live]
+    released = job_store.release_shards(job_uuid, lost)
+    if released:
+        logging.warning(f"Released {released} shards of job {job_uuid} from lost instances {lost}")
+    return released
+
+
+def requeue_lost_pool_jobs(pool: str) -> int:
+    """Requeue the running jobs of a pool whose instances are no longer running.
+
+    Runs at most once per LOST_JOB_CHECK_INTERVAL_SECONDS per pool, since idle instances
+    poll the queue every few seconds."""
+    now = time.time()
+    with _lost_job_checks_lock:
+        if now - _lost_job_checks.get(pool, 0) < LOST_JOB_CHECK_INTERVAL_SECONDS:
+            return 0
+        _lost_job_checks[pool] = now
+    running = job_store.running_pool_jobs(pool)
+    if not running:
+        return 0
+    fleet_id = job_store.pool(pool)["fleet_id"]
+    live = live_instances(
+        list(set(running.values())), job_store.fleet_regions([fleet_id])[fleet_id]
+    )
+    lost = sorted({i for i in running.values() if i not in live})
+    requeued = job_store.requeue_pool_jobs(lost)
+    if requeued:
+        logging.warning(f"Requeued {requeued} jobs of pool {pool} from lost instances {lost}")
+    return requeued
+
+
+def fleet_active_instances(fleet_id: str) -> set:
+    """Return the IDs of a spot fleet's active instances."""
+    instance_ids = set()
+    kwargs = {"SpotFleetRequestId": fleet_id}
+    while True:
+        response = fleet_ec2_client(fleet_id).describe_spot_fleet_instances(**kwargs)
+        instance_ids.update(i["InstanceId"] for i in response.get("ActiveInstances", []))
+        if not response.get("NextToken"):
+            return instance_ids
+        kwargs["NextToken"] = response["NextToken"]
+
+
+def resize_fleet(fleet_id: str, target_capacity: int):
+    """Set the target capacity of an array job's or pool's fleet without terminating
+    running instances, so instances that finished and shut down are not replaced."""
+    with _resize_lock:
+        fleet_ec2_client(fleet_id).modify_spot_fleet_request(
+            SpotFleetRequestId=fleet_id,
+            TargetCapacity=target_capacity,
+            ExcessCapacityTerminationPolicy="noTermination",
         )
-    except Exception as e:
-        logging.error(f"Failed to terminate spot fleet {fleet_id}: {e}")
-        # Re-raise the exception to be caught by the caller route
-        raise e
+    logging.info(f"Set target capacity of fleet {fleet_id} to {target_capacity}")
+
+
+def unfinished_shards(counts: dict) -> int:
+    return counts.get("pending", 0) + counts.get("claimed", 0)
+
+
+def shrink_pool(pool: dict, target_capacity: int) -> list:
+    """Lower a pool's target capacity and terminate its surplus idle instances.
+
+    The fleet is resized without terminating instances, as EC2 would pick the ones to
+    terminate regardless of the jobs they run, so the surplus is taken from the instances
+    without a running job instead. A job handed to one of them in the meantime is
+    requeued as lost.
+
+    Returns:
+        The IDs of the terminated instances."""
+    resize_fleet(pool["fleet_id"], target_capacity)
+    active = fleet_active_instances(pool["fleet_id"])
+    busy = set(job_store.running_pool_jobs(pool["name"]).values())
+    idle = sorted(active - busy)[: max(0, len(active) - target_capacity)]
+    if idle:
+        fleet_ec2_client(pool["fleet_id"]).terminate_instances(InstanceIds=idle)
+        logging.info(f"Terminated idle instances {idle} of pool {pool['name']}")
+    return idle
+
+
+def autoscale_pool(pool: dict) -> Optional[int]:
+    """Scale a pool's fleet to its queued and running jobs.
+
+    Returns:
+        The new target capacity, or None if it was left as it is."""
+    counts = job_store.pool_counts(pool["name"])
+    busy = len(set(job_store.running_pool_jobs(pool["name"]).values()))
+    policy = dataclasses.replace(
+        AUTOSCALING_POLICY,
+        min_capacity=pool["min_capacity"],
+        max_capacity=pool["max_capacity"],
+    )
+    target_capacity = autoscaler.decide(
+        pool["name"],
+        pool["target_capacity"],
+        counts.get("queued", 0) + counts.get("running", 0),
+        busy,
+        policy,
+    )
+    if target_capacity is None:
+        return None
+    if target_capacity < pool["target_capacity"]:
+        shrink_pool(pool, target_capacity)
+    else:
+        resize_fleet(pool["fleet_id"], target_capacity)
+    job_store.set_pool_capacity(pool["name"], target_capacity)
+    logging.info(
+        f"Autoscaled pool {pool['name']} from {pool['target_capacity']} "
+        f"to {target_capacity} instances ({counts})"
+    )
+    return target_capacity
+
+
+def autoscale_pools():
+    """Scale every pool's fleet to its queued and running jobs, once per interval."""
+    while True:
+        for pool in job_store.pools():
+            try:
+                autoscale_pool(pool)
+            except Exception as e:
+                logging.error(f"Error autoscaling pool {pool['name']}: {e}")
+        threading.Event().wait(AUTOSCALING_INTERVAL_SECONDS)
+
+
+termination_queue = TerminationQueue(
+    cancel_spot_fleets, on_update=record_termination_status
+)
+
+
+def pool_job_counts() -> dict:
+    return {
+        (pool["name"], status): count
+        for pool in job_store.pools()
+        for status, count in job_store.pool_counts(pool["name"]).items()
+    }
+
+
+metrics.REGISTRY.callback(
+    "vibepilot_termination_queue_depth",
+    "Fleets waiting to be cancelled or being cancelled.",
+    termination_queue.depth,
+)
+metrics.REGISTRY.callback(
+    "vibepilot_pending_registrations",
+    "Job registration batches waiting to be group-committed.",
+    job_store.pending_registrations,
+)
+metrics.REGISTRY.callback(
+    "vibepilot_pool_jobs",
+    "Jobs of every warm pool, by status.",
+    pool_job_counts,
+    ("pool", "status"),
+)
+
+
+def compact_periodically():
+    """Remove finished jobs past the retention period, once per interval."""
+    while True:
+        try:
+            deleted = job_store.compact(RETENTION_DAYS * 24 * 3600)
+            logging.info(f"Compaction removed {deleted} finished jobs")
+        except Exception as e:
+            logging.error(f"Error compacting job store: {e}")
+        threading.Event().wait(COMPACTION_INTERVAL_SECONDS)
 
 
 @app.route("/register_job/<job_uuid>/<fleet_id>")
 def register_job(job_uuid, fleet_id):
-    """Register a new job UUID and its fleet ID."""
+    """Register a new job UUID and its fleet ID.
+
+    Array jobs pass their number of shards as the `shards` query parameter, and jobs
+    launched outside the default region their region as `region`."""
     logging.info(
         f"Received registration request for job {job_uuid} with fleet {fleet_id}"
     )
+    shards = request.args.get("shards", type=int)
+    region = request.args.get("region") or None
     try:
-        conn.execute(
-            "INSERT OR REPLACE INTO jobs (uuid, fleet_id) VALUES (?, ?)",
-            (job_uuid, fleet_id),
-        )
-        conn.commit()
+        job_store.register(job_uuid, fleet_id, region)
+        if shards:
+            job_store.create_shards(job_uuid, shards)
         logging.info(f"Successfully registered job {job_uuid} with fleet {fleet_id}")
     except Exception as e:
         logging.error(f"Error registering job {job_uuid}: {e}")
         abort(500, str(e))
-    return jsonify({"status": "registered", "uuid": job_uuid, "fleet_id": fleet_id})
+    return jsonify(
+        {"status": "registered", "uuid": job_uuid, "fleet_id": fleet_id, "region": region}
+    )
+
+
+@app.route("/register_jobs", methods=["POST"])
+def register_jobs():
+    """Register many jobs in a single commit.
+
+    Expects a JSON body of the form {"jobs": [{"uuid": ..., "fleet_id": ...}, ...]}. Jobs may
+    also carry a "submitted_at" epoch timestamp, recorded as their submitted phase, and
+    array jobs their number of "shards", and jobs launched outside the default region
+    their "region"."""
+    payload = request.get_json(silent=True) or {}
+    jobs = payload.get("jobs")
+    if not isinstance(jobs, list):
+        abort(400, "Expected a JSON body with a 'jobs' list")
+    try:
+        rows = [(job["uuid"], job["fleet_id"], job.get("region")) for job in jobs]
+        events = [
+            (job["uuid"], "submitted", float(job["submitted_at"]), None, None)
+            for job in jobs
+            if job.get("submitted_at") is not None
+        ]
+        shards = [(job["uuid"], int(job["shards"])) for job in jobs if job.get("shards")]
+    except (KeyError, TypeError, ValueError):
+        abort(400, "Every job must have a 'uuid' and a 'fleet_id'")
+    logging.info(f"Received bulk registration request for {len(rows)} jobs")
+    try:
+        job_store.register_many(rows)
+        job_store.record_events(events)
+        for job_uuid, count in shards:
+            job_store.create_shards(job_uuid, count)
+        logging.info(f"Successfully registered {len(rows)} jobs")
+    except Exception as e:
+        logging.error(f"Error registering {len(rows)} jobs: {e}")
+        abort(500, str(e))
+    return jsonify({"status": "registered", "count": len(rows)})
 
 
 @app.route("/terminate_fleet/<job_uuid>")
 def terminate_fleet(job_uuid):
-    """Lookup fleet_id by job_uuid and terminate the fleet."""
+    """Lookup fleet_id by job_uuid and queue the fleet for termination.
+
+    Returns 202 right away; the termination is carried out by the background worker and
+    can be tracked with /termination_status/<job_uuid>."""
     logging.info(f"Received termination request for job {job_uuid}")
-    cur = conn.execute("SELECT fleet_id FROM jobs WHERE uuid = ?", (job_uuid,))
-    row = cur.fetchone()
-    if not row:
+    fleet_id = job_store.fleet_id(job_uuid)
+    if fleet_id is None:
         logging.warning(f"No job found for UUID {job_uuid} during termination request.")
         abort(404, f"No job found for UUID {job_uuid}")
-    fleet_id = row[0]
     logging.info(f"Found fleet ID {fleet_id} for job {job_uuid}")
-    try:
-        terminate_spot_fleet(fleet_id)
-        logging.info(
-            f"Successfully initiated termination for fleet {fleet_id} (job {job_uuid})"
+    remaining = unfinished_shards(job_store.shard_counts(job_uuid))
+    if remaining:
+        logging.info(f"Not terminating fleet {fleet_id}: {remaining} shards are unfinished")
+        return (
+            jsonify({"status": "waiting_for_shards", "uuid": job_uuid, "unfinished": remaining}),
+            202,
         )
-    except NotImplementedError:
-        logging.error(
-            f"Termination function not implemented for fleet {fleet_id} (job {job_uuid})"
+    termination = termination_queue.submit(job_uuid, fleet_id)
+    logging.info(
+        f"Queued termination for fleet {fleet_id} (job {job_uuid}): {termination['status']}"
+    )
+    return (
+        jsonify({"status": "accepted", "uuid": job_uuid, "termination": termination}),
+        202,
+    )
+
+
+@app.route("/termination_status/<job_uuid>")
+def termination_status(job_uuid):
+    """Report the termination status of a job's fleet."""
+    job = job_store.job(job_uuid)
+    if job is None:
+        abort(404, f"No job found for UUID {job_uuid}")
+    # The queue only knows about terminations requested since the last restart
+    termination = termination_queue.job_status(job_uuid)
+    job["phases"] = job_store.job_phases(job_uuid)
+    job["shards"] = job_store.shard_counts(job_uuid)
+    return jsonify({"uuid": job_uuid, "job": job, "termination": termination})
+
+
+@app.route("/job_event/<job_uuid>/<phase>")
+def job_event(job_uuid, phase):
+    """Record the time a job reached a phase.
+
+    Query parameters: ts (epoch seconds, defaults to now), instance_type,
+    availability_zone and instance_id. Called by the launcher and by the hooks
+    preprocess_user_data injects into the user data. An interrupted instance's shards
+    are handed out again."""
+    if phase not in JOB_PHASES:
+        abort(400, f"Unknown phase {phase}. Expected one of {JOB_PHASES}")
+    try:
+        timestamp = float(request.args.get("ts") or time.time())
+    except ValueError:
+        abort(400, "ts must be a number of seconds since the epoch")
+    job_store.record_events(
+        [
+            (
+                job_uuid,
+                phase,
+                timestamp,
+                request.args.get("instance_type") or None,
+                request.args.get("availability_zone") or None,
+            )
+        ]
+    )
+    if phase == "interrupted":
+        logging.warning(
+            f"Job {job_uuid} received a spot interruption notice at {timestamp} "
+            f"on {request.args.get('instance_type')} in {request.args.get('availability_zone')}"
         )
-        abort(501, "terminate_spot_fleet not implemented")
+        instance_id = request.args.get("instance_id")
+        if instance_id and job_store.release_shards(job_uuid, [instance_id]):
+            logging.info(f"Released the shard of interrupted instance {instance_id}")
+        if instance_id and job_store.requeue_pool_jobs([instance_id]):
+            logging.info(f"Requeued the pool job of interrupted instance {instance_id}")
+    else:
+        logging.info(f"Job {job_uuid} reached phase {phase} at {timestamp}")
+    return jsonify({"status": "recorded", "uuid": job_uuid, "phase": phase})
+
+
+@app.route("/claim_shard/<job_uuid>")
+def claim_shard(job_uuid):
+    """Give the calling instance (query parameter instance_id) a shard of an array job.
+
+    Responds with the shard index as plain text, so user data can read it with wget. If no
+    shard is pending, shards of instances that are no longer running are released first.
+    Responds 409 if every unfinished shard is claimed and 410 if all shards are done."""
+    instance_id = request.args.get("instance_id")
+    if not instance_id:
+        abort(400, "instance_id is required")
+    shard = job_store.claim_shard(job_uuid, instance_id)
+    if shard is None:
+        try:
+            if release_lost_shards(job_uuid):
+                shard = job_store.claim_shard(job_uuid, instance_id)
+        except Exception as e:
+            logging.error(f"Error releasing lost shards of job {job_uuid}: {e}")
+    if shard is None:
+        counts = job_store.shard_counts(job_uuid)
+        if not counts:
+            abort(404, f"Job {job_uuid} has no shards")
+        if not unfinished_shards(counts):
+            abort(410, f"All shards of job {job_uuid} are done")
+        abort(409, f"All unfinished shards of job {job_uuid} are claimed")
+    logging.info(f"Instance {instance_id} claimed shard {shard} of job {job_uuid}")
+    return Response(f"{shard}\n", mimetype="text/plain")
+
+
+@app.route("/finish_shard/<job_uuid>/<int:shard>")
+def finish_shard(job_uuid, shard):
+    """Mark a shard of an array job done.
+
+    The job's fleet is shrunk to its unfinished shards, and queued for termination once
+    every shard is done."""
+    if not job_store.finish_shard(job_uuid, shard):
+        abort(404, f"Job {job_uuid} has no shard {shard}")
+    remaining = unfinished_shards(job_store.shard_counts(job_uuid))
+    logging.info(f"Shard {shard} of job {job_uuid} is done, {remaining} unfinished")
+    fleet_id = job_store.fleet_id(job_uuid)
+    termination = None
+    if fleet_id and remaining:
+        try:
+            resize_fleet(fleet_id, remaining)
+        except Exception as e:
+            logging.error(f"Error resizing fleet {fleet_id}: {e}")
+    elif fleet_id:
+        termination = termination_queue.submit(job_uuid, fleet_id)
+    return jsonify(
+        {
+            "status": "done",
+            "uuid": job_uuid,
+            "shard": shard,
+            "unfinished": remaining,
+            "termination": termination,
+        }
+    )
+
+
+@app.route("/pools")
+def list_pools():
+    """List the warm pools with the number of jobs in each status."""
+    pools = job_store.pools()
+    for pool in pools:
+        pool["jobs"] = job_store.pool_counts(pool["name"])
+    return jsonify({"pools": pools})
+
+
+@app.route("/pools/<name>", methods=["GET", "POST"])
+def pool_info(name):
+    """Register a warm pool (POST) or report its status (GET).
+
+    A pool is a maintain fleet whose instances run the pool's queued jobs one after
+    another. POST expects a JSON body with fleet_id, job_uuid (the UUID in the instances'
+    user data), target_capacity and idle_timeout, optionally the min_capacity and
+    max_capacity the pool is autoscaled between and the fleet's region, and responds 409
+    if the pool exists."""
+    if request.method == "GET":
+        pool = job_store.pool(name)
+        if pool is None:
+            abort(404, f"No pool named {name}")
+        pool["jobs"] = job_store.pool_counts(name)
+        pool["running"] = job_store.running_pool_jobs(name)
+        return jsonify(pool)
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        fleet_id = payload["fleet_id"]
+        job_uuid = payload["job_uuid"]
+        target_capacity = int(payload["target_capacity"])
+    except (KeyError, TypeError, ValueError):
+        abort(400, "Expected fleet_id, job_uuid and target_capacity")
+    idle_timeout = payload.get("idle_timeout")
+    min_capacity = int(payload.get("min_capacity") or 0)
+    max_capacity = payload.get("max_capacity")
+    if not job_store.create_pool(
+        name,
+        fleet_id,
+        job_uuid,
+        target_capacity,
+        idle_timeout,
+        min_capacity,
+        None if max_capacity is None else int(max_capacity),
+    ):
+        abort(409, f"Pool {name} already exists")
+    # Registered as a job too, so the pool's fleet can be terminated like any other
+    job_store.register(job_uuid, fleet_id, payload.get("region"))
+    logging.info(f"Registered pool {name} on fleet {fleet_id} with {target_capacity} instances")
+    return jsonify({"status": "registered", "pool": name, "fleet_id": fleet_id}), 201
+
+
+@app.route("/pools/<name>/jobs", methods=["POST"])
+def submit_pool_job(name):
+    """Queue the request body, a shell script, as a job of a pool.
+
+    The job UUID can be given as the `uuid` query parameter."""
+    if job_store.pool(name) is None:
+        abort(404, f"No pool named {name}")
+    script = request.get_data(as_text=True)
+    if not script.strip():
+        abort(400, "Empty job script")
+    job_uuid = request.args.get("uuid") or str(uuid.uuid4())
+    try:
+        job_store.submit_pool_job(job_uuid, name, script)
+    except sqlite3.IntegrityError:
+        abort(409, f"Job {job_uuid} already exists")
+    position = job_store.pool_counts(name).get("queued", 0)
+    logging.info(f"Queued job {job_uuid} on pool {name} at position {position}")
+    return jsonify({"status": "queued", "uuid": job_uuid, "pool": name, "position": position})
+
+
+@app.route("/pools/<name>/next_job")
+def next_pool_job(name):
+    """Hand the oldest queued job of a pool to the calling instance (query parameter
+    instance_id). Responds with the job UUID as plain text, or 204 if the queue is empty."""
+    instance_id = request.args.get("instance_id")
+    if not instance_id:
+        abort(400, "instance_id is required")
+    job_uuid = job_store.next_pool_job(name, instance_id)
+    if job_uuid is None:
+        try:
+            if requeue_lost_pool_jobs(name):
+                job_uuid = job_store.next_pool_job(name, instance_id)
+        except Exception as e:
+            logging.error(f"Error requeuing lost jobs of pool {name}: {e}")
+    if job_uuid is None:
+        return "", 204
+    logging.info(f"Instance {instance_id} of pool {name} took job {job_uuid}")
+    return Response(f"{job_uuid}\n", mimetype="text/plain")
+
+
+@app.route("/pools/<name>/leave")
+def leave_pool(name):
+    """Let an idle instance (query parameter instance_id) leave a pool.
+
+    The pool's fleet is shrunk to the instances that remain, without terminating them, and
+    the leaving instance is terminated, so it is not replaced. The fleet is only cancelled
+    once the pool's target capacity is zero and no jobs are queued or running, since
+    cancelling terminates all of its instances. Responds 409 if jobs are queued or the pool
+    is at its minimum capacity, in which case the instance should keep working."""
+    instance_id = request.args.get("instance_id")
+    if not instance_id:
+        abort(400, "Missing instance_id")
+    pool = job_store.pool(name)
+    if pool is None:
+        abort(404, f"No pool named {name}")
+    counts = job_store.pool_counts(name)
+    if counts.get("queued", 0):
+        abort(409, f"Pool {name} has queued jobs")
+    try:
+        remaining = len(fleet_active_instances(pool["fleet_id"]) - {instance_id})
     except Exception as e:
-        logging.error(f"Error terminating fleet {fleet_id} (job {job_uuid}): {e}")
-        abort(500, str(e))
-    return jsonify({"status": "terminated", "uuid": job_uuid, "fleet_id": fleet_id})
+        logging.error(f"Error listing instances of pool {name}: {e}")
+        abort(503, str(e))
+    if remaining < pool["min_capacity"]:
+        abort(409, f"Pool {name} is at its minimum capacity")
+    target_capacity = min(pool["target_capacity"], remaining)
+    termination = None
+    if target_capacity or counts.get("running", 0):
+        try:
+            if target_capacity != pool["target_capacity"]:
+                resize_fleet(pool["fleet_id"], target_capacity)
+                job_store.set_pool_capacity(name, target_capacity)
+            fleet_ec2_client(pool["fleet_id"]).terminate_instances(InstanceIds=[instance_id])
+        except Exception as e:
+            logging.error(f"Error removing instance {instance_id} from pool {name}: {e}")
+            abort(503, str(e))
+    else:
+        job_store.delete_pool(name)
+        autoscaler.forget(name)
+        termination = termination_queue.submit(pool["job_uuid"], pool["fleet_id"])
+    logging.info(
+        f"Instance {instance_id} left pool {name}, {remaining} instances remain "
+        f"with a target capacity of {target_capacity}"
+    )
+    return jsonify(
+        {
+            "status": "left",
+            "pool": name,
+            "target_capacity": target_capacity,
+            "termination": termination,
+        }
+    )
+
+
+@app.route("/pool_jobs/<job_uuid>")
+def pool_job_status(job_uuid):
+    job = job_store.pool_job(job_uuid)
+    if job is None:
+        abort(404, f"No pool job {job_uuid}")
+    return jsonify(job)
+
+
+@app.route("/pool_jobs/<job_uuid>/script")
+def pool_job_script(job_uuid):
+    job = job_store.pool_job(job_uuid, with_script=True)
+    if job is None:
+        abort(404, f"No pool job {job_uuid}")
+    return Response(job["script"], mimetype="text/plain")
+
+
+@app.route("/pool_jobs/<job_uuid>/finish")
+def finish_pool_job(job_uuid):
+    """Record the exit code (query parameter exit_code) of a pool job."""
+    exit_code = request.args.get("exit_code", type=int)
+    if not job_store.finish_pool_job(job_uuid, exit_code):
+        abort(409, f"Pool job {job_uuid} is not running")
+    logging.info(f"Pool job {job_uuid} finished with exit code {exit_code}")
+    return jsonify({"status": "done" if exit_code == 0 else "failed", "uuid": job_uuid})
+
+
+@app.route("/boot_trace/<job_uuid>", methods=["POST"])
+def boot_trace(job_uuid):
+    """Store the boot trace of a job.
+
+    The body is the trace file written by the tracing hooks preprocess_user_data injects,
+    one "<timestamp>\t<kind>\t<label>" line per traced command or stage. Query parameters:
+    instance_type and availability_zone."""
+    trace = request.get_data(as_text=True)
+    if not trace.strip():
+        abort(400, "Empty boot trace")
+    job_store.save_boot_trace(
+        job_uuid,
+        trace,
+        request.args.get("instance_type") or None,
+        request.args.get("availability_zone") or None,
+    )
+    logging.info(f"Received boot trace of job {job_uuid} ({trace.count(chr(10))} lines)")
+    return jsonify({"status": "recorded", "uuid": job_uuid})
+
+
+@app.route("/boot_traces")
+def boot_traces():
+    """Serve the boot traces received after `since` (epoch seconds), up to `limit`."""
+    since = request.args.get("since", 0.0, type=float)
+    limit = request.args.get("limit", None, type=int)
+    return jsonify({"traces": job_store.boot_traces(since, limit)})
+
+
+@app.route("/latency")
+def latency():
+    """Serve launch latency histograms per instance type and availability zone.
+
+    Query parameters: since (epoch seconds; only jobs submitted after it are counted) and
+    group_by (comma-separated, any of instance_type and availability_zone)."""
+    since = request.args.get("since", 0.0, type=float)
+    group_by = [
+        key
+        for key in request.args.get("group_by", "instance_type,availability_zone").split(",")
+        if key in ("instance_type", "availability_zone")
+    ]
+    groups = {}
+    for job in job_store.phase_table(since):
+        key = tuple(job[k] for k in group_by)
+        group = groups.setdefault(key, {name: [] for name, _, _ in LATENCY_INTERVALS})
+        for name, start, end in LATENCY_INTERVALS:
+            if job[start] is not None and job[end] is not None:
+                group[name].append(job[end] - job[start])
+
+    result = []
+    for key, intervals in sorted(groups.items(), key=lambda item: str(item[0])):
+        entry = dict(zip(group_by, key))
+        entry["intervals"] = {}
+        for name, durations in intervals.items():
+            if not durations:
+                continue
+            counts = [0] * len(LATENCY_BUCKETS)
+            for duration in durations:
+                counts[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+            entry["intervals"][name] = {
+                "count": len(durations),
+                "mean_s": sum(durations) / len(durations),
+                "buckets": [
+                    {"le": "+Inf" if bound == float("inf") else bound, "count": count}
+                    for bound, count in zip(LATENCY_BUCKETS, counts)
+                ],
+            }
+        result.append(entry)
+    return jsonify({"buckets_s": LATENCY_BUCKETS[:-1], "groups": result})
 
 
 @app.route("/status")
@@ -111,5 +777,10 @@ def status():
 
 if __name__ == "__main__":
     logging.info("Starting termination controller server...")
+    termination_queue.start()
+    threading.Thread(
+        target=compact_periodically, name="job-store-compaction", daemon=True
+    ).start()
+    threading.Thread(target=autoscale_pools, name="pool-autoscaler", daemon=True).start()
     # listen on port 7451 for controller endpoints
     app.run(host="0.0.0.0", port=7451)
@@ -0,0 +1,264 @@
+import collections
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+# Unsuccessful cancellation codes that retrying will not fix
+FAILED_CANCELLATION_CODES = ["fleetRequestIdDoesNotExist", "fleetRequestIdMalformed"]
+# The fleet is already cancelled or being cancelled, which is what we wanted
+ALREADY_CANCELLED_CODES = ["fleetRequestNotInCancellableState"]
+
+
+class TerminationQueue:
+    """Background worker that cancels spot fleets on behalf of the HTTP routes.
+
+    Requests are deduplicated per fleet: a fleet that is already pending, being cancelled or
+    cancelled is not queued again, whichever job asks for it. Pending fleets are collected
+    for `coalesce_window` seconds and cancelled together, up to `batch_size` fleet IDs per
+    `cancel_fn` call. Failed calls are retried with jittered exponential backoff.
+
+    `cancel_fn` receives a list of fleet IDs and must return a response shaped like
+    EC2's CancelSpotFleetRequests response. `on_update`, if given, is called with the
+    fleet ID and new status whenever a fleet's termination status changes.
+
+    Fleets that are terminated or failed are forgotten `retention` seconds later, along
+    with their jobs, so the queue does not grow with the controller's uptime. Their final
+    status is kept by `on_update`'s store.
+    """
+
+    def __init__(
+        self,
+        cancel_fn: Callable[[list], dict],
+        batch_size: int = 100,
+        coalesce_window: float = 0.2,
+        max_attempts: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        on_update: Optional[Callable[[str, str], None]] = None,
+        retention: float = 3600.0,
+    ):
+        self.cancel_fn = cancel_fn
+        self.on_update = on_update
+        self.batch_size = batch_size
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retention = retention
+        self._cond = threading.Condition()
+        self._fleets = {}
+        self._jobs = {}
+        # Fleet ID -> time it finished, oldest first
+        self._finished = collections.OrderedDict()
+        self._thread = None
+        self._stop = False
+
+    def submit(self, job_uuid: str, fleet_id: str) -> dict:
+        """Request termination of a job's fleet and return the fleet's termination status."""
+        with self._cond:
+            now = time.time()
+            self._prune(now)
+            fleet = self._fleets.get(fleet_id)
+            if fleet is None or fleet["status"] == "failed":
+                # Jobs of a failed attempt follow the fleet into its new attempt
+                job_uuids = fleet["job_uuids"] if fleet else set()
+                fleet = {
+                    "fleet_id": fleet_id,
+                    "status": "pending",
+                    "attempts": 0,
+                    "error": None,
+                    "requested_at": now,
+                    "updated_at": now,
+                    "next_attempt_at": now,
+                    "job_uuids": job_uuids,
+                }
+                self._fleets[fleet_id] = fleet
+                self._finished.pop(fleet_id, None)
+                self._cond.notify()
+                created = True
+            else:
+                created = False
+            fleet["job_uuids"].add(job_uuid)
+            self._jobs[job_uuid] = fleet_id
+            status = self._public(fleet)
+        if created:
+            self._notify_update([fleet_id], "pending")
+        self.start()
+        return status
+
+    @staticmethod
+    def _public(fleet: dict) -> dict:
+        return {k: v for k, v in fleet.items() if k not in ("next_attempt_at", "job_uuids")}
+
+    def status(self, fleet_id: str) -> Optional[dict]:
+        with self._cond:
+            fleet = self._fleets.get(fleet_id)
+            return self._public(fleet) if fleet else None
+
+    def job_status(self, job_uuid: str) -> Optional[dict]:
+        with self._cond:
+            fleet_id = self._jobs.get(job_uuid)
+        return self.status(fleet_id) if fleet_id else None
+
+    def size(self) -> int:
+        """Number of fleets the queue remembers, including recently finished ones."""
+        with self._cond:
+            return len(self._fleets)
+
+    def depth(self) -> int:
+        """Number of fleets waiting to be cancelled or being cancelled."""
+        with self._cond:
+            return sum(
+                1 for f in self._fleets.values() if f["status"] in ("pending", "in_progress")
+            )
+
+    def _notify_update(self, fleet_ids: list, status: str):
+        if self.on_update is None:
+            return
+        for fleet_id in fleet_ids:
+            try:
+                self.on_update(fleet_id, status)
+            except Exception as e:
+                logging.error(f"Error recording termination status of fleet {fleet_id}: {e}")
+
+    def _ready(self, now: float) -> list:
+        return [
+            f
+            for f in self._fleets.values()
+            if f["status"] == "pending" and f["next_attempt_at"] <= now
+        ]
+
+    def _finish(self, fleet: dict, status: str, error: Optional[str] = None):
+        fleet["status"] = status
+        fleet["error"] = error
+        fleet["updated_at"] = time.time()
+        if status in ("terminated", "failed"):
+            self._finished[fleet["fleet_id"]] = fleet["updated_at"]
+            self._finished.move_to_end(fleet["fleet_id"])
+
+    def _prune(self, now: float):
+        """Forget the fleets that finished more than `retention` seconds ago."""
+        cutoff = now - self.retention
+        while self._finished:
+            fleet_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff:
+                break
+            del self._finished[fleet_id]
+            fleet = self._fleets.pop(fleet_id)
+            for job_uuid in fleet["job_uuids"]:
+                if self._jobs.get(job_uuid) == fleet_id:
+                    del self._jobs[job_uuid]
+
+    def _retry(self, fleet: dict, error: str):
+        if fleet["attempts"] >= self.max_attempts:
+            logging.error(
+                f"Giving up terminating fleet {fleet['fleet_id']} after "
+                f"{fleet['attempts']} attempts: {error}"
+            )
+            self._finish(fleet, "failed", error)
+            return
+        delay = min(self.max_delay, self.base_delay * 2 ** (fleet["attempts"] - 1))
+        delay = random.uniform(delay / 2, delay)
+        logging.warning(
+            f"Terminating fleet {fleet['fleet_id']} failed ({error}), retrying in {delay:.1f}s"
+        )
+        self._finish(fleet, "pending", error)
+        fleet["next_attempt_at"] = time.time() + delay
+
+    def process_once(self) -> int:
+        """Cancel one batch of ready fleets synchronously and return its size."""
+        with self._cond:
+            batch = self._ready(time.time())[: self.batch_size]
+            for fleet in batch:
+                fleet["status"] = "in_progress"
+                fleet["attempts"] += 1
+        if not batch:
+            return 0
+
+        fleet_ids = [f["fleet_id"] for f in batch]
+        logging.info(f"Cancelling {len(fleet_ids)} spot fleets: {fleet_ids}")
+        try:
+            response = self.cancel_fn(fleet_ids)
+        except Exception as e:
+            with self._cond:
+                for fleet in batch:
+                    self._retry(fleet, str(e))
+                self._cond.notify()
+                failed = [f["fleet_id"] for f in batch if f["status"] == "failed"]
+            self._notify_update(failed, "failed")
+            return len(batch)
+
+        successful = {
+            r["SpotFleetRequestId"] for r in response.get("SuccessfulFleetRequests", [])
+        }
+        unsuccessful = {
+            r["SpotFleetRequestId"]: r.get("Error", {})
+            for r in response.get("UnsuccessfulFleetRequests", [])
+        }
+        with self._cond:
+            for fleet in batch:
+                fleet_id = fleet["fleet_id"]
+                error = unsuccessful.get(fleet_id)
+                if fleet_id in successful:
+                    logging.info(f"Successfully cancelled spot fleet request {fleet_id}")
+                    self._finish(fleet, "terminated")
+                elif error is None:
+                    self._retry(fleet, "missing from CancelSpotFleetRequests response")
+                elif error.get("Code") in ALREADY_CANCELLED_CODES:
+                    logging.info(f"Spot fleet request {fleet_id} was already cancelled")
+                    self._finish(fleet, "terminated", error.get("Message"))
+                elif error.get("Code") in FAILED_CANCELLATION_CODES:
+                    logging.error(f"Failed to terminate spot fleet {fleet_id}: {error}")
+                    self._finish(fleet, "failed", error.get("Message") or error.get("Code"))
+                else:
+                    self._retry(fleet, error.get("Message") or error.get("Code"))
+            self._prune(time.time())
+            self._cond.notify()
+            outcomes = {}
+            for fleet in batch:
+                outcomes.setdefault(fleet["status"], []).append(fleet["fleet_id"])
+        for status, fleet_ids in outcomes.items():
+            self._notify_update(fleet_ids, status)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    now = time.time()
+                    if self._ready(now):
+                        break
+                    waiting = [
+                        f["next_attempt_at"]
+                        for f in self._fleets.values()
+                        if f["status"] == "pending"
+                    ]
+                    self._cond.wait(min(waiting) - now if waiting else None)
+                if self._stop:
+                    return
+            # Give concurrent requests a moment to join the batch
+            time.sleep(self.coalesce_window)
+            try:
+                self.process_once()
+            except Exception as e:
+                logging.error(f"Error in termination worker: {e}")
+
+    def start(self):
+        """Start the worker thread, if it is not running yet."""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = False
+            self._thread = threading.Thread(
+                target=self._run, name="termination-worker", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()